@@ -253,6 +253,34 @@ def alert_weekly_summary(brand: str, rank: int, score: float,
     )
 
 
+NEGATIVE_SENTIMENT_THRESHOLD = 30   # ALT-005 : sentiment sous 30/100
+
+
+def alert_negative_mention(brand: str, mentions: list,
+                           channel_settings: dict = None, enabled_channels=None) -> dict:
+    """
+    Alerte ALT-005 : réponses LLM au sentiment négatif envers la marque.
+    `mentions` : [{'model', 'prompt', 'score'}] avec score sur 0–100, pire d'abord.
+    """
+    lines = [
+        f"• {m['model']} — {m['score']:.0f}/100 — « {(m.get('prompt') or '')[:80]} »"
+        for m in mentions[:5]
+    ]
+    more = f"\n… et {len(mentions) - 5} autre(s)" if len(mentions) > 5 else ''
+    msg = (
+        f"🔻 Mention négative de *{brand}* dans {len(mentions)} réponse(s) LLM\n"
+        + '\n'.join(lines) + more
+    )
+    html = _default_html(msg, title=f"{brand} — Mention négative")
+    return send_alert(
+        msg,
+        subject=f"[GEO] Mention négative — {brand}",
+        html=html,
+        channel_settings=channel_settings,
+        enabled_channels=enabled_channels
+    )
+
+
 # ── Templates HTML ────────────────────────────────────────────────────────────
 
 def _default_html(message: str, title: str = "Alerte GEO Monitor") -> str:
@@ -1,5 +1,5 @@
 """Compatibility shim for legacy imports."""
 
-from services.analyzer import BrandAnalyzer
+from services.analyzer import BrandAnalyzer, get_analyzer
 
-__all__ = ['BrandAnalyzer']
+__all__ = ['BrandAnalyzer', 'get_analyzer']
@@ -12,22 +12,41 @@ from gevent import monkey; monkey.patch_all()
 from gevent import spawn as _gspawn
 
 from flask import Flask, jsonify, request, Response, stream_with_context, session
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 import json
 import os
+import queue
 import random
 import re
 import threading
 import time
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
-from services import BrandAnalyzer, LLMClient
+from services import get_analyzer, get_analysis_cache_stats, get_llm_client
+from services.analysis_record import compact_results, json_default
+from services.async_llm_client import get_async_llm_client
+from services.generation import normalize_generation_settings
+from services.rate_limiter import INTERACTIVE, SCHEDULED
 from catalogs import get_alert_catalog, get_alert_summary, get_report_catalog, get_report_definition
 
 load_dotenv()
 
+
+class _GeoJSONProvider(DefaultJSONProvider):
+    """jsonify sait sérialiser les AnalysisRecord (frontière JSON)."""
+
+    @staticmethod
+    def default(o):
+        try:
+            return json_default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = _GeoJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY') or os.getenv('SECRET_KEY') or 'geo-monitor-dev-secret'
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -55,11 +74,14 @@ CORS(app, resources={r"/*": {"origins": ALLOWED_ORIGINS}}, supports_credentials=
 
 from models import (init_db, save_analysis, get_history, get_previous_prompt_run,
                    generate_demo_history, upsert_project, get_all_projects, get_project_by_id,
+                   update_project_generation_settings,
                    create_user, get_user_by_id, get_user_by_email, get_user_by_google_sub,
                    update_user_login, attach_google_identity, get_alert_preferences,
                    upsert_alert_channel_setting, upsert_alert_rule_setting)
-from alerts import send_alert, alert_rank_lost, alert_weekly_summary, send_slack_alert
-from utils import build_geo_prompt, GEO_SYSTEM_PROMPT, generate_benchmark_prompt
+from alerts import (send_alert, alert_rank_lost, alert_weekly_summary, send_slack_alert,
+                    alert_negative_mention, NEGATIVE_SENTIMENT_THRESHOLD)
+from services.sentiment import alert_scale
+from utils import build_geo_prompt, GEO_SYSTEM_PROMPT, generate_benchmark_prompt, extract_json_block
 init_db()
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -68,6 +90,8 @@ RESULTS_FILE = os.path.join(DATA_DIR, 'results.json')
 RESULTS_SNAPSHOTS_DIR = os.path.join(DATA_DIR, 'results_by_brand')
 START_TIME   = datetime.now()
 scheduler = None
+# Runs planifiés via le client asynchrone (session aiohttp partagée par run)
+SCHEDULER_ASYNC_LLM = os.getenv('SCHEDULER_ASYNC_LLM', '').lower() in ('1', 'true', 'yes')
 
 PROMPT_INTENT_RULES = [
     ('comparaison', 'Comparaison', re.compile(r'(comparatif|compare|vs|alternative|alternatives|meilleur .* ou)', re.I)),
@@ -238,6 +262,20 @@ def _project_from_request(user_id: int):
     return _active_or_latest_project(user_id)
 
 
+def _generation_from_request(data: dict, brand: str, user_id: int = None):
+    """
+    (réglages du run, réglages à enregistrer ou None) : ceux du corps de la
+    requête s'il en fournit, sinon ceux déjà enregistrés pour le projet.
+    Lève ValueError si `generation_settings` est invalide.
+    """
+    if 'generation_settings' in data:
+        settings = normalize_generation_settings(data.get('generation_settings'))
+        return settings, settings
+    stored = next((project for project in get_all_projects(user_id=user_id)
+                   if project.get('brand') == brand and project.get('user_id') == user_id), None)
+    return (stored or {}).get('generation_settings') or {}, None
+
+
 def _mask_secret(value: str):
     value = (value or '').strip()
     if not value:
@@ -727,7 +765,9 @@ def _scheduled_analysis():
         if not brand or not prompts:
             continue
         try:
-            results = _run_real_or_demo(brand, competitors, prompts, limit=6)
+            results = _run_real_or_demo(brand, competitors, prompts, limit=6,
+                                        async_batch=SCHEDULER_ASYNC_LLM, priority=SCHEDULED,
+                                        generation=project.get('generation_settings'))
             _save_and_alert(results, brand, user_id=project.get('user_id'), project_id=project.get('id'))
         except Exception as e:
             print(f"[SCHEDULER] {brand} : {e}")
@@ -753,7 +793,7 @@ def _scheduled_weekly_summary():
             continue
 
         competitors = results.get('competitors', [])
-        az = BrandAnalyzer(brands=[brand] + competitors)
+        az = get_analyzer([brand] + competitors)
         all_analyses = [d['analysis'] for r in results['responses']
                         for d in r['llm_analyses'].values()]
         metrics = az.calculate_metrics(all_analyses)
@@ -781,7 +821,7 @@ def _scheduled_daily_alert():
     
     brand       = results.get('brand', 'Marque')
     competitors = results.get('competitors', [])
-    az          = BrandAnalyzer(brands=[brand] + competitors)
+    az          = get_analyzer([brand] + competitors)
     all_analyses = [d['analysis'] for r in results['responses']
                     for d in r['llm_analyses'].values()]
     metrics = az.calculate_metrics(all_analyses)
@@ -837,7 +877,7 @@ def _scheduled_daily_alert_v2():
             continue
 
         competitors = results.get('competitors', [])
-        az = BrandAnalyzer(brands=[brand] + competitors)
+        az = get_analyzer([brand] + competitors)
         all_analyses = [d['analysis'] for r in results['responses']
                         for d in r['llm_analyses'].values()]
         metrics = az.calculate_metrics(all_analyses)
@@ -923,7 +963,7 @@ def _load_results(brand: str = None, user_id: int = None):
     if brand:
         _ensure_results_snapshots_dir()
         snapshot_file = _project_results_file(brand, user_id=user_id)
-        data = _load_json_file(snapshot_file)
+        data = compact_results(_load_json_file(snapshot_file))
         if data:
             owner = f" user={user_id}" if user_id is not None else ""
             print(f"[LOAD] snapshot {brand}{owner} lu : {data.get('total_prompts')} prompts, is_demo={data.get('is_demo')}")
@@ -932,7 +972,7 @@ def _load_results(brand: str = None, user_id: int = None):
         print(f"[LOAD] snapshot {brand}{owner} introuvable")
         return None
 
-    data = _load_json_file(RESULTS_FILE)
+    data = compact_results(_load_json_file(RESULTS_FILE))
     if data:
         print(f"[LOAD] results.json lu : {data.get('total_prompts')} prompts, is_demo={data.get('is_demo')}, brand={data.get('brand')}")
         return data
@@ -943,13 +983,13 @@ def _load_results(brand: str = None, user_id: int = None):
 def _save_results(data, user_id: int = None):
     _ensure_data_dir()
     with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        json.dump(data, f, ensure_ascii=False, indent=2, default=json_default)
 
     if data.get('brand') and data.get('mode') != 'benchmark':
         _ensure_results_snapshots_dir()
         snapshot_file = _project_results_file(data['brand'], user_id=user_id)
         with open(snapshot_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            json.dump(data, f, ensure_ascii=False, indent=2, default=json_default)
 
     print(f"[SAVE] results.json écrit : {data.get('total_prompts')} prompts, is_demo={data.get('is_demo')}")
 
@@ -957,14 +997,24 @@ def _brand_seed(b):
     return abs(hash(b)) % (2**31)
 
 def _sse(event_type: str, data: dict) -> str:
-    payload = json.dumps({'type': event_type, **data}, ensure_ascii=False)
+    payload = json.dumps({'type': event_type, **data}, ensure_ascii=False, default=json_default)
     return f"data: {payload}\n\n"
 
+def _live_ranking(az, accumulator):
+    """Classement courant d'un stream, calculé depuis l'accumulateur."""
+    metrics = accumulator.metrics()
+    ranking = [
+        {key: item[key] for key in ('brand', 'rank', 'global_score', 'mention_rate',
+                                     'avg_position', 'top_of_mind')}
+        for item in az.generate_ranking(metrics)
+    ]
+    return metrics, ranking
+
 def _build_full_report_data(results, brand):
     """Construit les données complètes pour le rapport PDF."""
     competitors = results.get('competitors', [])
     all_brands  = [brand] + competitors
-    az          = BrandAnalyzer(brands=all_brands)
+    az          = get_analyzer(all_brands)
 
     all_analyses = [d['analysis'] for r in results['responses']
                     for d in r['llm_analyses'].values()]
@@ -1007,7 +1057,9 @@ def _build_full_report_data(results, brand):
     # Confiance LLM
     confidence_data = None
     try:
-        report = az.get_full_confidence_report(results['responses'], main_brand=brand)
+        # Seuls les scores de confiance servent ici : pas de bootstrap
+        report = az.get_full_confidence_report(results['responses'], main_brand=brand,
+                                               n_resamples=0)
         confidence_data = report.get('confidence')
     except Exception:
         pass
@@ -1033,24 +1085,17 @@ def _build_metrics_payload(results):
         competitors = results.get('competitors', [])
         all_brands = [brand] + competitors if competitors else None
 
-    az = BrandAnalyzer(brands=all_brands)
-    all_analyses = [d['analysis'] for r in results['responses']
-                    for d in r['llm_analyses'].values()]
-    metrics = az.calculate_metrics(all_analyses)
+    az = get_analyzer(all_brands)
+    # Un seul cube pour le global et toutes les catégories
+    cube = az.metrics_cube(results['responses'])
+    metrics = cube.metrics()
     ranking = az.generate_ranking(metrics)
     insights = az.generate_insights(metrics, ranking, main_brand=brand)
 
-    cat_data = {}
-    for response in results['responses']:
-        cat = response.get('category', 'general')
-        cat_data.setdefault(cat, [])
-        for data in response['llm_analyses'].values():
-            cat_data[cat].append(data['analysis'])
-
-    category_data = {}
-    for cat, analyses in cat_data.items():
-        cm = az.calculate_metrics(analyses)
-        category_data[cat] = {b: cm[b]['mention_rate'] for b in cm}
+    category_data = {
+        cat: {b: cm[b]['mention_rate'] for b in cm}
+        for cat, cm in cube.metrics_by('category').items()
+    }
 
     diagnostics = _build_risk_diagnostics(results, metrics, ranking)
 
@@ -1066,7 +1111,7 @@ def _build_metrics_payload(results):
             'brand': brand,
             'competitors': competitors,
             'total_prompts': results['total_prompts'],
-            'total_analyses': len(all_analyses),
+            'total_analyses': cube.total,
             'timestamp': results['timestamp'],
             'is_demo': results.get('is_demo', False),
             'models_used': results.get('llms_used', ['qwen3.5']),
@@ -1113,26 +1158,52 @@ def generate_demo_data(brand='Marque', competitors=None, prompts=None):
             'responses': demo_responses, 'is_demo': True}
 
 
-def _run_real_or_demo(brand, competitors, prompts, limit=6, use_parallel=True):
+def _run_real_or_demo(brand, competitors, prompts, limit=6, use_parallel=True,
+                      async_batch=False, priority=INTERACTIVE, generation=None):
+    """
+    `async_batch` : matrice via AsyncLLMClient (une boucle, quelques sockets).
+    `priority` : SCHEDULED laisse la réserve du quota aux runs interactifs.
+    `generation` : budget du projet (num_predict, num_ctx, keep_alive).
+    """
     try:
-        llm_client = LLMClient()
+        llm_client = get_async_llm_client() if async_batch else get_llm_client()
         if not llm_client.clients:
             raise Exception("Pas de modèle disponible")
         all_brands = [brand] + competitors
-        az         = BrandAnalyzer(brands=all_brands)
+        az         = get_analyzer(all_brands)
         responses  = []
         if use_parallel:
-            all_resp = llm_client.query_all_parallel(prompts[:limit], max_workers=3)
+            # Matrice réelle prompts × modèles : une réponse par modèle, avec
+            # latence et cause d'échec par cellule
+            if async_batch:
+                matrix = llm_client.run_matrix(prompts[:limit], priority=priority,
+                                               generation=generation)
+            else:
+                matrix = llm_client.query_matrix(prompts[:limit], priority=priority,
+                                                 generation=generation)
+            if all(cell['error'] for row in matrix.values() for cell in row.values()):
+                raise Exception("Aucune réponse LLM exploitable")
             for prompt in prompts[:limit]:
-                text     = all_resp.get(prompt, '')
-                analyses = {model: {'response': text, 'analysis': az.analyze_response(text)}
-                            for model in llm_client.models}
-                responses.append({'category': 'general', 'prompt': prompt, 'llm_analyses': analyses})
+                # Une cellule en échec n'est pas une réponse sans mention : elle
+                # reste hors des métriques, comme les réponses vides des streams
+                analyses, failures = {}, {}
+                for model, cell in matrix.get(prompt, {}).items():
+                    if cell['error'] or not cell['response']:
+                        failures[model] = {'error': cell['error'] or 'empty',
+                                           'latency_ms': cell['latency_ms']}
+                        continue
+                    analyses[model] = {'response': cell['response'],
+                                       'analysis': az.analyze_response(cell['response']),
+                                       'latency_ms': cell['latency_ms'], 'usage': cell.get('usage')}
+                response = {'category': 'general', 'prompt': prompt, 'llm_analyses': analyses}
+                if failures:
+                    response['llm_failures'] = failures
+                responses.append(response)
         else:
             for prompt in prompts[:limit]:
-                all_model_resp = llm_client.query_all(prompt)
+                all_model_resp = llm_client.query_all(prompt, generation=generation)
                 analyses = {model: {'response': text, 'analysis': az.analyze_response(text)}
-                            for model, text in all_model_resp.items()}
+                            for model, text in all_model_resp.items() if text}
                 responses.append({'category': 'general', 'prompt': prompt, 'llm_analyses': analyses})
         return {'timestamp': datetime.now().isoformat(), 'total_prompts': limit,
                 'llms_used': llm_client.models, 'brand': brand,
@@ -1142,15 +1213,19 @@ def _run_real_or_demo(brand, competitors, prompts, limit=6, use_parallel=True):
         return generate_demo_data(brand, competitors, prompts[:limit])
 
 
-def _save_and_alert(results, brand, user_id: int = None, project_id: int = None):
+def _save_and_alert(results, brand, user_id: int = None, project_id: int = None,
+                    metrics: dict = None):
+    """Persiste le snapshot puis déclenche les alertes. `metrics` évite un recalcul
+    quand l'appelant (stream) les a déjà accumulées."""
     _save_results(results, user_id=user_id)
     save_analysis(results, user_id=user_id, project_id=project_id)
     try:
-        all_analyses = [d['analysis'] for r in results['responses']
-                        for d in r['llm_analyses'].values()]
         all_brands   = [brand] + results.get('competitors', [])
-        az      = BrandAnalyzer(brands=all_brands)
-        metrics = az.calculate_metrics(all_analyses)
+        az      = get_analyzer(all_brands)
+        if metrics is None:
+            all_analyses = [d['analysis'] for r in results['responses']
+                            for d in r['llm_analyses'].values()]
+            metrics = az.calculate_metrics(all_analyses)
         ranking = az.generate_ranking(metrics)
         if ranking and ranking[0]['brand'] != brand:
             leader   = ranking[0]
@@ -1159,6 +1234,43 @@ def _save_and_alert(results, brand, user_id: int = None, project_id: int = None)
             alert_rank_lost(brand, leader['brand'], gap, new_rank or 0)
     except Exception as e:
         print(f"[ALERT] {e}")
+    try:
+        _alert_negative_mentions(results, brand, user_id=user_id, project_id=project_id)
+    except Exception as e:
+        print(f"[ALERT] ALT-005 : {e}")
+
+
+def _negative_mentions(results, brand) -> list:
+    """Réponses dont le sentiment envers `brand` passe sous le seuil ALT-005 (0–100)."""
+    found = []
+    for response in results.get('responses', []):
+        for model, data in response.get('llm_analyses', {}).items():
+            score = (data.get('analysis') or {}).get('sentiments', {}).get(brand)
+            if score is None:
+                continue
+            scaled = alert_scale(score)
+            if scaled < NEGATIVE_SENTIMENT_THRESHOLD:
+                found.append({'model': model, 'prompt': response.get('prompt'), 'score': scaled})
+    found.sort(key=lambda m: m['score'])
+    return found
+
+
+def _alert_negative_mentions(results, brand, user_id: int = None, project_id: int = None):
+    mentions = _negative_mentions(results, brand)
+    if not mentions:
+        return
+    preferences = get_alert_preferences(user_id=user_id, project_id=project_id) if user_id else None
+    channel_settings, enabled_channels = None, None
+    if preferences:
+        if not preferences.get('rules', {}).get('ALT-005', {}).get('enabled', True):
+            return
+        channel_settings = preferences.get('channels', {})
+        enabled_channels = [key for key, item in channel_settings.items() if item.get('enabled')]
+        if not enabled_channels:
+            return
+    print(f"[ALERT] ALT-005 {brand} : {len(mentions)} mention(s) négative(s)")
+    alert_negative_mention(brand, mentions, channel_settings=channel_settings,
+                           enabled_channels=enabled_channels)
 
 
 # ── Routes Sprint 1 / 2 / 3 ───────────────────────────────────────────────────
@@ -1177,12 +1289,17 @@ def health():
         weasyprint_ok = True
     except ImportError:
         pass
+    try:
+        llm_telemetry = get_llm_client().get_telemetry()
+    except Exception as e:
+        llm_telemetry = {'error': str(e)}
     return jsonify({'status': 'ok', 'version': '2.4', 'sprint': 4,
                     'uptime': uptime_str, 'timestamp': datetime.now().isoformat(),
                     'features': {'pdf_export': weasyprint_ok, 'streaming': True,
                                  'alerts': True, 'prompt_compare': True,
                                  'report_catalog': True, 'alert_catalog': True},
                     'scheduler': _scheduler_state(),
+                    'llm_telemetry': llm_telemetry,
                     'security': {
                         'production_mode': IS_PRODUCTION,
                         'session_cookie_secure': bool(app.config.get('SESSION_COOKIE_SECURE')),
@@ -1193,13 +1310,30 @@ def health():
 
 @app.route('/api/status', methods=['GET'])
 def status():
-    llm_status = {}
+    llm_status, llm_cache, llm_coalescing, llm_breakers, llm_rate, llm_hedging = {}, {}, {}, {}, {}, {}
+    llm_telemetry, llm_providers = {}, {}
     try:
-        llm_status = LLMClient().get_active_models()
+        client = get_llm_client()
+        llm_status = client.get_active_models()
+        llm_cache = client.get_cache_stats()
+        llm_coalescing = client.get_coalesce_stats()
+        llm_breakers = client.get_breaker_stats()
+        llm_rate = client.get_rate_limit_stats()
+        llm_hedging = client.get_hedge_stats()
+        llm_telemetry = client.get_telemetry()
+        llm_providers = client.get_provider_stats()
     except Exception as e:
         llm_status = {'error': str(e)}
     return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat(),
                     'llm_status': llm_status,
+                    'llm_cache': llm_cache,
+                    'llm_coalescing': llm_coalescing,
+                    'llm_breakers': llm_breakers,
+                    'llm_rate_limits': llm_rate,
+                    'llm_hedging': llm_hedging,
+                    'llm_telemetry': llm_telemetry,
+                    'llm_providers': llm_providers,
+                    'analysis_cache': get_analysis_cache_stats(),
                     'system_ready': bool(llm_status) and 'error' not in llm_status})
 
 
@@ -1359,6 +1493,21 @@ def activate_project(project_id: int):
         'results': dashboard
     })
 
+@app.route('/api/projects/<int:project_id>/generation-settings', methods=['PUT'])
+def update_generation_settings(project_id: int):
+    """Budget de génération du projet (num_predict, num_ctx, keep_alive, par modèle)."""
+    user, error_response = _require_auth()
+    if error_response:
+        return error_response
+
+    try:
+        settings = normalize_generation_settings(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not update_project_generation_settings(project_id, settings, user_id=user['id']):
+        return jsonify({'error': 'Projet introuvable'}), 404
+    return jsonify({'status': 'success', 'generation_settings': settings})
+
 @app.route('/api/session', methods=['GET'])
 def get_session():
     """Retourne la dernière session (projet + résultats) pour auto-load."""
@@ -1384,7 +1533,6 @@ def get_session():
 @app.route('/api/generate-config', methods=['POST'])
 def generate_config():
     """Génère produits et concurrents via LLM. Pas de fallback - tout par IA."""
-    import re as re_mod, json as json_mod
     data   = request.get_json() or {}
     brand  = data.get('brand', 'Marque')
     sector = data.get('sector', 'Autre')
@@ -1393,11 +1541,11 @@ def generate_config():
         return jsonify({'status': 'error', 'error': 'Marque et secteur requis'}), 400
 
     try:
-        client = LLMClient()
+        client = get_llm_client()
         if not client.api_key or not client.clients:
             raise Exception("Pas de clé API")
 
-        # Appel direct avec think=False pour éviter le timeout
+        # Appel direct (think=False) via la session HTTP partagée
         import requests as req
         prompt_llm = (
             f'Tu prepares un benchmark GEO neutre pour la marque "{brand}" dans le secteur "{sector}".\n'
@@ -1418,20 +1566,7 @@ def generate_config():
             f'JSON uniquement.'
         )
         try:
-            resp = req.post(
-                f"{client.base_url}/chat",
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {client.api_key}'
-                },
-                json={
-                    'model': client.models[0],
-                    'messages': [{'role': 'user', 'content': prompt_llm}],
-                    'think': False,
-                    'stream': False
-                },
-                timeout=25
-            )
+            resp = client.post_chat([{'role': 'user', 'content': prompt_llm}], timeout=25)
         except req.exceptions.Timeout:
             return jsonify({
                 'status': 'error',
@@ -1448,13 +1583,11 @@ def generate_config():
         if not text:
             raise ValueError("Réponse LLM vide")
 
-        # Extraction JSON flexible
-        match = re_mod.search(r'\{[\s\S]*\}', text, re_mod.DOTALL)
-        if not match:
+        # Extraction JSON flexible (bloc ``` ou objet nu, accolades équilibrées)
+        _, config = extract_json_block(text)
+        if config is None:
             raise ValueError("Pas de JSON dans la réponse")
 
-        config = json_mod.loads(match.group())
-
         # Validation minimale
         if 'products' not in config or 'suggested_competitors' not in config:
             raise ValueError("JSON incomplet")
@@ -1500,7 +1633,7 @@ def create_benchmark():
         }), 400
 
     try:
-        client = LLMClient()
+        client = get_llm_client()
         if not client.api_key or not client.clients:
             raise Exception("Pas de clé API")
 
@@ -1508,20 +1641,7 @@ def create_benchmark():
 
         import requests as req
         try:
-            resp = req.post(
-                f"{client.base_url}/chat",
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {client.api_key}'
-                },
-                json={
-                    'model': client.models[0],
-                    'messages': [{'role': 'user', 'content': prompt}],
-                    'think': False,
-                    'stream': False
-                },
-                timeout=25
-            )
+            resp = client.post_chat([{'role': 'user', 'content': prompt}], timeout=25)
         except req.exceptions.Timeout:
             return jsonify({'error': 'Le modèle IA met trop de temps à répondre. Veuillez réessayer.'}), 504
         except req.exceptions.ConnectionError:
@@ -1533,13 +1653,10 @@ def create_benchmark():
         if not text:
             raise ValueError("Réponse LLM vide")
 
-        import re as re_mod, json as json_mod
-        match = re_mod.search(r'\{[\s\S]*\}', text, re_mod.DOTALL)
-        if not match:
+        _, config = extract_json_block(text)
+        if config is None:
             raise ValueError("Pas de JSON dans la réponse")
 
-        config = json_mod.loads(match.group())
-
         # Validation
         if 'products' not in config or 'seo_prompts' not in config:
             raise ValueError("JSON incomplet")
@@ -1575,6 +1692,8 @@ def run_benchmark_stream():
     prompts = data.get('prompts', [])
     limit = data.get('limit', min(len(prompts), 6) if prompts else 6)
     use_demo = data.get('demo', False)
+    user = _current_user()
+    user_id = user['id'] if user else None
 
     if len(brands) < 2:
         return jsonify({'error': 'Minimum 2 marques requises'}), 400
@@ -1586,7 +1705,7 @@ def run_benchmark_stream():
     print(f"[BENCHMARK] {benchmark_name}: {brands}, prompts={len(prompts)}, limit={limit}")
 
     all_brands = brands  # TOUTES les marques = le benchmark
-    az = BrandAnalyzer(brands=all_brands)
+    az = get_analyzer(all_brands)
     geo_system = build_geo_prompt(all_brands)
 
     def generate_events():
@@ -1596,10 +1715,11 @@ def run_benchmark_stream():
         llm_failures = 0
         MAX_FAILURES = 3
         MAX_TIME_PER_PROMPT = 50
+        accumulator = az.accumulator()
 
         if not use_demo and prompts:
             try:
-                llm_client = LLMClient()
+                llm_client = get_llm_client()
                 active_models = llm_client.models if llm_client.clients else ['demo']
                 if not llm_client.clients:
                     llm_client = None
@@ -1689,7 +1809,7 @@ def run_benchmark_stream():
                                 analysis = az.analyze_response(text)
                                 analyses[model] = {'response': text, 'analysis': analysis}
                                 brands_in = analysis.get('brands_mentioned', [])
-                                print(f"[BENCHMARK]   → {model}: OK {len(text)} chars, brands={brands_in}")
+                                print(f"[BENCHMARK]   → {model}: OK {len(text)} chars, source={analysis.get('source')}, brands={brands_in}")
                             else:
                                 print(f"[BENCHMARK]   → {model}: X réponse vide")
 
@@ -1713,6 +1833,7 @@ def run_benchmark_stream():
                 'prompt': prompt,
                 'llm_analyses': analyses
             })
+            accumulator.add_many(data['analysis'] for data in analyses.values())
 
             yield _sse('progress', {
                 'current': i + 1,
@@ -1724,6 +1845,9 @@ def run_benchmark_stream():
                 'is_demo': is_demo
             })
 
+            _, live_ranking = _live_ranking(az, accumulator)
+            yield _sse('ranking', {'current': i + 1, 'total': limit, 'ranking': live_ranking})
+
             if llm_failures >= MAX_FAILURES:
                 print(f"[BENCHMARK] {MAX_FAILURES} échecs → mode démo forcé")
                 is_demo = True
@@ -1744,10 +1868,12 @@ def run_benchmark_stream():
         _save_results(results, user_id=user_id)
         save_analysis(results)
 
+        _, final_ranking = _live_ranking(az, accumulator)
         yield _sse('complete', {
             'timestamp': results['timestamp'],
             'total_prompts': limit,
             'is_demo': is_demo,
+            'ranking': final_ranking,
             'results': results
         })
 
@@ -1773,11 +1899,16 @@ def run_analysis():
     use_demo     = data.get('demo', False)
     user         = _current_user()
     user_id      = user['id'] if user else None
+    try:
+        generation, new_settings = _generation_from_request(data, brand, user_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     if use_demo or not prompts:
         results = generate_demo_data(brand, competitors, prompts)
         project_id = upsert_project(brand, data.get('sector', ''), competitors, prompts,
-                                    results.get('llms_used', ['qwen3.5']), user_id=user_id)
+                                    results.get('llms_used', ['qwen3.5']), user_id=user_id,
+                                    generation_settings=new_settings)
         if user_id is not None:
             session['active_project_id'] = project_id
         _save_results(results, user_id=user_id)
@@ -1786,11 +1917,13 @@ def run_analysis():
                         'timestamp': results['timestamp'],
                         'duration': round(time.time() - start, 2)})
 
-    results = _run_real_or_demo(brand, competitors, prompts, limit, use_parallel)
+    results = _run_real_or_demo(brand, competitors, prompts, limit, use_parallel,
+                                generation=generation)
     project_id = None
     try:
         project_id = upsert_project(brand, data.get('sector', ''), competitors, prompts,
-                                    results.get('llms_used', ['qwen3.5']), user_id=user_id)
+                                    results.get('llms_used', ['qwen3.5']), user_id=user_id,
+                                    generation_settings=new_settings)
         if user_id is not None and project_id is not None:
             session['active_project_id'] = project_id
     except Exception as e:
@@ -1812,12 +1945,16 @@ def run_analysis_stream():
     sector       = data.get('sector', '')
     user         = _current_user()
     user_id      = user['id'] if user else None
+    try:
+        generation, new_settings = _generation_from_request(data, brand, user_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # DEBUG : log des données reçues
     print(f"[STREAM] Reçu : brand={brand}, prompts={len(prompts)}, demo={use_demo}")
     
     all_brands   = [brand] + competitors
-    az           = BrandAnalyzer(brands=all_brands)
+    az           = get_analyzer(all_brands)
 
     # Construire le system prompt GEO avec le benchmark de marques
     geo_system = build_geo_prompt(all_brands)
@@ -1829,10 +1966,11 @@ def run_analysis_stream():
         llm_failures  = 0  # Compteur d'échecs LLM
         MAX_FAILURES  = 3  # Après 3 échecs → mode démo forcé (était 2)
         MAX_TIME_PER_PROMPT = 50  # secondes
+        accumulator   = az.accumulator()
 
         if not use_demo and prompts:
             try:
-                llm_client    = LLMClient()
+                llm_client    = get_llm_client()
                 active_models = llm_client.models if llm_client.clients else ['demo']
                 if not llm_client.clients:
                     llm_client = None
@@ -1916,19 +2054,39 @@ def run_analysis_stream():
                 else:
                     try:
                         print(f"[STREAM] Prompt {i+1}/{limit} — Appel LLM en cours...")
-                        # LLM call en greenlet + keepalive SSE pour éviter proxy timeout
+                        # LLM call en greenlet + keepalive SSE pour éviter proxy timeout.
+                        # En streaming, les premières citations de marques arrivent
+                        # par la file pendant la génération (événements 'mention')
                         _llm_result = {}
                         _llm_error = [None]
+                        _llm_events = queue.Queue()
                         def _do_llm():
                             try:
-                                _llm_result['resp'] = llm_client.query_all_models_for_prompt(prompt, system_prompt=geo_system)
+                                if llm_client.streaming:
+                                    _llm_result['resp'] = llm_client.query_all_models_for_prompt_stream(
+                                        prompt, system_prompt=geo_system,
+                                        make_extractor=az.stream_extractor,
+                                        on_mention=lambda model, b: _llm_events.put((model, b)),
+                                        generation=generation)
+                                else:
+                                    _llm_result['resp'] = llm_client.query_all_models_for_prompt(
+                                        prompt, system_prompt=geo_system, generation=generation)
                             except BaseException as e:
                                 _llm_error[0] = e
+                            finally:
+                                _llm_events.put(None)
                         _llm_gl = _gspawn(_do_llm)
-                        while not _llm_gl.ready():
-                            time.sleep(8)
-                            if not _llm_gl.ready():
+                        while True:
+                            try:
+                                _event = _llm_events.get(timeout=8)
+                            except queue.Empty:
                                 yield ': keepalive\n\n'
+                                continue
+                            if _event is None:
+                                break
+                            yield _sse('mention', {'current': i+1, 'model': _event[0], 'brand': _event[1],
+                                                   'is_main': _event[1] == brand,
+                                                   'elapsed_ms': round((time.time() - prompt_start) * 1000)})
                         if _llm_error[0] is not None:
                             raise _llm_error[0]
                         all_model_resp = _llm_result.get('resp', {})
@@ -1939,7 +2097,7 @@ def run_analysis_stream():
                                 analysis = az.analyze_response(text)
                                 analyses[model] = {'response': text, 'analysis': analysis}
                                 brands_in = analysis.get('brands_mentioned', [])
-                                print(f"[STREAM]   → {model}: ✓ {len(text)} chars, brands={brands_in}")
+                                print(f"[STREAM]   → {model}: ✓ {len(text)} chars, source={analysis.get('source')}, brands={brands_in}")
                                 print(f"[STREAM]   → TEXT sample: {text[:300]}")
                             else:
                                 print(f"[STREAM]   → {model}: ✗ réponse vide")
@@ -1986,6 +2144,7 @@ def run_analysis_stream():
                 (analyses[m]['analysis'].get('brand_position')
                  for m in analyses if analyses[m]['analysis'].get('brand_position')), None)
             responses.append({'category': 'general', 'prompt': prompt, 'llm_analyses': analyses})
+            accumulator.add_many(data['analysis'] for data in analyses.values())
 
             yield _sse('progress', {
                 'current': i+1, 'total': limit, 'prompt': prompt,
@@ -1993,6 +2152,8 @@ def run_analysis_stream():
                 'brand_position': brand_pos,
                 'duration_ms': round((time.time() - prompt_start) * 1000)
             })
+            _, live_ranking = _live_ranking(az, accumulator)
+            yield _sse('ranking', {'current': i+1, 'total': limit, 'ranking': live_ranking})
             
             print(f"[STREAM] Prompt {i+1}/{limit} terminé — duration: {time.time() - prompt_start:.1f}s")
 
@@ -2002,12 +2163,14 @@ def run_analysis_stream():
         project_id = None
         print(f"[STREAM] ✓ Sauvegarde terminée — {limit} prompts, is_demo={is_demo}")
         try:
-            project_id = upsert_project(brand, sector, competitors, prompts, active_models, user_id=user_id)
+            project_id = upsert_project(brand, sector, competitors, prompts, active_models,
+                                        user_id=user_id, generation_settings=new_settings)
             if user_id is not None and project_id is not None:
                 session['active_project_id'] = project_id
         except Exception:
             pass
-        _save_and_alert(results, brand, user_id=user_id, project_id=project_id)
+        _save_and_alert(results, brand, user_id=user_id, project_id=project_id,
+                        metrics=accumulator.metrics())
 
         yield _sse('complete', {'timestamp': results['timestamp'],
                                 'is_demo': is_demo, 'duration': round(time.time() - start, 2)})
@@ -2079,7 +2242,7 @@ def get_metrics_by_model():
     else:
         competitors = results.get('competitors', [])
         all_brands = [brand] + competitors if competitors else None
-    az          = BrandAnalyzer(brands=all_brands)
+    az          = get_analyzer(all_brands)
     report = az.get_full_confidence_report(results['responses'], main_brand=brand)
     rankings_by_model = {model: az.generate_ranking(metrics)
                          for model, metrics in report['by_model'].items()}
@@ -2094,7 +2257,9 @@ def get_metrics_by_model():
     return jsonify({'by_model': report['by_model'], 'rankings_by_model': rankings_by_model,
                     'confidence': report['confidence'],
                     'main_brand_confidence': main_brand_confidence,
+                    'intervals': report['intervals'],
                     'models': list(report['by_model'].keys()), 'brand': brand,
+                    'parse_stats': az.calculate_parse_stats(results['responses']),
                     'summary': {
                         'strongest_model': strongest_model,
                         'weakest_model': weakest_model,
@@ -2140,7 +2305,7 @@ def export_json():
         return jsonify({'error': 'Aucune donnée'}), 404
     brand      = results.get('brand', 'Marque')
     all_brands = [brand] + results.get('competitors', [])
-    az         = BrandAnalyzer(brands=all_brands)
+    az         = get_analyzer(all_brands)
     all_analyses = [d['analysis'] for r in results['responses']
                     for d in r['llm_analyses'].values()]
     metrics  = az.calculate_metrics(all_analyses)
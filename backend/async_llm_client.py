@@ -1,5 +1,5 @@
 """Compatibility shim for legacy imports."""
 
-from services.async_llm_client import AsyncLLMClient
+from services.async_llm_client import AsyncLLMClient, get_async_llm_client
 
-__all__ = ['AsyncLLMClient']
+__all__ = ['AsyncLLMClient', 'get_async_llm_client']
@@ -0,0 +1,306 @@
+"""
+Faux serveur Ollama — GEO Monitor
+Sert POST /api/chat comme Ollama Cloud (réponse complète ou NDJSON en
+streaming) avec des réponses déterministes : texte narratif citant les
+marques du benchmark puis bloc JSON `mentions`/`classement`, config
+produits/concurrents pour /api/generate-config ou produits/prompts SEO
+pour /api/benchmark. Permet de mesurer tout le
+pipeline (HTTP, analyse, persistance) hors ligne :
+
+    python fake_ollama.py --port 11434
+    OLLAMA_BASE_URL=http://localhost:11434/api OLLAMA_API_KEY=fake python app.py
+
+Réglages (variables d'environnement) :
+  FAKE_OLLAMA_LATENCY      distribution de latence avant la réponse :
+                           fixed:<ms>, uniform:<min_ms>,<max_ms>,
+                           lognormal:<médiane_ms>,<sigma> ; par modèle avec
+                           "qwen3.5=lognormal:800,0.5;fixed:200"
+  FAKE_OLLAMA_CHARS_PER_SEC débit du streaming (0 = sans pause)
+  FAKE_OLLAMA_ERROR_RATE   part des requêtes en erreur HTTP
+  FAKE_OLLAMA_ERROR_CODES  codes tirés pour ces erreurs (défaut 503,429,500)
+  FAKE_OLLAMA_TIMEOUT_RATE part des requêtes qui pendent FAKE_OLLAMA_HANG s
+  FAKE_OLLAMA_SEED         graine des tirages (latences, erreurs)
+
+Le contenu dépend uniquement du modèle et des messages : deux runs
+identiques voient les mêmes réponses, seuls latences et erreurs sont tirées.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from flask import Flask, Response, jsonify, request
+
+FAKE_LATENCY = os.getenv('FAKE_OLLAMA_LATENCY', 'fixed:0')
+FAKE_CHARS_PER_SEC = float(os.getenv('FAKE_OLLAMA_CHARS_PER_SEC', '0'))
+FAKE_ERROR_RATE = float(os.getenv('FAKE_OLLAMA_ERROR_RATE', '0'))
+FAKE_ERROR_CODES = os.getenv('FAKE_OLLAMA_ERROR_CODES', '503,429,500')
+FAKE_TIMEOUT_RATE = float(os.getenv('FAKE_OLLAMA_TIMEOUT_RATE', '0'))
+FAKE_HANG = float(os.getenv('FAKE_OLLAMA_HANG', '120'))
+FAKE_SEED = int(os.getenv('FAKE_OLLAMA_SEED', '42'))
+
+# Marques citées quand le system prompt n'en fournit aucune
+FALLBACK_BRANDS = ['Alpha', 'Bravo', 'Charlie', 'Delta']
+SENTIMENTS = ['positif', 'positif', 'neutre', 'negatif']
+
+_BENCHMARK_RE = re.compile(r'contient ces marques:\s*\n(.+)')
+_CONFIG_BRAND_RE = re.compile(r'pour la marque "([^"]+)"(?: dans le secteur "([^"]+)")?')
+_BENCHMARK_BRANDS_RE = re.compile(r'Marques à comparer:\s*(.+)')
+
+Sampler = Callable[[random.Random], float]
+
+
+# ── Distributions de latence ─────────────────────────────────────────────────
+
+def parse_latency(spec: str) -> Sampler:
+    """
+    Distribution `fixed:<ms>`, `uniform:<min>,<max>` ou
+    `lognormal:<médiane>,<sigma>` → fonction rng → secondes.
+    """
+    kind, _, args = spec.strip().partition(':')
+    try:
+        values = [float(v) for v in args.split(',') if v.strip()]
+        if kind == 'fixed' and len(values) == 1:
+            ms = values[0]
+            return lambda rng: ms / 1000
+        if kind == 'uniform' and len(values) == 2:
+            low, high = values
+            return lambda rng: rng.uniform(low, high) / 1000
+        if kind == 'lognormal' and len(values) == 2:
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(math.log(max(median, 1e-3)), sigma) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"Distribution de latence invalide : {spec!r}")
+
+
+def parse_latency_map(spec: str) -> Dict[str, Sampler]:
+    """"m1=lognormal:800,0.5;fixed:200" → {'m1': …, '*': …} ('*' = défaut)."""
+    samplers = {'*': parse_latency('fixed:0')}
+    for part in spec.split(';'):
+        if not part.strip():
+            continue
+        model, sep, dist = part.partition('=')
+        if sep:
+            samplers[model.strip()] = parse_latency(dist)
+        else:
+            samplers['*'] = parse_latency(part)
+    return samplers
+
+
+# ── Contenu déterministe ─────────────────────────────────────────────────────
+
+def _content_rng(model: str, messages: List[Dict]) -> random.Random:
+    digest = hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode('utf-8')).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def benchmark_brands(messages: List[Dict]) -> List[str]:
+    """Marques du GEO system prompt ("A", "B", …), FALLBACK_BRANDS sinon."""
+    for message in messages:
+        if message.get('role') != 'system':
+            continue
+        match = _BENCHMARK_RE.search(message.get('content', ''))
+        if match:
+            brands = re.findall(r'"([^"]+)"', match.group(1))
+            if brands:
+                return brands
+    return list(FALLBACK_BRANDS)
+
+
+def geo_answer(model: str, messages: List[Dict]) -> str:
+    """Réponse narrative puis bloc JSON au format du GEO system prompt."""
+    rng = _content_rng(model, messages)
+    brands = benchmark_brands(messages)
+    cited = rng.sample(brands, rng.randint(1, min(4, len(brands))))
+    sentiments = {brand: rng.choice(SENTIMENTS) for brand in cited}
+
+    lines = [f"Pour cette question, {cited[0]} ressort en tete grace a sa reputation et a la qualite percue."]
+    for brand in cited[1:]:
+        lines.append(f"{brand} reste une alternative credible, avec un positionnement {sentiments[brand]}.")
+    lines.append("Le choix depend surtout du budget, du service attendu et de la specialisation recherchee.")
+    payload = {
+        'mentions': cited,
+        'classement': {brand: rank for rank, brand in enumerate(cited, 1)},
+        'premier': cited[0],
+        'sentiments': sentiments,
+        'resume': f"{cited[0]} est le plus souvent recommande ({model}).",
+    }
+    return ' '.join(lines) + '\n\n```json\n' + json.dumps(payload, ensure_ascii=False, indent=2) + '\n```'
+
+
+def config_answer(model: str, messages: List[Dict]) -> str:
+    """JSON produits / concurrents attendu par /api/generate-config."""
+    rng = _content_rng(model, messages)
+    prompt = messages[-1].get('content', '') if messages else ''
+    match = _CONFIG_BRAND_RE.search(prompt)
+    brand = match.group(1) if match else 'Marque'
+    sector = (match.group(2) if match else None) or 'ce marche'
+    competitors = [f"{name} {sector.split()[0].capitalize()}" for name in
+                   rng.sample(['Nova', 'Orion', 'Vega', 'Atlas', 'Zenith', 'Lyra'], rng.randint(3, 5))]
+    products = []
+    for idx in range(1, rng.randint(3, 4) + 1):
+        rivals = ', '.join([brand] + competitors[:2])
+        products.append({
+            'id': f'p{idx}',
+            'name': f'Offre {idx} {sector}',
+            'description': f'Cas d usage {idx} du secteur {sector}',
+            'prompts': [f'Quelles marques recommander pour l offre {idx} ({rivals}) ?',
+                        f'Comparatif des acteurs de l offre {idx} : quel est le meilleur choix ?'],
+        })
+    return json.dumps({'products': products, 'suggested_competitors': competitors}, ensure_ascii=False)
+
+
+def benchmark_answer(model: str, messages: List[Dict]) -> str:
+    """JSON secteur / produits / prompts SEO attendu par /api/benchmark."""
+    rng = _content_rng(model, messages)
+    prompt = messages[-1].get('content', '') if messages else ''
+    match = _BENCHMARK_BRANDS_RE.search(prompt)
+    brands = ([b.strip() for b in match.group(1).split(',') if b.strip()] if match
+              else list(FALLBACK_BRANDS))
+    versus = ' vs '.join(brands)
+    products = []
+    for idx in range(1, rng.randint(3, 5) + 1):
+        name = f'Produit {idx}'
+        products.append({
+            'id': f'p{idx}',
+            'name': name,
+            'description': f'Offre {idx} commune aux marques comparees',
+            'prompts': [f'Comparatif {name} : {versus}',
+                        f'Meilleur {name} : {brands[0]} ou {brands[-1]} ?'],
+        })
+    seo_prompts = [f'Comparatif {product["name"]} : {versus}' for product in products]
+    seo_prompts.append(f'Quelle marque choisir entre {", ".join(brands)} ?')
+    return json.dumps({'sector': 'Secteur de test', 'products': products, 'brands': brands,
+                       'seo_prompts': seo_prompts[:6]}, ensure_ascii=False, indent=2)
+
+
+def answer_for(model: str, messages: List[Dict]) -> str:
+    prompt = messages[-1].get('content', '') if messages else ''
+    if '"seo_prompts"' in prompt:
+        return benchmark_answer(model, messages)
+    if '"suggested_competitors"' in prompt:
+        return config_answer(model, messages)
+    return geo_answer(model, messages)
+
+
+def _chunks(text: str, size: int = 24) -> List[str]:
+    """Découpe en morceaux de ~`size` caractères sur des fins de mots."""
+    pieces, current = [], ''
+    for word in re.split(r'(\s+)', text):
+        current += word
+        if len(current) >= size:
+            pieces.append(current)
+            current = ''
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+# ── Application ──────────────────────────────────────────────────────────────
+
+def create_fake_ollama(latency: str = FAKE_LATENCY, chars_per_sec: float = FAKE_CHARS_PER_SEC,
+                       error_rate: float = FAKE_ERROR_RATE, error_codes: str = FAKE_ERROR_CODES,
+                       timeout_rate: float = FAKE_TIMEOUT_RATE, hang: float = FAKE_HANG,
+                       seed: int = FAKE_SEED,
+                       sleep: Callable[[float], None] = time.sleep) -> Flask:
+    """Application Flask du faux serveur (voir le docstring du module pour les réglages)."""
+    fake = Flask(__name__)
+    samplers = parse_latency_map(latency)
+    codes = [int(code) for code in error_codes.split(',') if code.strip()]
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {'requests': 0, 'streamed': 0, 'errors': 0, 'timeouts': 0}
+
+    def _count(key: str) -> None:
+        # Serveur multi-thread : même verrou que les tirages
+        with rng_lock:
+            stats[key] += 1
+
+    def _draw(model: str):
+        with rng_lock:
+            roll = rng.random()
+            delay = samplers.get(model, samplers['*'])(rng)
+            code = rng.choice(codes) if codes else 503
+        if roll < timeout_rate:
+            return 'timeout', hang, code
+        if roll < timeout_rate + error_rate:
+            return 'error', delay, code
+        return 'ok', delay, code
+
+    @fake.route('/', methods=['GET'])
+    def index():
+        return 'Ollama is running'
+
+    @fake.route('/api/tags', methods=['GET'])
+    def tags():
+        return jsonify({'models': [{'name': name} for name in samplers if name != '*']})
+
+    @fake.route('/api/stats', methods=['GET'])
+    def fake_stats():
+        with rng_lock:
+            return jsonify(dict(stats))
+
+    @fake.route('/api/chat', methods=['POST'])
+    def chat():
+        body = request.get_json(silent=True) or {}
+        model = body.get('model') or 'fake'
+        messages = body.get('messages') or []
+        stream = bool(body.get('stream', True))
+        _count('requests')
+
+        outcome, delay, code = _draw(model)
+        if outcome == 'timeout':
+            _count('timeouts')
+            sleep(delay)
+        elif delay > 0:
+            sleep(delay)
+        if outcome == 'error':
+            _count('errors')
+            headers = {'Retry-After': '1'} if code in (429, 503) else {}
+            return jsonify({'error': f'fake error {code}'}), code, headers
+
+        content = answer_for(model, messages)
+        prompt_tokens = sum(len(m.get('content', '')) for m in messages) // 4
+        usage = {'prompt_eval_count': prompt_tokens, 'eval_count': len(content) // 4}
+        if not stream:
+            return jsonify({'model': model, 'message': {'role': 'assistant', 'content': content},
+                            'done': True, **usage})
+
+        _count('streamed')
+
+        def _generate():
+            for piece in _chunks(content):
+                if chars_per_sec > 0:
+                    sleep(len(piece) / chars_per_sec)
+                yield json.dumps({'model': model, 'done': False,
+                                  'message': {'role': 'assistant', 'content': piece}}) + '\n'
+            yield json.dumps({'model': model, 'done': True,
+                              'message': {'role': 'assistant', 'content': ''}, **usage}) + '\n'
+
+        return Response(_generate(), mimetype='application/x-ndjson')
+
+    return fake
+
+
+app = create_fake_ollama()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Faux serveur Ollama pour benchmarks hors ligne')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    args = parser.parse_args(argv)
+    print(f"[fake-ollama] http://{args.host}:{args.port}/api (latence={FAKE_LATENCY}, "
+          f"erreurs={FAKE_ERROR_RATE}, timeouts={FAKE_TIMEOUT_RATE})")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 """Compatibility shim for legacy imports."""
 
-from services.llm_client import LLMClient
+from services.llm_client import LLMClient, get_llm_client
 
-__all__ = ['LLMClient']
+__all__ = ['LLMClient', 'get_llm_client']
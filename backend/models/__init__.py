@@ -2,7 +2,7 @@
 from models.database import (
     init_db, save_analysis, get_history, get_previous_prompt_run,
     generate_demo_history, upsert_project, get_all_projects,
-    get_project_by_id,
+    get_project_by_id, update_project_generation_settings,
     create_user, get_user_by_id, get_user_by_email, get_user_by_google_sub,
     update_user_login, attach_google_identity,
     get_alert_preferences, upsert_alert_channel_setting, upsert_alert_rule_setting
@@ -11,7 +11,7 @@ from models.database import (
 __all__ = [
     'init_db', 'save_analysis', 'get_history', 'get_previous_prompt_run',
     'generate_demo_history', 'upsert_project', 'get_all_projects',
-    'get_project_by_id',
+    'get_project_by_id', 'update_project_generation_settings',
     'create_user', 'get_user_by_id', 'get_user_by_email', 'get_user_by_google_sub',
     'update_user_login', 'attach_google_identity',
     'get_alert_preferences', 'upsert_alert_channel_setting', 'upsert_alert_rule_setting'
@@ -69,6 +69,16 @@ def _parse_json_fields(record, *fields):
     return record
 
 
+def _parse_generation_settings(project):
+    if not project:
+        return project
+    try:
+        project['generation_settings'] = json.loads(project.get('generation_settings') or '{}')
+    except Exception:
+        project['generation_settings'] = {}
+    return project
+
+
 def _alert_settings_key():
     secret = (
         os.getenv('ALERT_SETTINGS_ENCRYPTION_KEY')
@@ -141,6 +151,7 @@ def init_db():
             models      TEXT,
             created_at  TEXT NOT NULL,
             last_run    TEXT,
+            generation_settings TEXT,
             FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
         )
         '''.replace('INTEGER  PRIMARY KEY AUTOINCREMENT', 'INTEGER PRIMARY KEY AUTOINCREMENT')
@@ -227,6 +238,7 @@ def init_db():
     for statement in (
         "ALTER TABLE analysis_history ADD COLUMN model TEXT DEFAULT 'qwen3.5'",
         "ALTER TABLE projects ADD COLUMN user_id INTEGER",
+        "ALTER TABLE projects ADD COLUMN generation_settings TEXT",
         "ALTER TABLE analysis_history ADD COLUMN user_id INTEGER",
         "ALTER TABLE analysis_history ADD COLUMN project_id INTEGER",
         "ALTER TABLE users ADD COLUMN auth_provider TEXT DEFAULT 'password'",
@@ -331,7 +343,8 @@ def attach_google_identity(user_id: int, google_sub: str, avatar_url: str = None
 
 
 def upsert_project(brand: str, sector: str = '', competitors: list = None,
-                   prompts: list = None, models: list = None, user_id: int = None) -> int:
+                   prompts: list = None, models: list = None, user_id: int = None,
+                   generation_settings: dict = None) -> int:
     conn = get_db_connection()
     cur = conn.cursor()
     ph = _ph()
@@ -383,11 +396,33 @@ def upsert_project(brand: str, sector: str = '', competitors: list = None,
             cur.execute('SELECT last_insert_rowid()')
             project_id = cur.fetchone()[0]
 
+    # None = réglages inchangés (un run sans budget explicite garde celui du projet)
+    if generation_settings is not None:
+        cur.execute(f'UPDATE projects SET generation_settings = {ph} WHERE id = {ph}',
+                    (json.dumps(generation_settings), project_id))
+
     conn.commit()
     conn.close()
     return project_id
 
 
+def update_project_generation_settings(project_id: int, settings: dict, user_id: int = None) -> bool:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    ph = _ph()
+
+    if user_id is None:
+        cur.execute(f'UPDATE projects SET generation_settings = {ph} WHERE id = {ph}',
+                    (json.dumps(settings or {}), project_id))
+    else:
+        cur.execute(f'UPDATE projects SET generation_settings = {ph} WHERE id = {ph} AND user_id = {ph}',
+                    (json.dumps(settings or {}), project_id, user_id))
+    updated = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+
 def get_all_projects(user_id: int = None) -> list:
     conn = get_db_connection()
     cur = conn.cursor()
@@ -404,7 +439,8 @@ def get_all_projects(user_id: int = None) -> list:
     projects = []
     for row in rows:
         project = _row_to_dict(row)
-        projects.append(_parse_json_fields(project, 'competitors', 'prompts', 'models'))
+        _parse_json_fields(project, 'competitors', 'prompts', 'models')
+        projects.append(_parse_generation_settings(project))
     return projects
 
 
@@ -421,7 +457,8 @@ def get_project_by_id(project_id: int, user_id: int = None):
     row = cur.fetchone()
     conn.close()
     project = _row_to_dict(row)
-    return _parse_json_fields(project, 'competitors', 'prompts', 'models')
+    _parse_json_fields(project, 'competitors', 'prompts', 'models')
+    return _parse_generation_settings(project)
 
 
 def _load_alert_scope_rows(table: str, key_field: str, user_id: int, project_id: int = None) -> dict:
@@ -628,7 +665,7 @@ def save_analysis(results: dict, user_id: int = None, project_id: int = None):
     if not results or 'responses' not in results:
         return
 
-    from services.analyzer import BrandAnalyzer
+    from services.analyzer import get_analyzer
 
     brand = results.get('brand') or results.get('main_brand', 'Unknown')
     competitors = results.get('competitors', [])
@@ -642,6 +679,7 @@ def save_analysis(results: dict, user_id: int = None, project_id: int = None):
             if llm_name in analyses_by_model:
                 analyses_by_model[llm_name].append(data['analysis'])
 
+    analyzer = get_analyzer(all_brands)
     conn = get_db_connection()
     cur = conn.cursor()
     ph = _ph()
@@ -650,7 +688,6 @@ def save_analysis(results: dict, user_id: int = None, project_id: int = None):
         if not analyses:
             continue
 
-        analyzer = BrandAnalyzer(brands=all_brands)
         metrics = analyzer.calculate_metrics(analyses)
 
         for metric_brand, metric in metrics.items():
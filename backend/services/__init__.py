@@ -1,5 +1,6 @@
 # services - Re-exports
-from services.analyzer import BrandAnalyzer
-from services.llm_client import LLMClient
+from services.analyzer import BrandAnalyzer, get_analyzer, get_analysis_cache_stats
+from services.llm_client import LLMClient, get_llm_client
 
-__all__ = ['BrandAnalyzer', 'LLMClient']
+__all__ = ['BrandAnalyzer', 'get_analyzer', 'get_analysis_cache_stats', 'LLMClient',
+           'get_llm_client']
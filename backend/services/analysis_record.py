@@ -0,0 +1,205 @@
+"""
+Enregistrement d'analyse compact — GEO Monitor
+Une analyse de réponse LLM tient dans quelques slots : l'univers de marques
+(tuple partagé par tout le snapshot), un masque de bits des marques citées,
+l'ordre de citation (indices de marques, 1 octet chacun) et les scores de
+sentiment alignés sur cet ordre. Les clés historiques (`positions`,
+`matmut_*`, `brand_*`…) sont reconstruites à la lecture : l'enregistrement
+se comporte comme un dict en lecture seule et n'est converti qu'à la
+sérialisation JSON (`to_dict` / `json_default`).
+"""
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+_MAIN_KEYS = ('matmut_mentioned', 'matmut_position', 'brand_mentioned', 'brand_position')
+_BASE_KEYS = ('brands_mentioned', 'positions', 'first_brand')
+_KNOWN_KEYS = frozenset(_BASE_KEYS + _MAIN_KEYS + ('source', 'sentiment_labels', 'sentiments'))
+
+
+def _pack_indices(indices: Sequence[int]):
+    return bytes(indices) if all(idx < 256 for idx in indices) else array('H', indices)
+
+
+class AnalysisRecord(Mapping):
+    """
+    Analyse d'une réponse, vue comme un Mapping en lecture seule avec les
+    mêmes clés que le dict historique de BrandAnalyzer.analyze_response.
+    """
+
+    __slots__ = ('brands', 'mask', 'order', 'source', 'sentiments', 'labels', 'main')
+
+    def __init__(self, brands: Tuple[str, ...], order: Sequence[int],
+                 source: Optional[str] = None, sentiments: Optional[Sequence[int]] = None,
+                 labels: Optional[Tuple[Optional[str], ...]] = None, main: bool = True):
+        self.brands = brands
+        self.order = _pack_indices(order)
+        mask = 0
+        for idx in order:
+            mask |= 1 << idx
+        self.mask = mask
+        self.source = source
+        self.sentiments = array('b', sentiments) if sentiments is not None else None
+        self.labels = labels
+        self.main = main
+
+    # ── Construction ─────────────────────────────────────────────────────────
+
+    @classmethod
+    def from_dict(cls, analysis, brands: Tuple[str, ...],
+                  brand_index: Optional[Dict[str, int]] = None):
+        """
+        Compacte un dict d'analyse ; retourne le dict inchangé s'il ne se
+        ramène pas exactement à un enregistrement (clés inconnues, marque
+        hors univers, positions non contiguës, démo de benchmark…).
+        """
+        if isinstance(analysis, cls) or not isinstance(analysis, dict):
+            return analysis
+        if not analysis.keys() <= _KNOWN_KEYS or not all(key in analysis for key in _BASE_KEYS):
+            return analysis
+        brand_index = brand_index if brand_index is not None else {b: i for i, b in enumerate(brands)}
+
+        mentioned = analysis['brands_mentioned']
+        if not isinstance(mentioned, list) or len(set(mentioned)) != len(mentioned):
+            return analysis
+        order = [brand_index.get(brand) for brand in mentioned]
+        if None in order:
+            return analysis
+        expected_positions = {brand: idx + 1 for idx, brand in enumerate(mentioned)}
+        if analysis['positions'] != expected_positions:
+            return analysis
+        if analysis['first_brand'] != (mentioned[0] if mentioned else None):
+            return analysis
+
+        sentiments = analysis.get('sentiments')
+        if sentiments is not None:
+            if not isinstance(sentiments, dict) or list(sentiments) != mentioned:
+                return analysis
+            values = list(sentiments.values())
+            if not all(type(v) is int and -128 <= v <= 127 for v in values):
+                return analysis
+            sentiments = values
+
+        labels = analysis.get('sentiment_labels')
+        if labels is not None:
+            if not isinstance(labels, dict) or not labels.keys() <= expected_positions.keys():
+                return analysis
+            if not all(isinstance(v, str) for v in labels.values()):
+                return analysis
+            labels = tuple(labels.get(brand) for brand in mentioned)
+
+        source = analysis.get('source')
+        if source is not None and not isinstance(source, str):
+            return analysis
+
+        record = cls(brands, order, source=source, sentiments=sentiments, labels=labels,
+                     main=any(key in analysis for key in _MAIN_KEYS))
+        # Les clés marque principale doivent être exactement celles dérivées
+        if record.main and any(analysis.get(key, object()) != record[key] for key in _MAIN_KEYS):
+            return analysis
+        return record
+
+    # ── Accès colonne (chemins rapides des moteurs de métriques) ────────────
+
+    def has(self, brand_idx: int) -> bool:
+        return bool(self.mask >> brand_idx & 1)
+
+    # ── Interface Mapping ────────────────────────────────────────────────────
+
+    def _keys(self) -> Tuple[str, ...]:
+        keys = _BASE_KEYS
+        if self.source is not None:
+            keys += ('source',)
+        if self.labels is not None:
+            keys += ('sentiment_labels',)
+        if self.sentiments is not None:
+            keys += ('sentiments',)
+        if self.main and self.brands:
+            keys += _MAIN_KEYS
+        return keys
+
+    def __getitem__(self, key):
+        brands, order = self.brands, self.order
+        if key == 'brands_mentioned':
+            return [brands[idx] for idx in order]
+        if key == 'positions':
+            return {brands[idx]: pos + 1 for pos, idx in enumerate(order)}
+        if key == 'first_brand':
+            return brands[order[0]] if order else None
+        if key == 'source' and self.source is not None:
+            return self.source
+        if key == 'sentiments' and self.sentiments is not None:
+            return {brands[idx]: score for idx, score in zip(order, self.sentiments)}
+        if key == 'sentiment_labels' and self.labels is not None:
+            return {brands[idx]: label for idx, label in zip(order, self.labels) if label is not None}
+        if key in _MAIN_KEYS and self.main and brands:
+            position = self._main_position()
+            return position if key.endswith('_position') else position is not None
+        raise KeyError(key)
+
+    def _main_position(self) -> Optional[int]:
+        if not self.mask & 1:
+            return None
+        return self.order.index(0) + 1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys()
+
+    def to_dict(self) -> Dict:
+        return {key: self[key] for key in self._keys()}
+
+    def __repr__(self) -> str:
+        return f"AnalysisRecord({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (_from_state, (self.brands, tuple(self.order), self.source,
+                              tuple(self.sentiments) if self.sentiments is not None else None,
+                              self.labels, self.main))
+
+
+def _from_state(brands, order, source, sentiments, labels, main):
+    return AnalysisRecord(brands, order, source, sentiments, labels, main)
+
+
+def json_default(obj):
+    """Hook `default` de json.dump(s) : sérialise les AnalysisRecord en dict."""
+    if isinstance(obj, AnalysisRecord):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def compact_results(results: Dict) -> Dict:
+    """
+    Remplace, en place, les analyses d'un snapshot par des AnalysisRecord
+    partageant un seul tuple de marques. Les analyses non compactables
+    restent des dicts.
+    """
+    if not isinstance(results, dict) or not results.get('responses'):
+        return results
+    if results.get('brands'):
+        universe = list(results['brands'])
+    else:
+        brand = results.get('brand') or results.get('main_brand')
+        universe = ([brand] if brand else []) + list(results.get('competitors') or [])
+    # Marques citées hors liste déclarée (anciens snapshots) ajoutées en fin
+    for response in results['responses']:
+        for data in (response.get('llm_analyses') or {}).values():
+            analysis = data.get('analysis') if isinstance(data, dict) else None
+            if isinstance(analysis, dict) and isinstance(analysis.get('brands_mentioned'), list):
+                universe.extend(b for b in analysis['brands_mentioned'] if isinstance(b, str))
+    brands = tuple(dict.fromkeys(universe))
+    if not brands:
+        return results
+    brand_index = {brand: idx for idx, brand in enumerate(brands)}
+
+    for response in results['responses']:
+        for data in (response.get('llm_analyses') or {}).values():
+            if isinstance(data, dict) and isinstance(data.get('analysis'), dict):
+                data['analysis'] = AnalysisRecord.from_dict(data['analysis'], brands, brand_index)
+    return results
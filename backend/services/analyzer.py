@@ -3,11 +3,41 @@ Analyseur de mentions de marques dans les réponses LLM
 Version 2.0 — Support dynamique de n'importe quelle marque
 Sprint 2   — Score de confiance par modèle (divergence inter-LLM)
 """
-import re
+import hashlib
+import threading
 import unicodedata
-import json
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Optional
 from utils.prompts import BRANDS
+from utils.json_blocks import JsonBlockScanner, extract_json_block
+from services.analysis_record import AnalysisRecord
+from services.brand_matcher import BrandMatcher
+from services.metrics_engine import BOOTSTRAP_RESAMPLES, MetricsAccumulator, MetricsCube
+from services.sentiment import DEFAULT_LEXICON, label_score, window_scores
+
+
+class _AsciiFoldTable(dict):
+    """
+    Table pour str.translate : code point → repli ASCII (NFD sans diacritiques).
+    Calculée à la demande puis mémorisée, donc chaque caractère n'est
+    décomposé qu'une seule fois par processus.
+    """
+
+    def __missing__(self, codepoint: int) -> str:
+        folded = unicodedata.normalize('NFD', chr(codepoint)).encode('ascii', 'ignore').decode('ascii')
+        self[codepoint] = folded
+        return folded
+
+
+_ASCII_FOLD = _AsciiFoldTable()
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules + suppression des accents, sans aller-retour encode/decode."""
+    lowered = text.lower()
+    if lowered.isascii():
+        return lowered
+    return lowered.translate(_ASCII_FOLD)
 
 
 class BrandAnalyzer:
@@ -18,154 +48,223 @@ class BrandAnalyzer:
             self.brands = brands
         else:
             self.brands = BRANDS
+        # Matcher compilé une seule fois pour toutes les réponses analysées
+        self._matcher = BrandMatcher(self.brands, self._normalize)
+        # forme normalisée → marque, pour rattacher les noms cités dans le JSON
+        self._brand_by_form: Dict[str, str] = {}
+        self._forms: Dict[str, str] = {}
+        for brand in self.brands:
+            self._forms[brand] = self._normalize(brand).strip()
+            self._brand_by_form.setdefault(self._forms[brand], brand)
+        # Empreinte du jeu de marques (ordre compris) pour le cache d'analyses
+        self._fingerprint: Tuple[str, ...] = tuple(self.brands)
+        # Univers de marques partagé par tous les AnalysisRecord produits
+        self._record_brands: Tuple[str, ...] = tuple(dict.fromkeys(self.brands))
+        self._record_index = {brand: idx for idx, brand in enumerate(self._record_brands)}
 
     # ── Extraction ──────────────────────────────────────────────────────────
 
     def _normalize(self, text: str) -> str:
         """Normalise un texte: minuscules + suppression des accents."""
-        return unicodedata.normalize('NFD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+        return normalize_text(text)
 
     def _extract_json_from_response(self, text: str) -> tuple:
         """
         Extrait le JSON de la réponse LLM et retourne (narrative, json_data).
-        Le JSON est détecté entre ```json...``` ou entre ```...``` ou entre {...}.
+        Le JSON est détecté dans un bloc ``` (prioritaire) ou hors bloc,
+        en une seule passe (voir utils.json_blocks).
         """
-        if not text:
-            return text, None
-
-        import re as re_mod, json as json_mod
-
-        # Chercher un bloc JSON (```json ... ``` ou ``` ... ```)
-        json_patterns = [
-            r'```json\s*(\{[\s\S]*?\})\s*```',  # ```json { ... } ```
-            r'```\s*(\{[\s\S]*?\})\s*```',       # ```{ ... } ```
-        ]
-
-        for pattern in json_patterns:
-            match = re_mod.search(pattern, text, re_mod.DOTALL)
-            if match:
-                json_str = match.group(1)
-                narrative = text[:match.start()].strip()
-                try:
-                    json_data = json_mod.loads(json_str)
-                    return narrative, json_data
-                except Exception:
-                    pass
-
-        # Chercher le dernier {...} comme fallback
-        last_brace = text.rfind('{')
-        last_brace_end = text.rfind('}')
-        if last_brace != -1 and last_brace_end > last_brace:
-            json_candidate = text[last_brace:last_brace_end+1]
-            narrative = text[:last_brace].strip()
-            try:
-                json_data = json_mod.loads(json_candidate)
-                return narrative, json_data
-            except Exception:
-                pass
-
-        return text, None
+        return extract_json_block(text)
 
     def extract_brands(self, text: str) -> List[Tuple[str, int]]:
         if not text:
             return []
-        mentions = []
         # N'extraire que de la partie narrative (pas du JSON)
         narrative, _ = self._extract_json_from_response(text)
-        text_lower = self._normalize(narrative)
-        for brand in self.brands:
-            pattern = r'\b' + re.escape(self._normalize(brand)) + r'\b'
-            matches = list(re.finditer(pattern, text_lower))
-            if matches:
-                mentions.append((brand, matches[0].start()))
-        mentions.sort(key=lambda x: x[1])
-        return mentions
-
-    def analyze_response(self, response: str) -> Dict:
-        mentions = self.extract_brands(response)
-        result = {
-            'brands_mentioned': [brand for brand, _ in mentions],
-            'positions':        {brand: idx + 1 for idx, (brand, _) in enumerate(mentions)},
-            'first_brand':      mentions[0][0] if mentions else None,
-        }
-        main_brand = self.brands[0] if self.brands else None
-        if main_brand:
-            result['matmut_mentioned'] = any(b == main_brand for b, _ in mentions)
-            result['matmut_position']  = None
-            result['brand_mentioned']  = result['matmut_mentioned']
-            result['brand_position']   = None
-            for idx, (brand, _) in enumerate(mentions):
-                if brand == main_brand:
-                    result['matmut_position'] = idx + 1
-                    result['brand_position']  = idx + 1
+        return self._matcher.find(self._normalize(narrative))
+
+    def _resolve_brand(self, name) -> Optional[str]:
+        """Rattache un nom de marque cité dans le JSON à une marque du benchmark."""
+        if not isinstance(name, str) or not name.strip():
+            return None
+        form = self._normalize(name).strip()
+        brand = self._brand_by_form.get(form)
+        if brand is None:
+            # « MAIF (mutuelle) » → premier nom du benchmark contenu dans le libellé
+            found = self._matcher.find(form)
+            brand = found[0][0] if found else None
+        return brand
+
+    def _brands_from_json(self, json_data) -> Optional[List[str]]:
+        """
+        Ordre des marques d'après le JSON structuré du GEO system prompt
+        (`classement`, puis `mentions`, puis `premier`).
+        Retourne None si le JSON est absent ou inexploitable → repli regex.
+        """
+        if not isinstance(json_data, dict):
+            return None
+        ranking  = json_data.get('classement')
+        mentions = json_data.get('mentions')
+        if not isinstance(ranking, dict) and not isinstance(mentions, list):
+            return None
+
+        def _rank(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return float('inf')
+
+        cited = []
+        if isinstance(ranking, dict):
+            cited.extend(name for name, _ in sorted(ranking.items(), key=lambda kv: _rank(kv[1])))
+        if isinstance(mentions, list):
+            cited.extend(mentions)
+        if not cited and json_data.get('premier'):
+            cited.append(json_data['premier'])
+
+        ordered = []
+        for name in cited:
+            brand = self._resolve_brand(name)
+            if brand and brand not in ordered:
+                ordered.append(brand)
+
+        if cited and not ordered:
+            # Le modèle a cité des noms hors benchmark : le JSON ne nous apprend rien
+            return None
+        return ordered
+
+    def analyze_response(self, response: str) -> AnalysisRecord:
+        """
+        Analyse une réponse LLM, mémoïsée par (jeu de marques, hash du texte) :
+        les réponses identiques (cache LLM, runs planifiés, prompts partagés
+        entre projets) ne sont analysées qu'une fois.
+        Retourne un AnalysisRecord immuable (Mapping aux clés historiques),
+        partageable sans copie.
+        """
+        if not response:
+            return self._analyze(response)
+
+        digest = hashlib.blake2b(response.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with _analysis_cache_lock:
+            variants = _analysis_cache.get(digest)
+            if variants is not None:
+                _analysis_cache.move_to_end(digest)
+                cached = variants.get(self._fingerprint)
+                if cached is not None:
+                    _analysis_stats['hits'] += 1
+                    return cached
+                candidates = list(variants.items())
+            else:
+                candidates = []
+
+        result = None
+        if candidates:
+            normalized = self._normalize(response)
+            for brands, cached in candidates:
+                if self._reusable(brands, normalized):
+                    result = cached
                     break
+
+        with _analysis_cache_lock:
+            _analysis_stats['reused' if result is not None else 'misses'] += 1
+        if result is None:
+            result = self._analyze(response)
+
+        with _analysis_cache_lock:
+            variants = _analysis_cache.setdefault(digest, OrderedDict())
+            _analysis_cache.move_to_end(digest)
+            variants[self._fingerprint] = result
+            while len(variants) > ANALYSIS_VARIANTS_PER_RESPONSE:
+                variants.popitem(last=False)
+            while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+                _analysis_cache.popitem(last=False)
         return result
 
+    def _reusable(self, brands: Tuple[str, ...], normalized: str) -> bool:
+        """
+        Vrai si l'analyse faite avec `brands` vaut pour ce jeu de marques :
+        même marque principale, anciennes marques dans le même ordre, et
+        aucune marque ajoutée n'apparaît dans le texte (ni narration ni JSON).
+        Cas typique : un concurrent ajouté à un projet existant.
+        """
+        if not brands or not self.brands or brands[0] != self.brands[0]:
+            return False
+        remaining = iter(self.brands)
+        if not all(brand in remaining for brand in brands):
+            return False
+        known = set(brands)
+        for brand in self.brands:
+            if brand in known:
+                continue
+            form = self._forms[brand]
+            if not form or form in normalized:
+                return False
+        return True
+
+    def _analyze(self, response: str) -> AnalysisRecord:
+        narrative, json_data = self._extract_json_from_response(response) if response else (response, None)
+        # Un seul balayage de la narration : ordre regex + occurrences + mots du lexique
+        mentions, occurrences, tokens = self._matcher.scan(
+            self._normalize(narrative) if narrative else '', DEFAULT_LEXICON
+        )
+        ordered = self._brands_from_json(json_data)
+        source = 'json'
+        if ordered is None:
+            source = 'regex'
+            ordered = [brand for brand, _ in mentions]
+
+        labels = None
+        raw_labels = json_data.get('sentiments') if source == 'json' else None
+        if isinstance(raw_labels, dict):
+            by_brand = {}
+            for name, label in raw_labels.items():
+                brand = self._resolve_brand(name)
+                if brand in ordered and isinstance(label, str):
+                    by_brand[brand] = label
+            labels = tuple(by_brand.get(brand) for brand in ordered)
+
+        # Sentiment par marque (-100…100) : libellé JSON s'il existe, sinon
+        # lexique dans la fenêtre de chaque occurrence
+        windowed = window_scores(occurrences, tokens)
+        sentiments = []
+        for idx, brand in enumerate(ordered):
+            score = label_score(labels[idx], self._normalize) if labels else None
+            sentiments.append(score if score is not None else windowed.get(brand, 0))
+
+        # Enregistrement compact : les clés historiques (positions, matmut_*,
+        # brand_*) sont dérivées à la lecture, la marque principale étant brands[0]
+        return AnalysisRecord(
+            self._record_brands,
+            [self._record_index[brand] for brand in ordered],
+            source=source, sentiments=sentiments, labels=labels,
+        )
+
+    def stream_extractor(self) -> 'StreamingExtractor':
+        """Extracteur incrémental pour une réponse reçue en streaming."""
+        return StreamingExtractor(self)
+
     def calculate_sentiment(self, text: str, brand: str) -> float:
-        if not text or brand.lower() not in text.lower():
+        """Sentiment (-100…100) des mots du lexique proches des occurrences de `brand`."""
+        if not text:
+            return 0
+        matcher = self._matcher if brand in self.brands else BrandMatcher([brand], self._normalize)
+        _, occurrences, tokens = matcher.scan(self._normalize(text), DEFAULT_LEXICON)
+        if brand not in occurrences:
             return 0
-        positive_words = ['excellent', 'bon', 'meilleur', 'rapide', 'efficace', 'fiable',
-                          'top', 'recommande', 'super', 'génial', 'economique', 'qualité',
-                          'best', 'great', 'amazing', 'trusted', 'reliable']
-        negative_words = ['mauvais', 'lent', 'cher', 'pire', 'déçu', 'problème',
-                          'fuir', 'arnaque', 'compliqué', 'inutile', 'bad', 'avoid',
-                          'poor', 'terrible', 'worst']
-        score = 0
-        text_lower = text.lower()
-        for word in positive_words:
-            if word in text_lower: score += 15
-        for word in negative_words:
-            if word in text_lower: score -= 15
-        return max(min(score, 100), -100)
+        return window_scores({brand: occurrences[brand]}, tokens)[brand]
 
     # ── Métriques globales ───────────────────────────────────────────────────
 
     def calculate_metrics(self, all_results: List[Dict]) -> Dict:
-        metrics = {}
-        total_prompts = len(all_results)
+        return MetricsCube(self.brands, all_results).metrics()
 
-        for brand in self.brands:
-            mentions_count      = 0
-            positions_sum       = 0
-            first_position_count = 0
-
-            for result in all_results:
-                if brand in result.get('brands_mentioned', []):
-                    mentions_count += 1
-                    positions_sum  += result['positions'].get(brand, 0)
-                    if result.get('first_brand') == brand:
-                        first_position_count += 1
-
-            mention_rate = (mentions_count / total_prompts * 100) if total_prompts > 0 else 0
-            avg_position = (positions_sum / mentions_count) if mentions_count > 0 else 0
-            top_of_mind  = (first_position_count / total_prompts * 100) if total_prompts > 0 else 0
-            avg_sentiment = max(100 - (avg_position * 20), -20) if mentions_count > 0 else 0
-
-            metrics[brand] = {
-                'mention_count':       mentions_count,
-                'mention_rate':        round(mention_rate, 2),
-                'avg_position':        round(avg_position, 2),
-                'top_of_mind':         round(top_of_mind, 2),
-                'first_position_count': first_position_count,
-                'sentiment_score':     round(avg_sentiment, 1)
-            }
+    def metrics_cube(self, responses: List[Dict]) -> MetricsCube:
+        """Cube d'incidence d'un snapshot (global, par catégorie, par modèle)."""
+        return MetricsCube.from_responses(responses, self.brands)
 
-        total_mentions = sum(m['mention_count'] for m in metrics.values())
-        for brand in metrics:
-            sov = (metrics[brand]['mention_count'] / total_mentions * 100) if total_mentions > 0 else 0
-            metrics[brand]['share_of_voice'] = round(sov, 2)
-
-        for brand in metrics:
-            score = (
-                metrics[brand]['mention_rate'] * 0.4 +
-                (100 / metrics[brand]['avg_position'] if metrics[brand]['avg_position'] > 0 else 0) * 0.3 +
-                metrics[brand]['share_of_voice'] * 0.2 +
-                metrics[brand]['top_of_mind'] * 0.1 +
-                max(metrics[brand]['sentiment_score'], 0) * 0.1
-            )
-            metrics[brand]['global_score'] = round(score, 2)
-
-        return metrics
+    def accumulator(self) -> MetricsAccumulator:
+        """Accumulateur incrémental (un par run, l'analyseur reste partagé)."""
+        return MetricsAccumulator(self.brands)
 
     # ── SPRINT 2 — Métriques par modèle ─────────────────────────────────────
 
@@ -182,18 +281,29 @@ class BrandAnalyzer:
               'llama3.2': {brand: {...}}
             }
         """
-        by_model: Dict[str, List[Dict]] = {}
+        return self.metrics_cube(responses).metrics_by('model')
 
+    def calculate_parse_stats(self, responses: List[Dict]) -> Dict:
+        """
+        Taux d'analyses issues du JSON structuré (vs repli regex), par modèle.
+        Les analyses sans `source` (démo, snapshots anciens) sont ignorées.
+
+        Returns:
+            {model: {'json': int, 'regex': int, 'total': int, 'json_rate': float}}
+        """
+        stats: Dict[str, Dict] = {}
         for response in responses:
             for model, data in response.get('llm_analyses', {}).items():
-                by_model.setdefault(model, [])
-                by_model[model].append(data.get('analysis', {}))
+                source = (data.get('analysis') or {}).get('source')
+                if source not in ('json', 'regex'):
+                    continue
+                entry = stats.setdefault(model, {'json': 0, 'regex': 0})
+                entry[source] += 1
 
-        return {
-            model: self.calculate_metrics(analyses)
-            for model, analyses in by_model.items()
-            if analyses
-        }
+        for entry in stats.values():
+            entry['total'] = entry['json'] + entry['regex']
+            entry['json_rate'] = round(entry['json'] / entry['total'] * 100, 1)
+        return stats
 
     def calculate_confidence_score(self, metrics_by_model: Dict, brand: str) -> Dict:
         """
@@ -256,18 +366,22 @@ class BrandAnalyzer:
             }
         }
 
-    def get_full_confidence_report(self, responses: List[Dict], main_brand: str) -> Dict:
+    def get_full_confidence_report(self, responses: List[Dict], main_brand: str,
+                                   n_resamples: int = BOOTSTRAP_RESAMPLES) -> Dict:
         """
-        Rapport complet de confiance pour toutes les marques.
+        Rapport complet de confiance pour toutes les marques. `n_resamples`
+        : tirages bootstrap des intervalles (0 = pas d'intervalles).
 
         Returns:
             {
               'by_model': {model: {brand: metrics}},
               'confidence': {brand: confidence_score},
-              'main_brand_confidence': {...}
+              'main_brand_confidence': {...},
+              'intervals': {'by_model': {...}, 'overall': {...}}
             }
         """
-        by_model = self.calculate_metrics_by_model(responses)
+        cube = self.metrics_cube(responses)
+        by_model = cube.metrics_by('model')
 
         confidence_by_brand = {}
         for brand in self.brands:
@@ -276,9 +390,20 @@ class BrandAnalyzer:
         return {
             'by_model':              by_model,
             'confidence':            confidence_by_brand,
-            'main_brand_confidence': confidence_by_brand.get(main_brand, {})
+            'main_brand_confidence': confidence_by_brand.get(main_brand, {}),
+            'intervals':             cube.bootstrap_intervals(n_resamples=n_resamples)
+                                     if n_resamples else None
         }
 
+    def calculate_confidence_intervals(self, responses: List[Dict],
+                                       n_resamples: int = BOOTSTRAP_RESAMPLES) -> Dict:
+        """
+        Intervalles de confiance à 95 % (bootstrap sur les prompts) de
+        mention_rate, avg_position et global_score, par modèle et global.
+        Voir MetricsCube.bootstrap_intervals.
+        """
+        return self.metrics_cube(responses).bootstrap_intervals(n_resamples=n_resamples)
+
     # ── Ranking + Insights ───────────────────────────────────────────────────
 
     def generate_ranking(self, metrics: Dict) -> List[Dict]:
@@ -332,3 +457,105 @@ class BrandAnalyzer:
             'weaknesses':      weaknesses,
             'recommendations': recommendations
         }
+
+
+# ── Cache d'analyses (process-wide) ─────────────────────────────────────────
+
+ANALYSIS_CACHE_SIZE = 4096            # réponses distinctes gardées en mémoire
+ANALYSIS_VARIANTS_PER_RESPONSE = 4    # jeux de marques par réponse
+
+# hash du texte → {jeu de marques: analyse}
+_analysis_cache: "OrderedDict[bytes, OrderedDict]" = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+_analysis_stats = {'hits': 0, 'reused': 0, 'misses': 0}
+
+
+class StreamingExtractor:
+    """
+    Suit une réponse LLM en streaming : premières mentions de marques dans
+    la narration au fil des morceaux, et détection de la fermeture du bloc
+    JSON de classement (`closed`) pour arrêter la génération au plus tôt.
+    Aperçu seulement : l'analyse de référence reste analyze_response sur
+    le texte complet.
+    """
+
+    def __init__(self, analyzer: BrandAnalyzer):
+        self._normalize = analyzer._normalize
+        self._matcher = analyzer._matcher.stream()
+        self._scanner = JsonBlockScanner()
+        self._narrative_done = False
+
+    @property
+    def text(self) -> str:
+        return self._scanner.text
+
+    @property
+    def closed(self) -> bool:
+        """Vrai dès que le bloc JSON de classement est entièrement reçu."""
+        return self._scanner.closed
+
+    def feed(self, chunk: str, final: bool = False) -> List[str]:
+        """Ajoute un morceau ; retourne les marques citées pour la première fois."""
+        self._scanner.feed(chunk, final=final)
+        if self._narrative_done:
+            return []
+        if self._scanner.in_block or self._scanner.closed:
+            # Le JSON n'est pas de la narration : on décide ce qui précède et on s'arrête
+            self._narrative_done = True
+            final = True
+            chunk = self._tail_before_block(chunk)
+        return [brand for brand, _ in self._matcher.feed(self._normalize(chunk), final=final)]
+
+    def _tail_before_block(self, chunk: str) -> str:
+        """Partie du dernier morceau située avant le début du bloc JSON."""
+        consumed = len(self._scanner.text) - len(chunk)
+        return chunk[:max(0, self._scanner.block_start - consumed)]
+
+
+def get_analysis_cache_stats() -> Dict:
+    """Compteurs du cache d'analyses, pour /api/status."""
+    with _analysis_cache_lock:
+        stats = dict(_analysis_stats)
+        stats['size'] = len(_analysis_cache)
+    lookups = stats['hits'] + stats['reused'] + stats['misses']
+    stats['capacity'] = ANALYSIS_CACHE_SIZE
+    stats['hit_rate'] = round((stats['hits'] + stats['reused']) / lookups * 100, 1) if lookups else 0.0
+    return stats
+
+
+def clear_analysis_cache() -> None:
+    with _analysis_cache_lock:
+        _analysis_cache.clear()
+        for key in _analysis_stats:
+            _analysis_stats[key] = 0
+
+
+# ── Registre process-wide ────────────────────────────────────────────────────
+
+ANALYZER_REGISTRY_SIZE = 128
+
+_analyzers: "OrderedDict[Tuple[str, ...], BrandAnalyzer]" = OrderedDict()
+_analyzers_lock = threading.Lock()
+
+
+def get_analyzer(brands: Optional[List[str]] = None) -> BrandAnalyzer:
+    """
+    Retourne le BrandAnalyzer partagé pour ce jeu de marques (ordre compris :
+    la première marque reste la marque principale).
+    Les marques normalisées et le matcher compilé sont ainsi construits une
+    seule fois par processus au lieu d'une fois par appel.
+    """
+    key = tuple(brands) if brands else tuple(BRANDS)
+    with _analyzers_lock:
+        analyzer = _analyzers.get(key)
+        if analyzer is not None:
+            _analyzers.move_to_end(key)
+            return analyzer
+
+    analyzer = BrandAnalyzer(brands=list(key))
+    with _analyzers_lock:
+        analyzer = _analyzers.setdefault(key, analyzer)
+        _analyzers.move_to_end(key)
+        while len(_analyzers) > ANALYZER_REGISTRY_SIZE:
+            _analyzers.popitem(last=False)
+    return analyzer
@@ -2,16 +2,45 @@
 Async LLM Client — GEO Monitor Option 1 (Backend Asynchrone)
 Utilise aiohttp pour des appels HTTP non-bloquants vers Ollama Cloud.
 Permet de gérer plusieurs requêtes en parallèle sans bloquer le worker.
+
+Une seule ClientSession longue durée par boucle d'événements, sur un
+TCPConnector borné (limit, limit_per_host, cache DNS, keep-alive) : des
+centaines de requêtes d'un run planifié se partagent quelques sockets.
+Même contrat que LLMClient (system prompt, options de génération, cache,
+single-flight, retries, disjoncteur, matrice prompts × modèles).
 """
 import os
+import threading
+import time
 import aiohttp
 import asyncio
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from services.llm_cache import ResponseCache, get_disk_cache
+from services.llm_client import (CHAT_OPTIONS, LLM_MAX_CONCURRENCY, LLM_MODEL_CONCURRENCY,
+                                 _client_config_key, get_http_session)
+from services.generation import cache_options, resolve_generation
+from services.provider_pool import ProviderPool
+from services.resilience import (CircuitBreaker, RetryPolicy, RETRYABLE_STATUS,
+                                 parse_retry_after)
+from services.rate_limiter import (INTERACTIVE, RATE_MAX_WAIT, RateLimiter, estimate_tokens,
+                                   get_rate_limiter)
+from services.singleflight import AsyncSingleFlight
+
 load_dotenv()
 
 
+# ── Connecteur TCP ───────────────────────────────────────────────────────────
+
+# Sockets ouverts au total / vers OLLAMA_BASE_URL
+ASYNC_CONNECTION_LIMIT = int(os.getenv('OLLAMA_ASYNC_LIMIT', '32'))
+ASYNC_CONNECTION_LIMIT_PER_HOST = int(os.getenv('OLLAMA_ASYNC_LIMIT_PER_HOST', '16'))
+# Durée de vie des résolutions DNS et des connexions inactives (s)
+ASYNC_DNS_TTL = int(os.getenv('OLLAMA_DNS_TTL', '300'))
+ASYNC_KEEPALIVE = float(os.getenv('OLLAMA_KEEPALIVE', '30'))
+
+
 class AsyncLLMClient:
     """Client asynchrone pour Ollama Cloud — supporte N modèles avec une seule clé API."""
 
@@ -20,7 +49,20 @@ class AsyncLLMClient:
         self.api_key = os.getenv('OLLAMA_API_KEY')
         # Timeout plus long pour async : 60s par requête
         self.timeout = int(os.getenv('OLLAMA_TIMEOUT', '60'))
-        self.cache: Dict[str, str] = {}
+        # Mémoire du process, puis disque partagé si OLLAMA_DISK_CACHE=1
+        self.cache = ResponseCache(disk=get_disk_cache())
+        # Coalescence des requêtes identiques en vol
+        self._flights = AsyncSingleFlight()
+        # Retries transitoires + un disjoncteur par modèle
+        self.retry_policy = RetryPolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # Quota partagé avec LLMClient et les autres process
+        self.rate_limiter = get_rate_limiter()
+        # Mêmes endpoints que LLMClient (OLLAMA_PROVIDERS), charge comptée à part
+        self.pool = ProviderPool.from_env(self.base_url, self.api_key)
+        # Session partagée, liée à la boucle qui l'a créée
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
 
         # Chargement des modèles depuis .env
         raw_models = os.getenv('OLLAMA_MODELS', 'qwen3.5')
@@ -34,134 +76,343 @@ class AsyncLLMClient:
         else:
             print("[AsyncLLMClient] OLLAMA_API_KEY manquante — mode démo activé")
 
-    async def query_model(self, prompt: str, model: str, use_cache: bool = True, session: Optional[aiohttp.ClientSession] = None) -> str:
+    # ── Session HTTP ─────────────────────────────────────────────────────────
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Session partagée de la boucle courante (créée au premier appel).
+        Une session aiohttp ne peut pas changer de boucle : un nouvel
+        asyncio.run() obtient la sienne.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=ASYNC_CONNECTION_LIMIT,
+                limit_per_host=ASYNC_CONNECTION_LIMIT_PER_HOST,
+                ttl_dns_cache=ASYNC_DNS_TTL,
+                keepalive_timeout=ASYNC_KEEPALIVE,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        """Ferme la session partagée (fin de run, arrêt du worker)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    async def __aenter__(self) -> 'AsyncLLMClient':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    # ── Requête vers un modèle spécifique ───────────────────────────────────
+
+    async def query_model(self, prompt: str, model: str, use_cache: bool = True,
+                          session: Optional[aiohttp.ClientSession] = None,
+                          system_prompt: str = None, priority: str = INTERACTIVE,
+                          generation: Optional[Dict] = None) -> str:
         """Interroge un modèle Ollama Cloud de manière asynchrone. Retourne '' si échec."""
+        content, _, _ = await self._query(prompt, model, use_cache, system_prompt, session,
+                                          priority, generation)
+        return content
+
+    async def _query(self, prompt: str, model: str, use_cache: bool = True,
+                     system_prompt: str = None,
+                     session: Optional[aiohttp.ClientSession] = None,
+                     priority: str = INTERACTIVE, generation: Optional[Dict] = None
+                     ) -> Tuple[str, Optional[str], Optional[Dict[str, int]]]:
+        """Comme query_model : (texte, erreur ou None, compteurs de tokens ou None)."""
         if not self.api_key:
-            return ""
+            return "", 'no_api_key', None
 
-        cache_key = f"{model}:{prompt[:120]}"
-        if use_cache and cache_key in self.cache:
-            print(f"  [CACHE] {model[:20]}")
-            return self.cache[cache_key]
+        budget = resolve_generation(generation, model)
+        cache_key = ResponseCache.make_key(model, prompt, system_prompt,
+                                           cache_options(CHAT_OPTIONS, budget))
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"  [CACHE] {model[:20]}")
+                return cached, None, None
 
-        # Créer une session si non fournie
-        close_session = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            close_session = True
+        # Requête identique déjà en vol : on attend son résultat
+        (content, error, usage), shared = await self._flights.do(
+            cache_key, lambda: self._fetch_model(prompt, model, system_prompt, session, priority,
+                                                 budget)
+        )
+        if shared:
+            print(f"  [{model}] réponse partagée (single-flight)")
+        elif use_cache and content:
+            self.cache.set(cache_key, content)
+        return content, error, usage
 
-        try:
-            print(f"  [{model}] requête async (timeout={self.timeout}s)…")
-            
-            timeout = aiohttp.ClientTimeout(total=self.timeout)
-            
-            async with session.post(
-                f"{self.base_url}/chat",
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {self.api_key}'
-                },
-                json={
-                    'model': model,
-                    'messages': [{'role': 'user', 'content': prompt}],
-                    'stream': False
-                },
-                timeout=timeout
-            ) as resp:
-                if resp.status != 200:
-                    print(f"  [{model}] ✗ HTTP {resp.status}")
-                    return ""
-                
-                data = await resp.json()
-                content = data.get('message', {}).get('content', '')
-                print(f"  [{model}] ✓ {len(content)} chars")
-                
-                if use_cache and content:
-                    self.cache[cache_key] = content
-                return content
-
-        except asyncio.TimeoutError:
-            print(f"  [{model}] ✗ timeout ({self.timeout}s)")
-            return ""
-        except aiohttp.ClientError as e:
-            print(f"  [{model}] ✗ {type(e).__name__}: {e}")
-            return ""
-        finally:
-            if close_session:
-                await session.close()
+    async def _fetch_model(self, prompt: str, model: str, system_prompt: str = None,
+                           session: Optional[aiohttp.ClientSession] = None,
+                           priority: str = INTERACTIVE, budget: Optional[Dict] = None
+                           ) -> Tuple[str, Optional[str], Optional[Dict[str, int]]]:
+        """
+        Appel HTTP effectif sous le disjoncteur du modèle ; ('', cause, None)
+        si échec. Même politique de retry que LLMClient._send.
+        """
+        breaker = self.breaker(model)
+        if not breaker.allow():
+            print(f"  [{model}] ✗ disjoncteur ouvert (réessai dans {breaker.retry_in():.0f}s)")
+            return "", 'breaker_open', None
+
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        messages.append({'role': 'user', 'content': prompt})
+        session = session or self.session()
+        bucket = RateLimiter.bucket_key(self.api_key, model)
+        tokens = estimate_tokens(system_prompt, prompt)
+
+        attempt, endpoint = 0, None
+        while True:
+            attempt += 1
+            retry_after = None
+            if not await self._acquire_rate(bucket, tokens, priority):
+                print(f"  [{model}] ✗ quota local épuisé ({priority})")
+                if attempt == 1:
+                    breaker.release()
+                    return "", 'rate_limited', None
+                error = 'rate_limited'
+                break
+            endpoint, remote_model = self.pool.acquire(model, exclude=endpoint)
+            ok = False
+            try:
+                print(f"  [{model}] requête async {attempt}/{self.retry_policy.attempts} (timeout={self.timeout}s)…")
+                async with session.post(
+                    endpoint.chat_url,
+                    headers=endpoint.headers(),
+                    json=endpoint.payload(remote_model, messages, CHAT_OPTIONS, budget),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)
+                ) as resp:
+                    if resp.status != 200:
+                        print(f"  [{model}] ✗ HTTP {resp.status}")
+                        error = f"http_{resp.status}"
+                        if resp.status not in RETRYABLE_STATUS:
+                            break
+                        if resp.status in (429, 503):
+                            retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                        if resp.status == 429 and self.rate_limiter is not None:
+                            await self._run_blocking(self.rate_limiter.drain, bucket)
+                    else:
+                        data = await resp.json(content_type=None)
+                        content = endpoint.parse_content(data)
+                        ok = True
+                        breaker.record_success()
+                        if self.rate_limiter is not None:
+                            await self._run_blocking(self.rate_limiter.settle, bucket, tokens,
+                                                     endpoint.parse_usage(data))
+                        print(f"  [{model}] ✓ {len(content)} chars")
+                        return content, None if content else 'empty', endpoint.parse_token_counts(data)
+
+            except asyncio.TimeoutError:
+                print(f"  [{model}] ✗ timeout ({self.timeout}s)")
+                error = 'timeout'
+                break
+            except aiohttp.ClientConnectionError as e:
+                print(f"  [{model}] ✗ connexion : {e}")
+                error = 'connection'
+            except (aiohttp.ClientError, ValueError) as e:
+                print(f"  [{model}] ✗ {type(e).__name__}: {e}")
+                error = 'error'
+                break
+            finally:
+                self.pool.release(endpoint, ok)
 
-    async def query_all(self, prompt: str) -> Dict[str, str]:
+            delay = self.retry_policy.delay(attempt, retry_after)
+            if delay is None:
+                break
+            print(f"  [{model}] nouvel essai dans {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        breaker.record_failure()
+        return "", error, None
+
+    async def _acquire_rate(self, bucket: str, tokens: int, priority: str) -> bool:
+        """Équivalent asynchrone de RateLimiter.acquire (attente sans bloquer la boucle)."""
+        if self.rate_limiter is None:
+            return True
+        waited = 0.0
+        while True:
+            wait = await self._run_blocking(self.rate_limiter.reserve_slot, bucket, tokens, priority)
+            if wait <= 0:
+                return True
+            if waited + wait > RATE_MAX_WAIT:
+                return False
+            await asyncio.sleep(wait)
+            waited += wait
+
+    @staticmethod
+    async def _run_blocking(fn, *args):
+        """Appel bloquant (transaction SQLite du limiteur) hors de la boucle."""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """Disjoncteur du modèle (créé au premier appel)."""
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = CircuitBreaker()
+        return breaker
+
+    # ── Requêtes multiples ───────────────────────────────────────────────────
+
+    async def query_all(self, prompt: str, system_prompt: str = None) -> Dict[str, str]:
         """Interroge tous les modèles configurés en parallèle."""
-        results = {}
-        async with aiohttp.ClientSession() as session:
-            tasks = [self.query_model(prompt, model, session=session) for model in self.models]
-            responses = await asyncio.gather(*tasks, return_exceptions=True)
-            for model, response in zip(self.models, responses):
-                results[model] = response if isinstance(response, str) else ""
-        return results
-
-    async def query_all_parallel(self, prompts: List[str], max_workers: int = 3) -> Dict[str, str]:
+        responses = await asyncio.gather(
+            *(self.query_model(prompt, model, system_prompt=system_prompt) for model in self.models),
+            return_exceptions=True
+        )
+        return {model: response if isinstance(response, str) else ""
+                for model, response in zip(self.models, responses)}
+
+    async def query_all_parallel(self, prompts: List[str], max_workers: int = 3,
+                                 system_prompt: str = None) -> Dict[str, str]:
         """
         Interroge le(s) modèle(s) en parallèle pour une liste de prompts.
         Utilise un semaphore pour limiter le nombre de requêtes concurrentes.
+        Retourne {prompt: response_text} (avec le modèle principal).
         """
         if not self.models:
             return {}
 
         primary_model = self.models[0]
-        results: Dict[str, str] = {}
         semaphore = asyncio.Semaphore(max_workers)
 
         async def limited_query(prompt: str) -> str:
             async with semaphore:
-                return await self.query_model(prompt, primary_model)
+                return await self.query_model(prompt, primary_model, system_prompt=system_prompt)
 
-        tasks = [limited_query(prompt) for prompt in prompts]
-        responses = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for prompt, response in zip(prompts, responses):
-            results[prompt] = response if isinstance(response, str) else ""
+        responses = await asyncio.gather(*(limited_query(prompt) for prompt in prompts),
+                                         return_exceptions=True)
+        return {prompt: response if isinstance(response, str) else ""
+                for prompt, response in zip(prompts, responses)}
 
-        return results
-
-    async def query_all_models_for_prompt(self, prompt: str) -> Dict[str, str]:
+    async def query_all_models_for_prompt(self, prompt: str, system_prompt: str = None) -> Dict[str, str]:
         """Interroge TOUS les modèles pour un seul prompt en parallèle via asyncio.gather."""
-        if len(self.models) <= 1:
-            return await self.query_all(prompt)
+        return await self.query_all(prompt, system_prompt=system_prompt)
+
+    async def query_matrix(self, prompts: List[str], models: Optional[List[str]] = None,
+                           system_prompt: str = None, use_cache: bool = True,
+                           max_concurrency: int = None, per_model_limit: int = None,
+                           priority: str = INTERACTIVE,
+                           generation: Optional[Dict] = None) -> Dict[str, Dict[str, Dict]]:
+        """
+        Matrice prompts × modèles, même contrat que LLMClient.query_matrix :
+        {prompt: {model: {'response', 'latency_ms', 'error', 'usage'}}}. Les plafonds
+        global et par modèle sont des sémaphores asyncio : une cellule en
+        attente d'un modèle saturé n'occupe aucun worker.
+        """
+        models = list(models or self.models)
+        prompts = list(dict.fromkeys(prompts))
+        per_model_limit = per_model_limit or LLM_MODEL_CONCURRENCY
+        overall = asyncio.Semaphore(max_concurrency or LLM_MAX_CONCURRENCY)
+        limits = {model: asyncio.Semaphore(per_model_limit) for model in models}
+
+        async def _cell(prompt: str, model: str) -> Dict:
+            async with limits[model], overall:
+                started = time.perf_counter()
+                text, error, usage = await self._query(prompt, model, use_cache, system_prompt,
+                                                       priority=priority, generation=generation)
+                latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            return {'response': text, 'latency_ms': latency_ms, 'error': error, 'usage': usage}
+
+        cells = [(prompt, model) for prompt in prompts for model in models]
+        print(f"\n[MATRIX async] {len(prompts)} prompts × {len(models)} modèles…")
+        outcomes = await asyncio.gather(*(_cell(prompt, model) for prompt, model in cells),
+                                        return_exceptions=True)
 
-        results: Dict[str, str] = {}
-        async with aiohttp.ClientSession() as session:
-            tasks = [self.query_model(prompt, model, session=session) for model in self.models]
-            responses = await asyncio.gather(*tasks, return_exceptions=True)
-            for model, response in zip(self.models, responses):
-                results[model] = response if isinstance(response, str) else ""
-        return results
+        matrix: Dict[str, Dict[str, Dict]] = {prompt: {} for prompt in prompts}
+        for (prompt, model), outcome in zip(cells, outcomes):
+            if isinstance(outcome, BaseException):
+                outcome = {'response': '', 'latency_ms': None,
+                           'error': f"{type(outcome).__name__}: {outcome}", 'usage': None}
+            matrix[prompt][model] = outcome
+        return matrix
+
+    def run_matrix(self, prompts: List[str], **kwargs) -> Dict[str, Dict[str, Dict]]:
+        """
+        Point d'entrée bloquant pour le scheduler : exécute query_matrix dans
+        sa propre boucle puis ferme la session (et ses sockets) du run.
+        """
+        async def _run():
+            try:
+                return await self.query_matrix(prompts, **kwargs)
+            finally:
+                await self.close()
+        return asyncio.run(_run())
+
+    # ── Helpers ─────────────────────────────────────────────────────────────
 
     def get_active_models(self) -> Dict[str, bool]:
         return self.clients
 
     def get_cache_stats(self) -> dict:
-        return {'size': len(self.cache), 'keys': list(self.cache.keys())[:5]}
+        """Taille, limites et compteurs hits/misses/evictions/expirations."""
+        return self.cache.stats()
+
+    def get_coalesce_stats(self) -> dict:
+        """Requêtes exécutées vs regroupées par le single-flight."""
+        return self._flights.stats()
+
+    def get_breaker_stats(self) -> Dict[str, dict]:
+        """État du disjoncteur de chaque modèle déjà interrogé."""
+        return {model: breaker.stats() for model, breaker in list(self._breakers.items())}
+
+    def get_provider_stats(self) -> Dict[str, dict]:
+        """Charge, erreurs et éjections de chaque endpoint du pool."""
+        return self.pool.stats()
 
     def clear_cache(self) -> None:
-        self.cache = {}
+        self.cache.clear()
         print("[CACHE] vidé")
 
     # Alias legacy pour compatibilité
     def query_ollama(self, prompt: str, model: str = None, use_cache: bool = True) -> str:
-        """Alias legacy — bloquant, à éviter en production."""
-        import requests
+        """Alias legacy — bloquant (session requests partagée), à éviter en production."""
         if not self.api_key:
             return ""
-        
+
         model = model or (self.models[0] if self.models else 'qwen3.5')
         try:
-            resp = requests.post(
+            resp = get_http_session().post(
                 f"{self.base_url}/chat",
                 headers={'Authorization': f'Bearer {self.api_key}'},
-                json={'model': model, 'messages': [{'role': 'user', 'content': prompt}]},
+                json={'model': model, 'messages': [{'role': 'user', 'content': prompt}],
+                      **CHAT_OPTIONS},
                 timeout=self.timeout
             )
             return resp.json().get('message', {}).get('content', '')
         except Exception:
             return ""
+
+
+# ── Registre process-wide ────────────────────────────────────────────────────
+
+_async_clients: Dict[tuple, AsyncLLMClient] = {}
+_async_clients_lock = threading.Lock()
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """
+    AsyncLLMClient partagé pour la configuration courante (même clé que
+    get_llm_client) : cache, single-flight et disjoncteurs survivent d'un
+    run planifié à l'autre ; la session suit la boucle de chaque run.
+    """
+    key = _client_config_key()
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+    with _async_clients_lock:
+        client = _async_clients.get(key)
+        if client is None:
+            client = AsyncLLMClient()
+            _async_clients[key] = client
+    return client
@@ -0,0 +1,186 @@
+"""
+Matcher multi-marques compilé — GEO Monitor
+Une seule alternance regex sur les marques normalisées, construite une fois,
+remplace la boucle « une regex par marque » de BrandAnalyzer.extract_brands.
+"""
+import re
+from typing import Callable, Dict, List, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _boundary_at(text: str, index: int) -> bool:
+    """Vrai si `\\b` est satisfait à `index` à l'intérieur de `text`."""
+    return _is_word_char(text[index - 1]) != _is_word_char(text[index])
+
+
+class BrandMatcher:
+    """
+    Trouve le premier offset de chaque marque en un seul balayage linéaire.
+
+    Le texte doit déjà être normalisé (minuscules, sans accents) avec la même
+    fonction que celle passée au constructeur.
+
+    La regex est un lookahead `(?=\\b(f1|f2|…)\\b)` : il ne consomme rien, donc
+    des marques qui se chevauchent (« Generali » / « Generali Vie ») sont
+    toutes vues à leur vraie position, comme avec une regex par marque.
+    Les alternatives sont triées de la plus longue à la plus courte ; les
+    préfixes d'une forme trouvée qui tombent sur une frontière de mot sont
+    déduits statiquement (`_implied`).
+    """
+
+    def __init__(self, brands: List[str], normalize: Callable[[str], str]):
+        self.brands = list(brands)
+
+        # forme normalisée → marques (deux marques peuvent partager une forme)
+        self._brand_forms: List[Tuple[str, str]] = []
+        forms: Dict[str, None] = {}
+        for brand in self.brands:
+            form = normalize(brand)
+            if not form:
+                # Marque sans caractère ASCII : rien à chercher après normalisation
+                continue
+            self._brand_forms.append((brand, form))
+            forms[form] = None
+
+        ordered = sorted(forms, key=len, reverse=True)
+        self._form_count = len(ordered)
+        self._longest_form = len(ordered[0]) if ordered else 0
+        self._implied: Dict[str, Tuple[str, ...]] = {
+            form: tuple(
+                other for other in ordered
+                if len(other) < len(form) and form.startswith(other) and _boundary_at(form, len(other))
+            )
+            for form in ordered
+        }
+        alternation = '|'.join(re.escape(form) for form in ordered)
+        self._pattern = re.compile(r'(?=\b(' + alternation + r')\b)') if ordered else None
+        # Variante pour `scan` : le lookahead marque les occurrences, `\w+`
+        # consomme chaque mot (un match vide n'est jamais suivi d'un autre
+        # match vide à la même position, le mot est donc toujours lu).
+        self._token_pattern = re.compile(
+            (r'(?=\b(' + alternation + r')\b)|' if ordered else '') + r'\w+'
+        )
+
+    def first_offsets(self, text: str) -> Dict[str, int]:
+        """Retourne {forme normalisée: premier offset} pour les formes trouvées."""
+        found: Dict[str, int] = {}
+        if not text or self._pattern is None:
+            return found
+
+        for match in self._pattern.finditer(text):
+            start = match.start()
+            form = match.group(1)
+            if form not in found:
+                found[form] = start
+            for prefix in self._implied[form]:
+                if prefix not in found:
+                    found[prefix] = start
+            if len(found) == self._form_count:
+                break
+        return found
+
+    def find(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Retourne [(marque, offset)] trié par offset, dans l'ordre des marques
+        configurées en cas d'égalité (même contrat que l'ancienne boucle).
+        """
+        found = self.first_offsets(text)
+        if not found:
+            return []
+        return self._ordered_mentions(found)
+
+    def stream(self) -> 'StreamingBrandMatcher':
+        """Matcher incrémental pour un texte reçu morceau par morceau."""
+        return StreamingBrandMatcher(self)
+
+    def _ordered_mentions(self, found: Dict[str, int]) -> List[Tuple[str, int]]:
+        mentions = [(brand, found[form]) for brand, form in self._brand_forms if form in found]
+        mentions.sort(key=lambda x: x[1])
+        return mentions
+
+    def scan(self, text: str, lexicon: Dict[str, int]):
+        """
+        Balayage unique marques + mots : retourne
+          - mentions    : même résultat que `find(text)` ;
+          - occurrences : {marque: [index du mot de chaque occurrence]} ;
+          - tokens      : [(index du mot, lexicon[mot])] pour les mots du lexique.
+        Contrairement à `find`, le texte est lu jusqu'au bout.
+        """
+        found: Dict[str, int] = {}
+        form_tokens: Dict[str, List[int]] = {}
+        tokens: List[Tuple[int, int]] = []
+        if not text:
+            return [], {}, tokens
+
+        token_idx = 0
+        for match in self._token_pattern.finditer(text):
+            form = match.group(1) if self._pattern is not None else None
+            if form is not None:
+                start = match.start()
+                for hit in (form,) + self._implied[form]:
+                    found.setdefault(hit, start)
+                    form_tokens.setdefault(hit, []).append(token_idx)
+                continue
+            value = lexicon.get(match.group())
+            if value is not None:
+                tokens.append((token_idx, value))
+            token_idx += 1
+
+        occurrences = {
+            brand: form_tokens[form] for brand, form in self._brand_forms if form in form_tokens
+        }
+        return self._ordered_mentions(found), occurrences, tokens
+
+
+class StreamingBrandMatcher:
+    """
+    Premières mentions d'un texte normalisé reçu par morceaux (génération
+    en streaming). Un match n'est retenu que lorsque assez de texte suit
+    sa position pour que la plus longue forme et sa frontière de mot
+    finale soient décidées : une marque coupée entre deux morceaux
+    (« gene » + « rali ») est vue exactement comme dans le texte entier.
+    """
+
+    def __init__(self, matcher: BrandMatcher):
+        self._matcher = matcher
+        self.text = ''
+        self._pos = 0
+        self._found: Dict[str, int] = {}
+        self._reported: set = set()
+
+    def feed(self, chunk: str, final: bool = False) -> List[Tuple[str, int]]:
+        """
+        Ajoute un morceau (déjà normalisé) et retourne les marques citées
+        pour la première fois, [(marque, offset)] triées par offset.
+        `final=True` décide aussi la fin du texte.
+        """
+        matcher = self._matcher
+        self.text += chunk or ''
+        if matcher._pattern is None:
+            return []
+        # Dernière position de départ décidable : forme la plus longue + 1
+        # caractère pour la frontière `\b` qui la suit
+        limit = len(self.text) if final else len(self.text) - matcher._longest_form - 1
+        if limit < self._pos:
+            return []
+
+        for match in matcher._pattern.finditer(self.text, self._pos):
+            start = match.start()
+            if start > limit:
+                break
+            form = match.group(1)
+            for hit in (form,) + matcher._implied[form]:
+                self._found.setdefault(hit, start)
+        self._pos = limit + 1
+
+        fresh = [(brand, offset) for brand, offset in matcher._ordered_mentions(self._found)
+                 if brand not in self._reported]
+        self._reported.update(brand for brand, _ in fresh)
+        return fresh
+
+    def mentions(self) -> List[Tuple[str, int]]:
+        """Toutes les mentions décidées jusqu'ici, même contrat que `find`."""
+        return self._matcher._ordered_mentions(self._found)
@@ -0,0 +1,121 @@
+"""
+Budget de génération — GEO Monitor
+Réglages Ollama par projet et par modèle, stockés dans
+projects.generation_settings :
+
+    {"num_predict": 700, "num_ctx": 4096, "keep_alive": "7h",
+     "models": {"deepseek-v3.1": {"num_predict": 500}}}
+
+  num_predict  tokens générés au plus : le classement est connu bien avant
+               la fin des réponses des modèles bavards
+  num_ctx      fenêtre de contexte (system prompt GEO + question)
+  keep_alive   durée pendant laquelle Ollama garde le modèle chargé
+               ("7h" couvre l'intervalle de 6 h du scheduler)
+
+Priorité : modèle du projet > projet > OLLAMA_NUM_PREDICT / OLLAMA_NUM_CTX /
+OLLAMA_KEEP_ALIVE > défauts d'Ollama. Les variables d'environnement sont lues
+une fois, à l'import (ENV_DEFAULTS).
+"""
+import os
+import re
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+# Importé par llm_client avant son propre load_dotenv() : ENV_DEFAULTS doit voir le .env
+load_dotenv()
+
+GENERATION_KEYS = ('num_predict', 'num_ctx', 'keep_alive')
+# Réglages passés dans `options` de /api/chat (keep_alive est au premier niveau)
+OPTION_KEYS = ('num_predict', 'num_ctx')
+
+_DURATION_RE = re.compile(r'^-?\d+(\.\d+)?(ms|s|m|h)?$')
+_LIMITS = {'num_predict': (1, 32768), 'num_ctx': (256, 262144)}
+
+
+def _env_defaults() -> Dict:
+    defaults = {}
+    for key, env in (('num_predict', 'OLLAMA_NUM_PREDICT'), ('num_ctx', 'OLLAMA_NUM_CTX'),
+                     ('keep_alive', 'OLLAMA_KEEP_ALIVE')):
+        value = os.getenv(env, '').strip()
+        if value:
+            defaults[key] = value
+    try:
+        return _normalize_values(defaults, 'env')
+    except ValueError as e:
+        print(f"[GENERATION] réglages .env ignorés : {e}")
+        return {}
+
+
+def _normalize_values(raw: Dict, where: str) -> Dict:
+    values = {}
+    for key in GENERATION_KEYS:
+        value = raw.get(key)
+        if value is None or value == '':
+            continue
+        if key == 'keep_alive':
+            if isinstance(value, bool) or not _DURATION_RE.match(str(value).strip()):
+                raise ValueError(f"{where}.keep_alive invalide : {value!r} (ex. 300, \"30m\", \"7h\", -1)")
+            text = str(value).strip()
+            values[key] = int(text) if text.lstrip('-').isdigit() else text
+            continue
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{where}.{key} doit être un entier : {value!r}")
+        low, high = _LIMITS[key]
+        if isinstance(value, bool) or not low <= number <= high:
+            raise ValueError(f"{where}.{key} hors limites [{low}, {high}] : {value!r}")
+        values[key] = number
+    return values
+
+
+# Défauts .env, validés une seule fois (un .env invalide n'est signalé qu'au démarrage)
+ENV_DEFAULTS = _env_defaults()
+
+
+def normalize_generation_settings(raw: Optional[Dict]) -> Dict:
+    """
+    Valide et nettoie des réglages de projet (clés inconnues ignorées).
+    Lève ValueError avec un message affichable si une valeur est invalide.
+    """
+    if not raw:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("generation_settings doit être un objet JSON")
+    settings = _normalize_values(raw, 'generation_settings')
+    models = raw.get('models') or {}
+    if not isinstance(models, dict):
+        raise ValueError("generation_settings.models doit être un objet {modèle: réglages}")
+    overrides = {}
+    for model, values in models.items():
+        if not isinstance(values, dict):
+            raise ValueError(f"generation_settings.models[{model!r}] doit être un objet")
+        normalized = _normalize_values(values, f"generation_settings.models[{model!r}]")
+        if normalized:
+            overrides[str(model)] = normalized
+    if overrides:
+        settings['models'] = overrides
+    return settings
+
+
+def resolve_generation(settings: Optional[Dict], model: str) -> Dict:
+    """
+    Réglages effectifs pour un modèle : {'options': {...}, 'keep_alive': …},
+    clés absentes quand rien n'est configuré ({} = comportement d'Ollama).
+    """
+    merged = dict(ENV_DEFAULTS)
+    if settings:
+        merged.update({key: settings[key] for key in GENERATION_KEYS if key in settings})
+        merged.update((settings.get('models') or {}).get(model, {}))
+    resolved = {}
+    options = {key: merged[key] for key in OPTION_KEYS if key in merged}
+    if options:
+        resolved['options'] = options
+    if 'keep_alive' in merged:
+        resolved['keep_alive'] = merged['keep_alive']
+    return resolved
+
+
+def cache_options(base: Dict, budget: Dict) -> Dict:
+    """Options qui entrent dans la clé de cache (keep_alive ne change pas la réponse)."""
+    return {**base, 'options': budget['options']} if budget.get('options') else base
@@ -0,0 +1,162 @@
+"""
+Requêtes « hedgées » — GEO Monitor
+Quand une requête n'a pas répondu au p90 de latence observé pour son
+modèle, un doublon part et la première réponse valide l'emporte : une
+réponse lente d'Ollama Cloud ne retient plus tout le prompt jusqu'au
+fallback démo.
+
+Opt-in (OLLAMA_HEDGE=1) et borné : au plus OLLAMA_HEDGE_BUDGET doublons
+par requête primaire et par modèle. La requête perdante n'est pas
+interrompue (requests ne sait pas annuler un appel en vol), sa réponse
+est ignorée, ou rendue à `on_discard` (flux à fermer).
+
+En streaming, seule l'ouverture du flux (jusqu'au premier morceau) est
+hedgée, au quantile du TTFB observé sous la clé "<modèle>/stream".
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+HEDGE_ENABLED = os.getenv('OLLAMA_HEDGE', '').lower() in ('1', 'true', 'yes')
+# Doublons autorisés par requête primaire (0.1 = +10 % de requêtes au plus)
+HEDGE_BUDGET = float(os.getenv('OLLAMA_HEDGE_BUDGET', '0.1'))
+HEDGE_QUANTILE = float(os.getenv('OLLAMA_HEDGE_QUANTILE', '0.9'))
+# Latences observées avant de se fier au quantile
+HEDGE_MIN_SAMPLES = int(os.getenv('OLLAMA_HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WINDOW = 200
+
+# (texte, erreur ou None, compteurs de tokens ou None)
+Result = Tuple[str, Optional[str], Optional[Dict]]
+
+
+class HedgePolicy:
+    """
+    Exécute un appel (texte, erreur, usage) avec hedging au quantile de latence
+    du modèle. Les latences des appels réussis alimentent une fenêtre
+    glissante par modèle.
+    """
+
+    def __init__(self, budget: float = HEDGE_BUDGET, quantile: float = HEDGE_QUANTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, max_workers: int = 16,
+                 clock: Callable[[], float] = time.monotonic):
+        self.budget = budget
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='llm-hedge')
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stats: Dict[str, Dict] = {}
+
+    # ── Observations ─────────────────────────────────────────────────────────
+
+    def _model_stats(self, model: str) -> Dict:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = {'requests': 0, 'hedged': 0, 'hedge_wins': 0,
+                                          'saved_ms': 0.0}
+        return stats
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=HEDGE_WINDOW)).append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Quantile de latence observé (s), ou None tant que l'échantillon est trop petit."""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(self.quantile * len(samples)))]
+
+    def _take_budget(self, model: str) -> bool:
+        with self._lock:
+            stats = self._model_stats(model)
+            if stats['hedged'] + 1 > self.budget * stats['requests']:
+                return False
+            stats['hedged'] += 1
+            return True
+
+    # ── Exécution ────────────────────────────────────────────────────────────
+
+    def run(self, model: str, fn: Callable[[], Result],
+            on_discard: Optional[Callable[[Result], None]] = None) -> Result:
+        """
+        Exécute `fn` ; envoie un doublon si elle dépasse le quantile du modèle.
+        `on_discard` reçoit le résultat de l'appel perdant, quand il finit.
+        """
+        with self._lock:
+            self._model_stats(model)['requests'] += 1
+
+        def _timed() -> Result:
+            began = self._clock()
+            result = fn()
+            if result[1] is None:
+                self.observe(model, self._clock() - began)
+            return result
+
+        delay = self.hedge_delay(model)
+        if delay is None:
+            return _timed()
+
+        started = self._clock()
+        primary = self._executor.submit(_timed)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget(model):
+            return _result(primary)
+
+        print(f"  [{model}] hedge : doublon après {delay * 1000:.0f} ms")
+        hedge = self._executor.submit(_timed)
+        pending = {primary, hedge}
+        winner: Optional[Future] = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if _result(future)[1] is None and winner is None:
+                    winner = future
+        if winner is None:
+            # Les deux ont échoué : la cause de la requête primaire fait foi
+            winner = primary
+        if on_discard is not None:
+            loser = hedge if winner is primary else primary
+            loser.add_done_callback(lambda future: on_discard(_result(future)))
+        if _result(winner)[1] is not None:
+            return _result(winner)
+
+        if winner is hedge:
+            elapsed = self._clock() - started
+            with self._lock:
+                self._model_stats(model)['hedge_wins'] += 1
+
+            def _saved(future: Future) -> None:
+                # Gain réel connu quand la requête primaire finit enfin
+                gain = (self._clock() - started) - elapsed
+                with self._lock:
+                    self._model_stats(model)['saved_ms'] += max(0.0, gain) * 1000
+
+            primary.add_done_callback(_saved)
+        return _result(winner)
+
+    def stats(self) -> Dict[str, Dict]:
+        """{modèle: requêtes, doublons, doublons gagnants, ms économisées, délai de hedge}."""
+        report = {}
+        for model in list(self._stats):
+            delay = self.hedge_delay(model)
+            with self._lock:
+                stats = dict(self._stats[model])
+            stats['saved_ms'] = round(stats['saved_ms'], 1)
+            stats['hedge_delay_ms'] = round(delay * 1000, 1) if delay is not None else None
+            stats['budget'] = self.budget
+            report[model] = stats
+        return report
+
+
+def _result(future: Future) -> Result:
+    try:
+        return future.result()
+    except Exception as e:
+        return "", f"{type(e).__name__}: {e}", None
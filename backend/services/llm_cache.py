@@ -0,0 +1,275 @@
+"""
+Cache de réponses LLM — GEO Monitor
+LRU borné + TTL, clé = hash de (modèle, system prompt, prompt complet,
+options de génération). Remplace la clé `f"{model}:{prompt[:120]}"` qui
+faisait collisionner deux prompts au même préfixe et ignorait le system
+prompt (donc la liste de marques du benchmark).
+
+Deuxième niveau optionnel (OLLAMA_DISK_CACHE=1) : SQLite en WAL dans
+GEO_DATA_DIR, partagé par les workers Gunicorn et le process scheduler.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+LLM_CACHE_SIZE = int(os.getenv('OLLAMA_CACHE_SIZE', '512'))
+# Inférieur à l'intervalle du scheduler (6h) : un run planifié ré-interroge
+# toujours les modèles au lieu de servir la réponse du run précédent
+LLM_CACHE_TTL = int(os.getenv('OLLAMA_CACHE_TTL', '3600'))
+
+DISK_CACHE_ENABLED = os.getenv('OLLAMA_DISK_CACHE', '').lower() in ('1', 'true', 'yes')
+DISK_CACHE_SIZE = int(os.getenv('OLLAMA_DISK_CACHE_SIZE', '5000'))
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+DATA_DIR = os.getenv('GEO_DATA_DIR') or os.path.join(PROJECT_ROOT, 'data')
+DISK_CACHE_PATH = os.path.join(DATA_DIR, 'llm_cache.db')
+
+
+class ResponseCache:
+    """
+    Cache LRU + TTL thread-safe (et coopératif sous gevent).
+    Les entrées expirées sont purgées à la lecture ; l'éviction LRU a lieu
+    à l'écriture quand la taille dépasse `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic,
+                 disk: Optional['DiskResponseCache'] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Niveau disque consulté après la mémoire (None = désactivé)
+        self.disk = disk
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    @staticmethod
+    def make_key(model: str, prompt: str, system_prompt: Optional[str] = None,
+                 options: Optional[Dict] = None) -> str:
+        """Hash stable de tout ce qui détermine la réponse du modèle."""
+        material = json.dumps([model, system_prompt or '', prompt, options or {}],
+                              ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is None and self.disk is not None:
+            entry = self.disk.get_with_ttl(key)
+            if entry is not None:
+                # Promotion : les lectures suivantes restent en mémoire,
+                # sans prolonger la durée de vie restante sur disque
+                value, remaining = entry
+                self._set_memory(key, value, ttl=min(remaining, self.ttl))
+        return value
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        self._set_memory(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value, self.ttl)
+
+    def _set_memory(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self) -> None:
+        """Vide la mémoire et, s'il est actif, le niveau disque partagé."""
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self._clock()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0.0
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
+
+
+class DiskResponseCache:
+    """
+    Niveau disque du cache : SQLite en WAL, partagé entre process.
+    TTL en temps absolu (time.time) puisque plusieurs process le lisent ;
+    éviction LRU sur `accessed_at` quand la table dépasse `max_entries`.
+    Une erreur SQLite n'empêche jamais l'appel LLM : elle compte comme miss.
+    """
+
+    PRUNE_EVERY = 32    # écritures entre deux contrôles de taille
+
+    def __init__(self, path: str = DISK_CACHE_PATH, max_entries: int = DISK_CACHE_SIZE,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._writes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par process (jamais héritée d'un fork)
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA busy_timeout = 5000')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key         TEXT PRIMARY KEY,
+                    value       TEXT NOT NULL,
+                    expires_at  REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)')
+            conn.commit()
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_with_ttl(key)
+        return entry[0] if entry is not None else None
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        """Retourne (valeur, secondes de vie restantes) ou None."""
+        now = self._clock()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute('SELECT value, expires_at FROM llm_cache WHERE key = ?',
+                                   (key,)).fetchone()
+                if row is None or row[1] <= now:
+                    if row is not None:
+                        conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+                        conn.commit()
+                    self._stats['misses'] += 1
+                    return None
+                conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+                conn.commit()
+                self._stats['hits'] += 1
+                return row[0], row[1] - now
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            print(f"[CACHE DISK] lecture impossible : {e}")
+            return None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = self._clock()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?)', (key, value, now + ttl, now)
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune(conn, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            print(f"[CACHE DISK] écriture impossible : {e}")
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,))
+        overflow = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                'DELETE FROM llm_cache WHERE key IN '
+                '(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)', (overflow,)
+            )
+
+    def prune(self) -> None:
+        """Purge immédiate des entrées expirées et du dépassement de taille."""
+        try:
+            with self._lock:
+                conn = self._connection()
+                self._prune(conn, self._clock())
+                conn.commit()
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            print(f"[CACHE DISK] purge impossible : {e}")
+
+    def clear(self) -> None:
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute('DELETE FROM llm_cache')
+                conn.commit()
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            print(f"[CACHE DISK] vidage impossible : {e}")
+
+    def __len__(self) -> int:
+        try:
+            with self._lock:
+                return self._connection().execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['size'] = len(self)
+        stats['max_entries'] = self.max_entries
+        stats['path'] = self.path
+        return stats
+
+
+_disk_cache: Optional[DiskResponseCache] = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache() -> Optional[DiskResponseCache]:
+    """Niveau disque partagé du process, ou None si OLLAMA_DISK_CACHE est inactif."""
+    global _disk_cache
+    if not DISK_CACHE_ENABLED:
+        return None
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = DiskResponseCache()
+    return _disk_cache
@@ -3,15 +3,88 @@ LLM Client — GEO Monitor Sprint 1 + FIX timeout
 TIMEOUT réduit à 10s : fail fast → fallback démo immédiat
 Au lieu d'attendre 30-90s et tuer le worker Gunicorn.
 """
+import itertools
 import os
+import threading
+import time
 import requests
-from typing import Dict, List
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+
+from services.llm_cache import ResponseCache, get_disk_cache
+from services.resilience import (CircuitBreaker, RetryPolicy, RETRYABLE_STATUS,
+                                 parse_retry_after)
+from services.generation import cache_options, resolve_generation
+from services.hedging import HEDGE_ENABLED, HedgePolicy
+from services.rate_limiter import (INTERACTIVE, RateLimiter, estimate_tokens,
+                                   get_rate_limiter)
+from services.provider_pool import Endpoint, ProviderPool
+from services.singleflight import SingleFlight
+from services.telemetry import LLMTelemetry
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 load_dotenv()
 
 
+# ── Session HTTP partagée (process-wide) ─────────────────────────────────────
+# Une seule requests.Session par process : les connexions keep-alive vers
+# OLLAMA_BASE_URL sont réutilisées d'un prompt à l'autre au lieu de payer
+# un handshake TCP + TLS par appel.
+
+# Connexions gardées par hôte : au moins autant que d'appels simultanés
+# (workers des ThreadPoolExecutor, greenlets des streams)
+HTTP_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '16'))
+
+# Options de génération envoyées à /chat (font partie de la clé de cache)
+CHAT_OPTIONS = {'think': False, 'stream': False}
+STREAM_CHAT_OPTIONS = {**CHAT_OPTIONS, 'stream': True}
+
+# Matrice prompts × modèles (query_matrix) : appels en vol au total et par
+# modèle ; garder le total ≤ OLLAMA_POOL_SIZE pour réutiliser les connexions
+LLM_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', '8'))
+LLM_MODEL_CONCURRENCY = int(os.getenv('OLLAMA_MODEL_CONCURRENCY', '4'))
+
+# Génération en streaming (NDJSON) pour les routes SSE, et arrêt dès que
+# le bloc JSON de classement est refermé (la suite n'est pas analysée)
+LLM_STREAMING = os.getenv('OLLAMA_STREAM', '1').lower() in ('1', 'true', 'yes')
+LLM_STOP_AFTER_JSON = os.getenv('OLLAMA_STOP_AFTER_JSON', '1').lower() in ('1', 'true', 'yes')
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Retourne la requests.Session partagée (créée au premier appel).
+    Recréée après un fork (gunicorn preload_app) : les sockets du process
+    parent ne sont jamais partagés entre workers.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                # Pas de retry transport : le fail-fast reste géré par les appelants
+                # pool_connections = hôtes gardés (un par nœud d'OLLAMA_PROVIDERS)
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_POOL_SIZE,
+                                      max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def reset_http_session() -> None:
+    """Ferme la session partagée (ex. après un fork ou en test)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
 class LLMClient:
     """Client unifié pour Ollama Cloud — supporte N modèles avec une seule clé API."""
 
@@ -21,7 +94,23 @@ class LLMClient:
         # Timeout pour Ollama Cloud : 40s (nécessaire pour les réponses LLM)
         # En local : mettre 10-15s
         self.timeout   = int(os.getenv('OLLAMA_TIMEOUT', '40'))
-        self.cache: Dict[str, str] = {}
+        self.streaming = LLM_STREAMING
+        # Mémoire du process, puis disque partagé si OLLAMA_DISK_CACHE=1
+        self.cache = ResponseCache(disk=get_disk_cache())
+        # Coalescence des requêtes identiques en vol
+        self._flights = SingleFlight()
+        # Retries transitoires + un disjoncteur par modèle
+        self.retry_policy = RetryPolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+        # Quota partagé entre process (None si OLLAMA_RATE_LIMIT_* non défini)
+        self.rate_limiter = get_rate_limiter()
+        # Endpoints de chaque modèle (OLLAMA_PROVIDERS, sinon OLLAMA_BASE_URL seul)
+        self.pool = ProviderPool.from_env(self.base_url, self.api_key)
+        # Latences, débit et erreurs par modèle (/api/status, /api/health)
+        self.telemetry = LLMTelemetry()
+        # Doublon au p90 de latence du modèle (opt-in, OLLAMA_HEDGE=1)
+        self.hedging = HedgePolicy(max_workers=HTTP_POOL_SIZE) if HEDGE_ENABLED else None
 
         # ── Chargement des modèles depuis .env ──────────────────────────────
         # Aujourd'hui : OLLAMA_MODELS=qwen3.5
@@ -39,70 +128,429 @@ class LLMClient:
         else:
             print("[LLMClient] OLLAMA_API_KEY manquante — mode démo activé")
 
+    # ── Transport ────────────────────────────────────────────────────────────
+
+    def post_chat(self, messages: List[Dict], model: str = None,
+                  timeout: float = None, stream: bool = False,
+                  endpoint: Optional[Endpoint] = None,
+                  budget: Optional[Dict] = None) -> requests.Response:
+        """
+        POST /chat via la session partagée (keep-alive, pool de connexions).
+        Ne capture pas les exceptions requests : chaque appelant garde sa
+        propre politique (fallback démo, 504/502 côté routes…).
+        `stream=True` demande les morceaux NDJSON d'Ollama, lus au fil de l'eau.
+        Sans `endpoint`, l'appel part vers OLLAMA_BASE_URL. `budget` :
+        num_predict / num_ctx / keep_alive résolus (services.generation).
+        """
+        endpoint = endpoint or self.pool.default
+        return get_http_session().post(
+            endpoint.chat_url,
+            headers=endpoint.headers(),
+            json=endpoint.payload(model or (self.models[0] if self.models else 'qwen3.5'),
+                                  messages, STREAM_CHAT_OPTIONS if stream else CHAT_OPTIONS,
+                                  budget),
+            timeout=timeout or self.timeout,
+            stream=stream
+        )
+
     # ── Requête vers un modèle spécifique ───────────────────────────────────
 
     def query_model(self, prompt: str, model: str, use_cache: bool = True,
-                    system_prompt: str = None) -> str:
-        """Interroge un modèle Ollama Cloud précis. Retourne '' si échec."""
+                    system_prompt: str = None, priority: str = INTERACTIVE,
+                    generation: Optional[Dict] = None) -> str:
+        """
+        Interroge un modèle Ollama Cloud précis. Retourne '' si échec.
+        `priority` : INTERACTIVE (défaut) ou SCHEDULED pour le limiteur de débit.
+        `generation` : projects.generation_settings (num_predict, num_ctx,
+        keep_alive, surcharges par modèle).
+        """
+        content, _, _ = self._query(prompt, model, use_cache, system_prompt, priority, generation)
+        return content
+
+    def _query(self, prompt: str, model: str, use_cache: bool = True,
+               system_prompt: str = None, priority: str = INTERACTIVE,
+               generation: Optional[Dict] = None
+               ) -> Tuple[str, Optional[str], Optional[Dict[str, int]]]:
+        """
+        Comme query_model, avec la cause de l'échec et les compteurs de
+        tokens de l'appel : (texte, erreur ou None, usage ou None).
+        """
         if not self.api_key:
-            return ""
+            return "", 'no_api_key', None
+
+        budget = resolve_generation(generation, model)
+        cache_key = ResponseCache.make_key(model, prompt, system_prompt,
+                                           cache_options(CHAT_OPTIONS, budget))
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            self.telemetry.record_cache(model, cached is not None)
+            if cached is not None:
+                print(f"  [CACHE] {model[:20]}")
+                return cached, None, None
+
+        # Requête identique déjà en vol (autre utilisateur, scheduler) : on
+        # attend son résultat au lieu d'envoyer un doublon
+        (content, error, usage), shared = self._flights.do(
+            cache_key, lambda: self._fetch_model(prompt, model, system_prompt, priority, budget)
+        )
+        if shared:
+            print(f"  [{model}] réponse partagée (single-flight)")
+        elif use_cache and content:
+            self.cache.set(cache_key, content)
+        return content, error, usage
 
-        cache_key = f"{model}:{prompt[:120]}"
-        if use_cache and cache_key in self.cache:
-            print(f"  [CACHE] {model[:20]}")
-            return self.cache[cache_key]
+    def _fetch_model(self, prompt: str, model: str, system_prompt: str = None,
+                     priority: str = INTERACTIVE, budget: Optional[Dict] = None
+                     ) -> Tuple[str, Optional[str], Optional[Dict[str, int]]]:
+        """Appel HTTP effectif, doublé au p90 du modèle si le hedging est actif."""
+        if self.hedging is None:
+            return self._fetch_once(prompt, model, system_prompt, priority, budget)
+        return self.hedging.run(
+            model, lambda: self._fetch_once(prompt, model, system_prompt, priority, budget))
 
-        # Construction des messages (avec system prompt si fourni)
+    def _fetch_once(self, prompt: str, model: str, system_prompt: str = None,
+                    priority: str = INTERACTIVE, budget: Optional[Dict] = None
+                    ) -> Tuple[str, Optional[str], Optional[Dict[str, int]]]:
+        """Un appel HTTP ; ('', erreur, None) si échec."""
+        resp, error, began, endpoint = self._send(self._messages(prompt, system_prompt), model,
+                                                  priority=priority, budget=budget)
+        if resp is None:
+            return "", error, None
+        try:
+            data = resp.json()
+            content = endpoint.parse_content(data)
+        except ValueError as e:
+            print(f"  [{model}] X réponse illisible : {e}")
+            self.pool.release(endpoint, ok=False)
+            self.telemetry.record_error(model, 'invalid_response')
+            return "", 'invalid_response', None
+        self.pool.release(endpoint, ok=True)
+        usage = endpoint.parse_token_counts(data)
+        # Sans streaming, Ollama n'envoie les en-têtes qu'une fois la réponse générée
+        self.telemetry.record_success(model, time.perf_counter() - began,
+                                      ttfb=resp.elapsed.total_seconds(), chars=len(content),
+                                      tokens=usage)
+        if self.rate_limiter is not None:
+            # Usage réel renvoyé par le serveur (tokens du prompt + tokens générés)
+            self.rate_limiter.settle(self._rate_bucket(model),
+                                     estimate_tokens(system_prompt, prompt), endpoint.parse_usage(data))
+        print(f"  [{model}] OK {len(content)} chars"
+              + (f", {usage['eval_count']} tokens" if usage else ''))
+        return content, None if content else 'empty', usage
+
+    @staticmethod
+    def _messages(prompt: str, system_prompt: str = None) -> List[Dict]:
+        """Construction des messages (avec system prompt si fourni)."""
         messages = []
         if system_prompt:
             messages.append({'role': 'system', 'content': system_prompt})
         messages.append({'role': 'user', 'content': prompt})
+        return messages
 
-        # UNE seule tentative (pas de retry) pour fail fast
-        try:
-            print(f"  [{model}] tentative unique (timeout={self.timeout}s)…")
-            resp = requests.post(
-                f"{self.base_url}/chat",
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {self.api_key}'
-                },
-                json={
-                    'model': model,
-                    'messages': messages,
-                    'think': False,
-                    'stream': False
-                },
-                timeout=self.timeout
-            )
-            resp.raise_for_status()
-            content = resp.json().get('message', {}).get('content', '')
-            print(f"  [{model}] OK {len(content)} chars")
-            if use_cache and content:
-                self.cache[cache_key] = content
-            return content
-
-        except requests.exceptions.Timeout:
-            print(f"  [{model}] X timeout ({self.timeout}s)")
+    def _rate_bucket(self, model: str) -> str:
+        return RateLimiter.bucket_key(self.api_key, model)
+
+    def _send(self, messages: List[Dict], model: str, stream: bool = False,
+              priority: str = INTERACTIVE, budget: Optional[Dict] = None
+              ) -> Tuple[Optional[requests.Response], Optional[str], float, Optional[Endpoint]]:
+        """
+        POST /chat sous le disjoncteur du modèle : (réponse, None, début de
+        la tentative réussie en perf_counter, endpoint) ou (None, cause,
+        début, None) — breaker_open, rate_limited, timeout, http_<code>,
+        connection, error. En cas de succès, l'appelant rend l'endpoint au
+        pool (self.pool.release) une fois la réponse lue ; chaque tentative
+        part vers l'endpoint le moins chargé du modèle.
+        Chaque tentative attend d'abord son créneau dans le limiteur de débit
+        partagé (OLLAMA_RATE_LIMIT_*) ; chaque échec est compté dans la
+        télémétrie du modèle.
+        Erreurs de connexion et codes transitoires (429, 5xx) réessayés avec
+        backoff + jitter (Retry-After respecté) ; un timeout n'est pas
+        réessayé, il a déjà coûté OLLAMA_TIMEOUT secondes. Le disjoncteur
+        du modèle compte un échec par appel, retries compris.
+        """
+        breaker = self.breaker(model)
+        if not breaker.allow():
+            print(f"  [{model}] X disjoncteur ouvert (réessai dans {breaker.retry_in():.0f}s)")
+            self.telemetry.record_error(model, 'breaker_open')
+            return None, 'breaker_open', time.perf_counter(), None
+
+        limiter, bucket = self.rate_limiter, self._rate_bucket(model)
+        tokens = estimate_tokens(*(message['content'] for message in messages))
+
+        attempt, endpoint = 0, None
+        while True:
+            attempt += 1
+            retry_after = None
+            if limiter is not None and not limiter.acquire(bucket, tokens, priority):
+                print(f"  [{model}] X quota local épuisé ({priority})")
+                if attempt == 1:
+                    # Rien n'est parti : ni échec pour le disjoncteur, ni essai consommé
+                    breaker.release()
+                    self.telemetry.record_error(model, 'rate_limited')
+                    return None, 'rate_limited', time.perf_counter(), None
+                error = 'rate_limited'
+                self.telemetry.record_error(model, error)
+                break
+            # Un nouvel essai part de préférence vers un autre nœud
+            endpoint, remote_model = self.pool.acquire(model, exclude=endpoint)
+            began = time.perf_counter()
+            try:
+                print(f"  [{model}] tentative {attempt}/{self.retry_policy.attempts} (timeout={self.timeout}s)…")
+                resp = self.post_chat(messages, remote_model, stream=stream, endpoint=endpoint,
+                                      budget=budget)
+                resp.raise_for_status()
+                breaker.record_success()
+                return resp, None, began, endpoint
+
+            except requests.exceptions.Timeout:
+                print(f"  [{model}] X timeout ({self.timeout}s)")
+                error, retryable = 'timeout', False
+            except requests.exceptions.HTTPError as e:
+                code = e.response.status_code if e.response is not None else None
+                print(f"  [{model}] X HTTP {code or '?'}")
+                error, retryable = f"http_{code or 'error'}", code in RETRYABLE_STATUS
+                if code in (429, 503):
+                    retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+                if code == 429 and limiter is not None:
+                    limiter.drain(bucket)
+            except requests.exceptions.ConnectionError as e:
+                print(f"  [{model}] X connexion : {e}")
+                error, retryable = 'connection', True
+            except Exception as e:
+                print(f"  [{model}] X {type(e).__name__}: {e}")
+                error, retryable = 'error', False
+
+            self.pool.release(endpoint, ok=False)
+            self.telemetry.record_error(model, error)
+            if not retryable:
+                break
+            delay = self.retry_policy.delay(attempt, retry_after)
+            if delay is None:
+                break
+            print(f"  [{model}] nouvel essai dans {delay:.1f}s")
+            time.sleep(delay)
+
+        breaker.record_failure()
+        return None, error, time.perf_counter(), None
+
+    # ── Génération en streaming ─────────────────────────────────────────────
+
+    def query_model_stream(self, prompt: str, model: str, system_prompt: str = None,
+                           on_chunk: Optional[Callable[[str], None]] = None,
+                           stop_when: Optional[Callable[[], bool]] = None,
+                           use_cache: bool = True, generation: Optional[Dict] = None) -> str:
+        """
+        Interroge un modèle en streaming (NDJSON) et retourne le texte reçu,
+        '' si échec. `on_chunk` reçoit chaque morceau de contenu ; si
+        `stop_when()` devient vrai, la connexion est fermée, ce qui arrête la
+        génération côté Ollama (jetons et temps économisés).
+        Single-flight comme query_model : un flux identique déjà en vol n'est
+        pas redemandé, l'appelant regroupé reçoit le texte final du meneur
+        en un seul morceau.
+        """
+        if not self.api_key:
             return ""
-        except requests.exceptions.HTTPError as e:
-            code = e.response.status_code if e.response else '?'
-            print(f"  [{model}] X HTTP {code}")
+
+        budget = resolve_generation(generation, model)
+        cache_key = ResponseCache.make_key(model, prompt, system_prompt,
+                                           cache_options(STREAM_CHAT_OPTIONS, budget))
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            self.telemetry.record_cache(model, cached is not None)
+            if cached is not None:
+                print(f"  [CACHE] {model[:20]}")
+                if on_chunk:
+                    on_chunk(cached)
+                return cached
+
+        content, shared = self._flights.do(
+            cache_key, lambda: self._stream_once(prompt, model, system_prompt, on_chunk,
+                                                 stop_when, budget))
+        if shared:
+            print(f"  [{model}] flux partagé (single-flight)")
+            if on_chunk and content:
+                on_chunk(content)
+        elif use_cache and content:
+            self.cache.set(cache_key, content)
+        return content
+
+    def _stream_once(self, prompt: str, model: str, system_prompt: str = None,
+                     on_chunk: Optional[Callable[[str], None]] = None,
+                     stop_when: Optional[Callable[[], bool]] = None,
+                     budget: Optional[Dict] = None) -> str:
+        """
+        Un appel en streaming ; '' si échec. Avec le hedging, l'ouverture du
+        flux (jusqu'au premier morceau) est doublée au quantile du TTFB du
+        modèle ; le flux perdant est fermé dès qu'il répond.
+        """
+        messages = self._messages(prompt, system_prompt)
+        if self.hedging is None:
+            opened, _, _ = self._open_stream(messages, model, budget)
+        else:
+            opened, _, _ = self.hedging.run(
+                f"{model}/stream", lambda: self._open_stream(messages, model, budget),
+                on_discard=lambda result: self._discard_stream(result, model, prompt,
+                                                               system_prompt))
+        if opened is None:
             return ""
-        except Exception as e:
-            print(f"  [{model}] X {type(e).__name__}: {e}")
+        resp, endpoint, began, lines, head = opened
+
+        parts: List[str] = []
+        stopped = False
+        ttfb = usage = None
+        ok = False
+        try:
+            rest = (endpoint.parse_stream_line(line) for line in lines if line)
+            for piece, done, counts in itertools.chain(head, rest):
+                # Compteurs dans le dernier morceau (absents si le flux est coupé)
+                usage = counts or usage
+                if piece:
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - began
+                    parts.append(piece)
+                    if on_chunk:
+                        on_chunk(piece)
+                if done:
+                    break
+                if stop_when is not None and stop_when():
+                    stopped = True
+                    break
+            ok = True
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"  [{model}] X flux interrompu : {type(e).__name__}: {e}")
+            self.breaker(model).record_failure()
+            self.telemetry.record_error(model, 'stream_interrupted')
             return ""
+        finally:
+            resp.close()
+            self.pool.release(endpoint, ok)
+
+        content = ''.join(parts)
+        self.telemetry.record_success(model, time.perf_counter() - began, ttfb=ttfb,
+                                      chars=len(content), tokens=usage)
+        if self.rate_limiter is not None:
+            # Usage du dernier morceau ; flux coupé après le JSON : estimation
+            # sur le texte reçu (Ollama s'arrête à la fermeture de la connexion)
+            actual = (usage['prompt_eval_count'] + usage['eval_count'] if usage
+                      else estimate_tokens(system_prompt, prompt, content, expected_output=0))
+            self.rate_limiter.settle(self._rate_bucket(model),
+                                     estimate_tokens(system_prompt, prompt), actual)
+        print(f"  [{model}] OK {len(content)} chars (stream{', arrêt après le JSON' if stopped else ''})")
+        return content
+
+    def _open_stream(self, messages: List[Dict], model: str, budget: Optional[Dict] = None
+                     ) -> Tuple[Optional[tuple], Optional[str], None]:
+        """
+        Ouvre le flux et lit jusqu'au premier morceau de contenu (ou la fin) :
+        ((réponse, endpoint, début, lignes restantes, morceaux lus), None, None)
+        ou (None, cause, None). Forme (résultat, erreur, usage) de HedgePolicy.
+        """
+        resp, error, began, endpoint = self._send(messages, model, stream=True, budget=budget)
+        if resp is None:
+            return None, error, None
+        head = []
+        try:
+            lines = iter(resp.iter_lines())
+            for line in lines:
+                if not line:
+                    continue
+                head.append(endpoint.parse_stream_line(line))
+                piece, done, _ = head[-1]
+                if piece or done:
+                    break
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"  [{model}] X flux interrompu : {type(e).__name__}: {e}")
+            resp.close()
+            self.pool.release(endpoint, ok=False)
+            self.breaker(model).record_failure()
+            self.telemetry.record_error(model, 'stream_interrupted')
+            return None, 'stream_interrupted', None
+        return (resp, endpoint, began, lines, head), None, None
+
+    def _discard_stream(self, result: Tuple[Optional[tuple], Optional[str], None], model: str,
+                        prompt: str, system_prompt: str = None) -> None:
+        """Ferme le flux perdant d'un hedge (Ollama arrête alors la génération)."""
+        opened = result[0]
+        if opened is None:
+            return
+        resp, endpoint, _, _, head = opened
+        resp.close()
+        self.pool.release(endpoint, ok=True)
+        print(f"  [{model}] hedge : flux perdant fermé")
+        if self.rate_limiter is not None:
+            received = ''.join(piece for piece, _, _ in head if piece)
+            self.rate_limiter.settle(self._rate_bucket(model),
+                                     estimate_tokens(system_prompt, prompt),
+                                     estimate_tokens(system_prompt, prompt, received,
+                                                     expected_output=0))
+
+    def query_all_models_for_prompt_stream(self, prompt: str, system_prompt: str = None,
+                                           make_extractor: Callable = None,
+                                           on_mention: Optional[Callable[[str, str], None]] = None,
+                                           generation: Optional[Dict] = None
+                                           ) -> Dict[str, str]:
+        """
+        Version streaming de query_all_models_for_prompt.
+        `make_extractor()` fournit un extracteur par modèle (voir
+        BrandAnalyzer.stream_extractor) ; `on_mention(model, marque)` est
+        appelé à la première citation de chaque marque, avant la fin de la
+        réponse. Retourne {model_name: response_text}.
+        """
+        def _one(model: str) -> str:
+            extractor = make_extractor() if make_extractor else None
+            if extractor is None:
+                return self.query_model_stream(prompt, model, system_prompt=system_prompt,
+                                               generation=generation)
+
+            def _on_chunk(piece: str) -> None:
+                for brand in extractor.feed(piece):
+                    if on_mention:
+                        on_mention(model, brand)
+
+            stop_when = (lambda: extractor.closed) if LLM_STOP_AFTER_JSON else None
+            text = self.query_model_stream(prompt, model, system_prompt=system_prompt,
+                                           on_chunk=_on_chunk, stop_when=stop_when,
+                                           generation=generation)
+            if text and on_mention:
+                for brand in extractor.feed('', final=True):
+                    on_mention(model, brand)
+            return text
+
+        if len(self.models) <= 1:
+            return {model: _one(model) for model in self.models}
+
+        results: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=len(self.models)) as executor:
+            future_map = {executor.submit(_one, model): model for model in self.models}
+            for future in as_completed(future_map):
+                model = future_map[future]
+                try:
+                    results[model] = future.result()
+                except Exception as e:
+                    print(f"  [{model}] X {e}")
+                    results[model] = ""
+        return results
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """Disjoncteur du modèle (créé au premier appel)."""
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.setdefault(model, CircuitBreaker())
+        return breaker
 
     # ── Requêtes multiples ───────────────────────────────────────────────────
 
-    def query_all(self, prompt: str, system_prompt: str = None) -> Dict[str, str]:
+    def query_all(self, prompt: str, system_prompt: str = None,
+                  generation: Optional[Dict] = None) -> Dict[str, str]:
         """
         Interroge tous les modèles configurés SÉQUENTIELLEMENT.
         Retourne {model_name: response_text}.
         """
         results = {}
         for model in self.models:
-            results[model] = self.query_model(prompt, model, system_prompt=system_prompt)
+            results[model] = self.query_model(prompt, model, system_prompt=system_prompt,
+                                              generation=generation)
         return results
 
     def query_all_parallel(self, prompts: List[str], max_workers: int = 3,
@@ -135,18 +583,20 @@ class LLMClient:
 
         return results
 
-    def query_all_models_for_prompt(self, prompt: str, system_prompt: str = None) -> Dict[str, str]:
+    def query_all_models_for_prompt(self, prompt: str, system_prompt: str = None,
+                                    generation: Optional[Dict] = None) -> Dict[str, str]:
         """
         Interroge TOUS les modèles configurés pour un seul prompt.
         Retourne {model_name: response_text}.
         """
         if len(self.models) <= 1:
-            return self.query_all(prompt, system_prompt=system_prompt)
+            return self.query_all(prompt, system_prompt=system_prompt, generation=generation)
 
         results: Dict[str, str] = {}
         with ThreadPoolExecutor(max_workers=len(self.models)) as executor:
             future_map = {
-                executor.submit(self.query_model, prompt, model, system_prompt=system_prompt): model
+                executor.submit(self.query_model, prompt, model, system_prompt=system_prompt,
+                                generation=generation): model
                 for model in self.models
             }
             for future in as_completed(future_map):
@@ -158,16 +608,95 @@ class LLMClient:
                     results[model] = ""
         return results
 
+    def query_matrix(self, prompts: List[str], models: Optional[List[str]] = None,
+                     system_prompt: str = None, use_cache: bool = True,
+                     max_concurrency: int = None, per_model_limit: int = None,
+                     priority: str = INTERACTIVE,
+                     generation: Optional[Dict] = None) -> Dict[str, Dict[str, Dict]]:
+        """
+        Interroge la matrice complète prompts × modèles en parallèle.
+        Au plus `max_concurrency` appels en vol au total et `per_model_limit`
+        par modèle (quota / charge du fournisseur). Les cellules sont
+        soumises prompt par prompt, modèles entrelacés, pour qu'un modèle
+        plein ne bloque pas les workers des autres.
+        Retourne {prompt: {model: {'response', 'latency_ms', 'error', 'usage'}}}
+        — `error` vaut None en cas de succès (voir _send pour les causes),
+        `usage` donne prompt_eval_count / eval_count (None si servi du cache).
+        """
+        models = list(models or self.models)
+        prompts = list(dict.fromkeys(prompts))
+        max_concurrency = max_concurrency or LLM_MAX_CONCURRENCY
+        per_model_limit = per_model_limit or LLM_MODEL_CONCURRENCY
+        limits = {model: threading.BoundedSemaphore(per_model_limit) for model in models}
+        matrix: Dict[str, Dict[str, Dict]] = {prompt: {} for prompt in prompts}
+        if not prompts or not models:
+            return matrix
+
+        def _cell(prompt: str, model: str) -> Dict:
+            with limits[model]:
+                started = time.perf_counter()
+                text, error, usage = self._query(prompt, model, use_cache, system_prompt,
+                                                 priority, generation)
+                latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            return {'response': text, 'latency_ms': latency_ms, 'error': error, 'usage': usage}
+
+        cells = [(prompt, model) for prompt in prompts for model in models]
+        workers = max(1, min(max_concurrency, len(cells)))
+        print(f"\n[MATRIX] {len(prompts)} prompts × {len(models)} modèles "
+              f"({workers} en vol max, {per_model_limit}/modèle)…")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            future_map = {executor.submit(_cell, prompt, model): (prompt, model)
+                          for prompt, model in cells}
+            for i, future in enumerate(as_completed(future_map), 1):
+                prompt, model = future_map[future]
+                try:
+                    matrix[prompt][model] = future.result()
+                except Exception as e:
+                    matrix[prompt][model] = {'response': '', 'latency_ms': None,
+                                             'error': f"{type(e).__name__}: {e}", 'usage': None}
+                cell = matrix[prompt][model]
+                print(f"  [{i}/{len(cells)}] {model} {'OK' if cell['error'] is None else 'X ' + cell['error']} "
+                      f"{prompt[:40]}…")
+
+        # Ordre d'entrée (prompts puis modèles) quel que soit l'ordre d'arrivée
+        return {prompt: {model: matrix[prompt][model] for model in models} for prompt in prompts}
+
     # ── Helpers ─────────────────────────────────────────────────────────────
 
     def get_active_models(self) -> Dict[str, bool]:
         return self.clients
 
     def get_cache_stats(self) -> dict:
-        return {'size': len(self.cache), 'keys': list(self.cache.keys())[:5]}
+        """Taille, limites et compteurs hits/misses/evictions/expirations."""
+        return self.cache.stats()
+
+    def get_coalesce_stats(self) -> dict:
+        """Requêtes exécutées vs regroupées par le single-flight."""
+        return self._flights.stats()
+
+    def get_hedge_stats(self) -> dict:
+        """Doublons envoyés / gagnants et temps économisé par modèle ({} si inactif)."""
+        return self.hedging.stats() if self.hedging is not None else {}
+
+    def get_telemetry(self) -> Dict[str, dict]:
+        """Percentiles de latence, débit, timeouts et hits cache par modèle."""
+        return self.telemetry.summary(self.timeout)
+
+    def get_provider_stats(self) -> Dict[str, dict]:
+        """Charge, erreurs et éjections de chaque endpoint du pool."""
+        return self.pool.stats()
+
+    def get_rate_limit_stats(self) -> dict:
+        """Quotas configurés et compteurs du limiteur ({} si inactif)."""
+        return self.rate_limiter.stats() if self.rate_limiter is not None else {}
+
+    def get_breaker_stats(self) -> Dict[str, dict]:
+        """État du disjoncteur de chaque modèle déjà interrogé."""
+        return {model: breaker.stats() for model, breaker in list(self._breakers.items())}
 
     def clear_cache(self) -> None:
-        self.cache = {}
+        self.cache.clear()
         print("[CACHE] vidé")
 
     # ── Alias legacy (gardé pour compat avec app.py existant) ───────────────
@@ -177,3 +706,46 @@ class LLMClient:
         """Alias legacy — utilise le modèle principal si non spécifié."""
         return self.query_model(prompt, model or (self.models[0] if self.models else 'qwen3.5'),
                               use_cache, system_prompt=system_prompt)
+
+
+# ── Registre process-wide ────────────────────────────────────────────────────
+
+_clients: Dict[tuple, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _client_config_key() -> tuple:
+    """Configuration qui détermine un LLMClient (relue à chaque appel)."""
+    return (
+        os.getenv('OLLAMA_BASE_URL', 'https://ollama.com/api'),
+        os.getenv('OLLAMA_API_KEY'),
+        os.getenv('OLLAMA_TIMEOUT', '40'),
+        os.getenv('OLLAMA_MODELS', 'qwen3.5'),
+        os.getenv('OLLAMA_PROVIDERS', ''),
+    )
+
+
+def get_llm_client() -> LLMClient:
+    """
+    Retourne le LLMClient partagé pour la configuration courante.
+    Le cache de réponses et la session HTTP survivent ainsi d'une requête
+    à l'autre ; un changement de configuration (.env rechargé, clé API)
+    donne un nouveau client. Le verrou est coopératif sous gevent
+    (threading est monkey-patché).
+    """
+    key = _client_config_key()
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LLMClient()
+            _clients[key] = client
+    return client
+
+
+def reset_llm_clients() -> None:
+    """Oublie les clients enregistrés (tests, rechargement de configuration)."""
+    with _clients_lock:
+        _clients.clear()
@@ -0,0 +1,380 @@
+"""
+Moteur de métriques vectorisé (NumPy) — GEO Monitor
+Transforme les analyses d'un snapshot en une matrice d'incidence / position
+(lignes = réponse × modèle, colonnes = marques) avec les coordonnées modèle
+et catégorie de chaque ligne. Toutes les tranches (global, par catégorie,
+par modèle) se dérivent ensuite de sommes matricielles, sans re-parcourir
+les analyses une fois par marque.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from services.analysis_record import AnalysisRecord
+
+BOOTSTRAP_RESAMPLES = 1000
+# Part minimale des tirages contenant au moins une réponse du modèle
+BOOTSTRAP_MIN_VALID = 0.9
+
+
+def build_metrics(brands: Sequence[str], mention_counts: Sequence[int],
+                  position_sums: Sequence[int], first_counts: Sequence[int],
+                  total: int) -> Dict:
+    """
+    Construit le dict de métriques à partir des compteurs par marque.
+    Formules et arrondis identiques à l'historique de calculate_metrics.
+    """
+    metrics = {}
+    for brand, mentions_count, positions_sum, first_position_count in zip(
+            brands, mention_counts, position_sums, first_counts):
+        mentions_count = int(mentions_count)
+        positions_sum = int(positions_sum)
+        first_position_count = int(first_position_count)
+
+        mention_rate = (mentions_count / total * 100) if total > 0 else 0
+        avg_position = (positions_sum / mentions_count) if mentions_count > 0 else 0
+        top_of_mind  = (first_position_count / total * 100) if total > 0 else 0
+        avg_sentiment = max(100 - (avg_position * 20), -20) if mentions_count > 0 else 0
+
+        metrics[brand] = {
+            'mention_count':       mentions_count,
+            'mention_rate':        round(mention_rate, 2),
+            'avg_position':        round(avg_position, 2),
+            'top_of_mind':         round(top_of_mind, 2),
+            'first_position_count': first_position_count,
+            'sentiment_score':     round(avg_sentiment, 1)
+        }
+
+    total_mentions = sum(m['mention_count'] for m in metrics.values())
+    for brand in metrics:
+        sov = (metrics[brand]['mention_count'] / total_mentions * 100) if total_mentions > 0 else 0
+        metrics[brand]['share_of_voice'] = round(sov, 2)
+
+    for brand in metrics:
+        score = (
+            metrics[brand]['mention_rate'] * 0.4 +
+            (100 / metrics[brand]['avg_position'] if metrics[brand]['avg_position'] > 0 else 0) * 0.3 +
+            metrics[brand]['share_of_voice'] * 0.2 +
+            metrics[brand]['top_of_mind'] * 0.1 +
+            max(metrics[brand]['sentiment_score'], 0) * 0.1
+        )
+        metrics[brand]['global_score'] = round(score, 2)
+
+    return metrics
+
+
+def bootstrap_weights(n_units: int, n_resamples: int, seed: Optional[int] = 0) -> np.ndarray:
+    """
+    Poids de ré-échantillonnage avec remise : ligne i = nombre de fois que
+    chaque unité est tirée au tirage i (loi multinomiale), via un seul
+    bincount sur les indices tirés — bien plus rapide que rng.multinomial.
+    """
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, n_units, size=(n_resamples, n_units))
+    draws += np.arange(n_resamples)[:, None] * n_units
+    counts = np.bincount(draws.ravel(), minlength=n_resamples * n_units)
+    return counts.reshape(n_resamples, n_units).astype(np.float64)
+
+
+def _percentile_bounds(values: np.ndarray, tail: float) -> np.ndarray:
+    """
+    Percentiles `tail` et `1 - tail` sur l'axe 0 (interpolation linéaire,
+    comme np.percentile) avec un seul tri. Les NaN (tirages écartés) sont
+    ignorés, comme np.nanpercentile ; NaN si une colonne n'a aucune valeur.
+    """
+    ordered = np.sort(values, axis=0)  # NaN en fin de tri
+    last = np.maximum(np.sum(~np.isnan(values), axis=0) - 1, 0)
+    bounds = []
+    for q in (tail, 1 - tail):
+        pos = q * last
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        low = np.take_along_axis(ordered, lo[None], axis=0)[0]
+        high = np.take_along_axis(ordered, hi[None], axis=0)[0]
+        bounds.append(low + (high - low) * (pos - lo))
+    return np.stack(bounds)
+
+
+def _vector_metrics(mentions, position_sums, firsts, totals) -> Dict[str, np.ndarray]:
+    """
+    Version vectorisée (sans arrondis intermédiaires) des formules de
+    build_metrics. `totals` se diffuse sur le dernier axe (marques).
+    """
+    def _ratio(num, den, scale=1.0):
+        out = np.zeros(np.broadcast_shapes(np.shape(num), np.shape(den)))
+        return np.divide(num * scale, den, out=out, where=den > 0)
+
+    mentioned    = mentions > 0
+    mention_rate = mentions * _ratio(100.0, totals)
+    top_of_mind  = firsts * _ratio(100.0, totals)
+    avg_position = _ratio(position_sums, mentions)
+    share        = mentions * _ratio(100.0, mentions.sum(axis=-1, keepdims=True))
+    inverse_pos  = _ratio(100.0, avg_position)
+    # max(sentiment, 0) de build_metrics, nul sans mention
+    sentiment    = np.clip(100 - avg_position * 20, 0, None) * mentioned
+    global_score = (mention_rate * 0.4 + inverse_pos * 0.3 + share * 0.2 +
+                    top_of_mind * 0.1 + sentiment * 0.1)
+    return {'mention_rate': mention_rate, 'avg_position': avg_position, 'global_score': global_score}
+
+
+class _RecordColumns(dict):
+    """
+    Univers de marques d'un AnalysisRecord → colonne de chaque marque
+    (-1 si hors benchmark). Calculé une fois par univers (tuple partagé).
+    """
+
+    def __init__(self, brand_index: Dict[str, int]):
+        super().__init__()
+        self._brand_index = brand_index
+
+    def __missing__(self, brands):
+        cols = [self._brand_index.get(brand, -1) for brand in brands]
+        self[brands] = cols
+        return cols
+
+
+class MetricsCube:
+    """
+    Cube d'incidence d'un snapshot : (réponse × modèle) × marque, avec la
+    catégorie et le modèle de chaque ligne comme coordonnées.
+
+    Les métriques globales, par catégorie ou par modèle gardent exactement
+    le format de BrandAnalyzer.calculate_metrics.
+    """
+
+    def __init__(self, brands: Sequence[str], analyses: Iterable[Dict],
+                 models: Optional[Sequence[str]] = None,
+                 categories: Optional[Sequence[str]] = None,
+                 prompts: Optional[Sequence] = None):
+        # Une marque listée deux fois n'a qu'une entrée dans le dict de métriques
+        self.brands: List[str] = list(dict.fromkeys(brands))
+        brand_index = {brand: idx for idx, brand in enumerate(self.brands)}
+        analyses = list(analyses)
+        n_rows, n_brands = len(analyses), len(self.brands)
+
+        self.mentioned = np.zeros((n_rows, n_brands), dtype=bool)
+        self.positions = np.zeros((n_rows, n_brands), dtype=np.int64)
+        self.first     = np.zeros((n_rows, n_brands), dtype=bool)
+
+        # Remplissage : O(mentions), pas O(marques × analyses)
+        record_columns = _RecordColumns(brand_index)
+        for row, analysis in enumerate(analyses):
+            if type(analysis) is AnalysisRecord:
+                # Chemin rapide : indices de marques → colonnes, sans dicts intermédiaires
+                cols = record_columns[analysis.brands]
+                for pos, idx in enumerate(analysis.order):
+                    col = cols[idx]
+                    if col >= 0:
+                        self.mentioned[row, col] = True
+                        self.positions[row, col] = pos + 1
+                if analysis.order and cols[analysis.order[0]] >= 0:
+                    self.first[row, cols[analysis.order[0]]] = True
+                continue
+            positions = analysis.get('positions') or {}
+            for brand in analysis.get('brands_mentioned', []):
+                col = brand_index.get(brand)
+                if col is None:
+                    continue
+                self.mentioned[row, col] = True
+                self.positions[row, col] = positions.get(brand, 0) or 0
+            col = brand_index.get(analysis.get('first_brand'))
+            if col is not None and self.mentioned[row, col]:
+                self.first[row, col] = True
+
+        self._axes = {}
+        if models is not None:
+            self._axes['model'] = self._encode(models)
+        if categories is not None:
+            self._axes['category'] = self._encode(categories)
+        if prompts is not None:
+            self._axes['prompt'] = self._encode(prompts)
+
+    @classmethod
+    def from_responses(cls, responses: List[Dict], brands: Sequence[str]) -> 'MetricsCube':
+        """Construit le cube depuis `results['responses']` (chaque item a 'llm_analyses')."""
+        analyses, models, categories, prompts = [], [], [], []
+        for idx, response in enumerate(responses):
+            category = response.get('category', 'general')
+            for model, data in response.get('llm_analyses', {}).items():
+                analyses.append(data.get('analysis', {}))
+                models.append(model)
+                categories.append(category)
+                # Unité de ré-échantillonnage du bootstrap : la réponse (prompt)
+                prompts.append(idx)
+        return cls(brands, analyses, models=models, categories=categories, prompts=prompts)
+
+    @staticmethod
+    def _encode(labels: Sequence[str]):
+        """Encode des libellés en indices, dans l'ordre de première apparition."""
+        index: Dict[str, int] = {}
+        codes = np.fromiter((index.setdefault(label, len(index)) for label in labels),
+                            dtype=np.int64, count=len(labels))
+        return list(index), codes
+
+    @property
+    def total(self) -> int:
+        return self.mentioned.shape[0]
+
+    def metrics(self) -> Dict:
+        """Métriques sur l'ensemble des analyses du cube."""
+        return build_metrics(
+            self.brands,
+            self.mentioned.sum(axis=0).tolist(),
+            self.positions.sum(axis=0).tolist(),
+            self.first.sum(axis=0).tolist(),
+            self.total
+        )
+
+    def metrics_by(self, axis: str) -> Dict[str, Dict]:
+        """
+        Métriques pour chaque valeur de `axis` ('model' ou 'category'),
+        calculées en une seule multiplication matricielle par compteur.
+        """
+        labels, codes = self._axes[axis]
+        if not labels:
+            return {}
+
+        # Matrice d'appartenance groupe × ligne
+        membership = np.zeros((len(labels), self.total), dtype=np.int64)
+        membership[codes, np.arange(self.total)] = 1
+
+        totals    = membership.sum(axis=1).tolist()
+        mentions  = (membership @ self.mentioned.astype(np.int64)).tolist()
+        positions = (membership @ self.positions).tolist()
+        firsts    = (membership @ self.first.astype(np.int64)).tolist()
+
+        return {
+            label: build_metrics(self.brands, mentions[idx], positions[idx], firsts[idx], totals[idx])
+            for idx, label in enumerate(labels)
+        }
+
+    def bootstrap_intervals(self, n_resamples: int = BOOTSTRAP_RESAMPLES,
+                            confidence: float = 0.95, seed: Optional[int] = 0) -> Dict:
+        """
+        Intervalles de confiance bootstrap (percentiles) de mention_rate,
+        avg_position et global_score, par modèle et tous modèles confondus.
+
+        Les prompts sont ré-échantillonnés avec remise : chaque tirage est un
+        vecteur de poids multinomial, et tous les tirages × modèles × marques
+        s'obtiennent d'un seul produit matriciel par compteur.
+        La graine fixe par défaut garde les rapports reproductibles.
+
+        Un tirage sans aucune réponse d'un modèle n'est pas un taux de 0 %
+        pour ce modèle : il est écarté de ses percentiles. Si moins de
+        BOOTSTRAP_MIN_VALID des tirages restent, ses intervalles valent None.
+
+        Returns:
+            {'confidence': 0.95, 'resamples': int, 'prompts': int,
+             'valid_resamples': {model: int},
+             'by_model': {model: {brand: {metric: [bas, haut] | None}}},
+             'overall':  {brand: {metric: [bas, haut] | None}}}
+        """
+        prompt_codes = self._axes['prompt'][1] if 'prompt' in self._axes else np.arange(self.total)
+        n_prompts = len(self._axes['prompt'][0]) if 'prompt' in self._axes else self.total
+        models, model_codes = self._axes.get('model', (['all'], np.zeros(self.total, dtype=np.int64)))
+        result = {'confidence': confidence, 'resamples': n_resamples, 'prompts': n_prompts,
+                  'valid_resamples': {}, 'by_model': {}, 'overall': {}}
+        if not n_prompts or not self.brands or not models:
+            return result
+
+        # Compteurs prompt × (modèle, marque), aplatis pour le produit matriciel
+        n_models, n_brands = len(models), len(self.brands)
+        cell = prompt_codes * n_models + model_codes
+        shape = (n_prompts * n_models, n_brands)
+
+        def _per_prompt(values):
+            out = np.zeros(shape, dtype=np.float64)
+            np.add.at(out, cell, values)
+            return out.reshape(n_prompts, n_models * n_brands)
+
+        mentions  = _per_prompt(self.mentioned)
+        positions = _per_prompt(self.positions)
+        firsts    = _per_prompt(self.first)
+        rows      = np.bincount(cell, minlength=n_prompts * n_models).reshape(n_prompts, n_models)
+
+        weights = bootstrap_weights(n_prompts, n_resamples, seed)
+
+        sample_shape = (n_resamples, n_models, n_brands)
+        m = (weights @ mentions).reshape(sample_shape)
+        p = (weights @ positions).reshape(sample_shape)
+        f = (weights @ firsts).reshape(sample_shape)
+        t = (weights @ rows)[:, :, None]
+
+        # Tous modèles confondus : somme sur l'axe modèle
+        m = np.concatenate([m, m.sum(axis=1, keepdims=True)], axis=1)
+        p = np.concatenate([p, p.sum(axis=1, keepdims=True)], axis=1)
+        f = np.concatenate([f, f.sum(axis=1, keepdims=True)], axis=1)
+        t = np.concatenate([t, t.sum(axis=1, keepdims=True)], axis=1)
+
+        samples = _vector_metrics(m, p, f, t)
+        drawn = t[:, :, 0] > 0
+        for values in samples.values():
+            values[~drawn] = np.nan
+        tail = (1 - confidence) / 2
+        bounds = {name: np.round(_percentile_bounds(values, tail), 2)
+                  for name, values in samples.items()}
+        valid_counts = drawn.sum(axis=0).tolist()
+
+        labels = list(models) + [None]
+        for g, label in enumerate(labels):
+            enough = valid_counts[g] >= max(1, BOOTSTRAP_MIN_VALID * n_resamples)
+            per_brand = {
+                brand: {name: bounds[name][:, g, k].tolist() if enough else None for name in bounds}
+                for k, brand in enumerate(self.brands)
+            }
+            if label is None:
+                result['overall'] = per_brand
+            else:
+                result['by_model'][label] = per_brand
+                result['valid_resamples'][label] = valid_counts[g]
+        return result
+
+
+class MetricsAccumulator:
+    """
+    Compteurs par marque mis à jour au fil de l'eau (streams SSE).
+    Chaque analyse ajoutée coûte O(marques mentionnées) ; `metrics()` rend
+    le même dict que calculate_metrics sur l'ensemble des analyses ajoutées.
+    """
+
+    def __init__(self, brands: Sequence[str]):
+        self.brands: List[str] = list(dict.fromkeys(brands))
+        self._index = {brand: idx for idx, brand in enumerate(self.brands)}
+        self._record_columns = _RecordColumns(self._index)
+        self.mention_counts = [0] * len(self.brands)
+        self.position_sums  = [0] * len(self.brands)
+        self.first_counts   = [0] * len(self.brands)
+        self.total = 0
+
+    def add(self, analysis: Dict) -> None:
+        self.total += 1
+        if type(analysis) is AnalysisRecord:
+            cols = self._record_columns[analysis.brands]
+            for pos, idx in enumerate(analysis.order):
+                col = cols[idx]
+                if col >= 0:
+                    self.mention_counts[col] += 1
+                    self.position_sums[col] += pos + 1
+            if analysis.order and cols[analysis.order[0]] >= 0:
+                self.first_counts[cols[analysis.order[0]]] += 1
+            return
+        positions = analysis.get('positions') or {}
+        seen = set()
+        for brand in analysis.get('brands_mentioned', []):
+            col = self._index.get(brand)
+            if col is None or col in seen:
+                continue
+            seen.add(col)
+            self.mention_counts[col] += 1
+            self.position_sums[col] += positions.get(brand, 0) or 0
+        col = self._index.get(analysis.get('first_brand'))
+        if col is not None and col in seen:
+            self.first_counts[col] += 1
+
+    def add_many(self, analyses: Iterable[Dict]) -> None:
+        for analysis in analyses:
+            self.add(analysis)
+
+    def metrics(self) -> Dict:
+        return build_metrics(self.brands, self.mention_counts, self.position_sums,
+                             self.first_counts, self.total)
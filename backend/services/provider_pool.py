@@ -0,0 +1,259 @@
+"""
+Pool de fournisseurs LLM — GEO Monitor
+Répartit les appels d'un modèle entre plusieurs endpoints (Ollama Cloud,
+nœuds Ollama auto-hébergés, serveurs compatibles OpenAI) : le débit croît
+avec le nombre de nœuds d'inférence.
+
+Configuration (OLLAMA_PROVIDERS, JSON ou @chemin/vers/fichier.json) :
+
+    {"qwen3.5": [{"url": "https://ollama.com/api", "weight": 1},
+                 {"url": "http://gpu-1:11434/api", "weight": 3, "model": "qwen2.5:14b",
+                  "label": "gpu-1"},
+                 {"url": "http://vllm:8000/v1", "kind": "openai", "api_key_env": "VLLM_KEY"}],
+     "*": [{"url": "https://ollama.com/api"}]}
+
+Sans configuration, chaque modèle a un seul endpoint : OLLAMA_BASE_URL.
+OLLAMA_API_KEY n'est envoyée qu'à OLLAMA_BASE_URL ; les autres nœuds
+prennent la clé de `api_key_env` ou n'en envoient aucune.
+
+Les statistiques (/api/status) désignent chaque nœud par son `label`, ou
+"node-<n>" dans l'ordre de la configuration ("default" pour
+OLLAMA_BASE_URL) : les URL internes ne sortent pas des logs serveur.
+
+Routage : moins de requêtes en vol rapportées au poids. Un endpoint qui
+échoue OLLAMA_EJECT_FAILURES fois de suite est écarté, puis réadmis après
+un délai qui double à chaque éjection (plafonné). Si tous sont écartés,
+celui qui revient le plus tôt est utilisé quand même (mode panique).
+"""
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+EJECT_FAILURES = int(os.getenv('OLLAMA_EJECT_FAILURES', '3'))
+EJECT_COOLDOWN = float(os.getenv('OLLAMA_EJECT_COOLDOWN', '30'))
+EJECT_MAX_COOLDOWN = float(os.getenv('OLLAMA_EJECT_MAX_COOLDOWN', '300'))
+
+OLLAMA, OPENAI = 'ollama', 'openai'
+
+
+class Endpoint:
+    """Un nœud d'inférence : URL, dialecte d'API, clé et état de santé."""
+
+    def __init__(self, url: str, kind: str = OLLAMA, api_key: Optional[str] = None,
+                 label: str = 'default'):
+        if kind not in (OLLAMA, OPENAI):
+            raise ValueError(f"Type d'endpoint inconnu : {kind!r}")
+        self.url = url.rstrip('/')
+        self.label = label
+        self.kind = kind
+        self.api_key = api_key
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.stats = {'requests': 0, 'errors': 0, 'ejected': 0}
+
+    # ── Dialecte ─────────────────────────────────────────────────────────────
+
+    @property
+    def chat_url(self) -> str:
+        return f"{self.url}/chat/completions" if self.kind == OPENAI else f"{self.url}/chat"
+
+    def headers(self) -> Dict[str, str]:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def payload(self, model: str, messages: List[Dict], options: Dict,
+                budget: Optional[Dict] = None) -> Dict:
+        """Corps de la requête ; `budget` = réglages résolus (services.generation)."""
+        budget = budget or {}
+        if self.kind == OPENAI:
+            payload = {'model': model, 'messages': messages, 'stream': bool(options.get('stream'))}
+            # num_ctx et keep_alive n'ont pas d'équivalent OpenAI
+            if 'num_predict' in budget.get('options', {}):
+                payload['max_tokens'] = budget['options']['num_predict']
+            return payload
+        payload = {'model': model, 'messages': messages, **options}
+        if budget.get('options'):
+            payload['options'] = dict(budget['options'])
+        if 'keep_alive' in budget:
+            payload['keep_alive'] = budget['keep_alive']
+        return payload
+
+    def parse_content(self, data: Dict) -> str:
+        """Texte d'une réponse complète."""
+        if self.kind == OPENAI:
+            choices = data.get('choices') or [{}]
+            return (choices[0].get('message') or {}).get('content') or ''
+        return data.get('message', {}).get('content', '')
+
+    def parse_token_counts(self, data: Dict) -> Optional[Dict[str, int]]:
+        """{'prompt_eval_count', 'eval_count'} au format Ollama, None si non fournis."""
+        if self.kind == OPENAI:
+            usage = data.get('usage') or {}
+            prompt, output = usage.get('prompt_tokens'), usage.get('completion_tokens')
+        else:
+            prompt, output = data.get('prompt_eval_count'), data.get('eval_count')
+        if prompt is None and output is None:
+            return None
+        return {'prompt_eval_count': prompt or 0, 'eval_count': output or 0}
+
+    def parse_usage(self, data: Dict) -> Optional[int]:
+        """Tokens consommés (entrée + sortie), None si non fournis."""
+        counts = self.parse_token_counts(data)
+        if counts is None:
+            return None
+        return (counts['prompt_eval_count'] + counts['eval_count']) or None
+
+    def parse_stream_line(self, line: bytes) -> Tuple[str, bool, Optional[Dict[str, int]]]:
+        """
+        (morceau de texte, fin du flux, compteurs de tokens s'ils sont
+        fournis) pour une ligne NDJSON (Ollama) ou SSE `data: …` (OpenAI).
+        Lève ValueError sur une erreur du serveur.
+        """
+        text = line.decode('utf-8') if isinstance(line, bytes) else line
+        if self.kind == OPENAI:
+            if not text.startswith('data:'):
+                return '', False, None
+            text = text[5:].strip()
+            if text == '[DONE]':
+                return '', True, None
+        chunk = json.loads(text)
+        if chunk.get('error'):
+            raise ValueError(chunk['error'])
+        counts = self.parse_token_counts(chunk)
+        if self.kind == OPENAI:
+            choice = (chunk.get('choices') or [{}])[0]
+            return ((choice.get('delta') or {}).get('content') or '',
+                    choice.get('finish_reason') is not None, counts)
+        return chunk.get('message', {}).get('content', ''), bool(chunk.get('done')), counts
+
+
+class _Route:
+    __slots__ = ('endpoint', 'weight', 'model')
+
+    def __init__(self, endpoint: Endpoint, weight: float, model: Optional[str]):
+        self.endpoint = endpoint
+        self.weight = max(weight, 0.01)
+        self.model = model
+
+
+class ProviderPool:
+    """Routage thread-safe (coopératif sous gevent) entre les endpoints de chaque modèle."""
+
+    def __init__(self, default: Endpoint, routes: Optional[Dict[str, List[_Route]]] = None,
+                 eject_failures: int = EJECT_FAILURES, eject_cooldown: float = EJECT_COOLDOWN,
+                 max_cooldown: float = EJECT_MAX_COOLDOWN,
+                 clock: Callable[[], float] = time.monotonic,
+                 rng: Optional[random.Random] = None):
+        self.default = default
+        self._routes = routes or {}
+        self.eject_failures = eject_failures
+        self.eject_cooldown = eject_cooldown
+        self.max_cooldown = max_cooldown
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict, base_url: str, api_key: Optional[str], **kwargs) -> 'ProviderPool':
+        """Construit le pool depuis le dict {modèle: [endpoints]} ('*' = tous les modèles)."""
+        default = Endpoint(base_url, OLLAMA, api_key)
+        endpoints = {(default.url, OLLAMA): default}
+        labels = {default.label}
+        routes: Dict[str, List[_Route]] = {}
+        for model, entries in (config or {}).items():
+            if not isinstance(entries, list) or not entries:
+                raise ValueError(f"OLLAMA_PROVIDERS[{model!r}] doit être une liste d'endpoints")
+            for entry in entries:
+                kind = entry.get('kind', OLLAMA)
+                url = entry['url'].rstrip('/')
+                endpoint = endpoints.get((url, kind))
+                if endpoint is None:
+                    key = os.getenv(entry['api_key_env']) if entry.get('api_key_env') else None
+                    label = entry.get('label') or f"node-{len(endpoints)}"
+                    if label in labels:
+                        raise ValueError(f"OLLAMA_PROVIDERS : label {label!r} en double")
+                    labels.add(label)
+                    endpoint = endpoints[(url, kind)] = Endpoint(url, kind, key, label)
+                routes.setdefault(model, []).append(
+                    _Route(endpoint, float(entry.get('weight', 1)), entry.get('model')))
+        return cls(default, routes, **kwargs)
+
+    @classmethod
+    def from_env(cls, base_url: str, api_key: Optional[str]) -> 'ProviderPool':
+        raw = os.getenv('OLLAMA_PROVIDERS', '').strip()
+        if raw.startswith('@'):
+            with open(raw[1:], encoding='utf-8') as f:
+                raw = f.read()
+        return cls.from_config(json.loads(raw) if raw else {}, base_url, api_key)
+
+    def _candidates(self, model: str) -> List[_Route]:
+        return self._routes.get(model) or self._routes.get('*') or [_Route(self.default, 1, None)]
+
+    # ── Routage ──────────────────────────────────────────────────────────────
+
+    def acquire(self, model: str, exclude: Optional[Endpoint] = None) -> Tuple[Endpoint, str]:
+        """
+        Endpoint le moins chargé (requêtes en vol / poids) parmi les sains,
+        et nom du modèle à lui envoyer. À rendre avec release(). `exclude`
+        (nœud qui vient d'échouer) n'est repris que s'il est le seul sain.
+        """
+        with self._lock:
+            routes = self._candidates(model)
+            now = self._clock()
+            healthy = [route for route in routes if route.endpoint.ejected_until <= now]
+            if exclude is not None and any(route.endpoint is not exclude for route in healthy):
+                healthy = [route for route in healthy if route.endpoint is not exclude]
+            if healthy:
+                scores = [(route.endpoint.outstanding + 1) / route.weight for route in healthy]
+                best = min(scores)
+                route = self._rng.choice([r for r, s in zip(healthy, scores) if s == best])
+            else:
+                route = min(routes, key=lambda r: r.endpoint.ejected_until)
+            endpoint = route.endpoint
+            endpoint.outstanding += 1
+            endpoint.stats['requests'] += 1
+            return endpoint, route.model or model
+
+    def release(self, endpoint: Endpoint, ok: bool) -> None:
+        """Fin d'appel : un succès réadmet pleinement, les échecs consécutifs éjectent."""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if ok:
+                endpoint.failures = 0
+                endpoint.ejections = 0
+                return
+            endpoint.stats['errors'] += 1
+            endpoint.failures += 1
+            # Après une réadmission, un seul échec suffit à ré-éjecter
+            threshold = 1 if endpoint.ejections else self.eject_failures
+            if endpoint.failures >= threshold and endpoint.ejected_until <= self._clock():
+                cooldown = min(self.max_cooldown, self.eject_cooldown * (2 ** endpoint.ejections))
+                endpoint.ejections += 1
+                endpoint.ejected_until = self._clock() + cooldown
+                endpoint.failures = 0
+                endpoint.stats['ejected'] += 1
+                print(f"[POOL] {endpoint.label} ({endpoint.url}) écarté {cooldown:.0f}s")
+
+    def stats(self) -> Dict[str, Dict]:
+        """{label: type, requêtes en vol, compteurs, état, secondes avant réadmission}."""
+        with self._lock:
+            now = self._clock()
+            seen = {route.endpoint for routes in self._routes.values() for route in routes}
+            seen.add(self.default)
+            return {
+                endpoint.label: {
+                    'kind': endpoint.kind,
+                    'outstanding': endpoint.outstanding,
+                    **endpoint.stats,
+                    'state': 'ejected' if endpoint.ejected_until > now else 'healthy',
+                    'readmit_in': round(max(0.0, endpoint.ejected_until - now), 1),
+                }
+                for endpoint in seen if endpoint.stats['requests'] or endpoint is self.default
+            }
@@ -0,0 +1,240 @@
+"""
+Limiteur de débit LLM — GEO Monitor
+Seaux à jetons (requêtes/min et tokens/min) par modèle et par clé API,
+partagés entre process via SQLite (WAL) dans GEO_DATA_DIR : les workers
+Gunicorn et le scheduler puisent dans le même quota au lieu de déclencher
+chacun des 429 côté fournisseur.
+
+Priorité : une fraction du seau (OLLAMA_RATE_RESERVE) est réservée aux
+runs interactifs ; les runs planifiés attendent dès que le seau descend
+sous cette réserve.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from services.llm_cache import DATA_DIR
+
+INTERACTIVE = 'interactive'
+SCHEDULED = 'scheduled'
+
+# 0 = pas de limite sur cet axe
+RATE_LIMIT_RPM = float(os.getenv('OLLAMA_RATE_LIMIT_RPM', '0'))
+RATE_LIMIT_TPM = float(os.getenv('OLLAMA_RATE_LIMIT_TPM', '0'))
+# Part de chaque seau que les runs planifiés ne peuvent pas consommer
+RATE_RESERVE = float(os.getenv('OLLAMA_RATE_RESERVE', '0.25'))
+# Attente max avant d'abandonner l'appel (échec 'rate_limited')
+RATE_MAX_WAIT = float(os.getenv('OLLAMA_RATE_MAX_WAIT', '30'))
+# Tokens de sortie supposés avant de connaître l'usage réel
+RATE_EXPECTED_OUTPUT = int(os.getenv('OLLAMA_RATE_EXPECTED_OUTPUT', '512'))
+# Attente SQLite bloquante courte (ms) : au-delà, la base verrouillée par un
+# autre process est réessayée par time.sleep, coopératif sous gevent
+RATE_BUSY_TIMEOUT_MS = 50
+# Délai total (s) avant de laisser passer l'appel si la base reste verrouillée
+RATE_LOCK_WAIT = 5.0
+
+RATE_LIMIT_PATH = os.path.join(DATA_DIR, 'llm_rate.db')
+
+
+def estimate_tokens(*texts: Optional[str], expected_output: int = RATE_EXPECTED_OUTPUT) -> int:
+    """Estimation grossière (≈ 4 caractères par token) + sortie attendue."""
+    return sum(len(text) for text in texts if text) // 4 + expected_output
+
+
+class RateLimiter:
+    """
+    Seaux à jetons persistés dans SQLite. Chaque réservation se fait dans
+    une transaction IMMEDIATE : lecture, recharge et débit sont atomiques
+    entre process. Une erreur SQLite laisse passer l'appel (fail open).
+    Méthodes bloquantes : depuis une boucle asyncio, les appeler via
+    run_in_executor (voir AsyncLLMClient).
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, requests_per_min: float = RATE_LIMIT_RPM,
+                 tokens_per_min: float = RATE_LIMIT_TPM, reserve: float = RATE_RESERVE,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self.reserve = min(max(reserve, 0.0), 0.9)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._stats = {'granted': 0, 'waits': 0, 'rejected': 0, 'errors': 0}
+
+    @staticmethod
+    def bucket_key(api_key: Optional[str], model: str) -> str:
+        """Clé de seau : empreinte de la clé API (jamais stockée en clair) + modèle."""
+        fingerprint = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+        return f"{fingerprint}:{model}"
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par process (jamais héritée d'un fork)
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=RATE_BUSY_TIMEOUT_MS / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute(f'PRAGMA busy_timeout = {RATE_BUSY_TIMEOUT_MS}')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    bucket     TEXT PRIMARY KEY,
+                    level      REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _axes(self, tokens: int):
+        """(suffixe, capacité par minute, coût) de chaque axe actif."""
+        axes = []
+        if self.requests_per_min > 0:
+            axes.append(('req', self.requests_per_min, 1.0))
+        if self.tokens_per_min > 0:
+            axes.append(('tok', self.tokens_per_min, float(tokens)))
+        return axes
+
+    def reserve_slot(self, bucket: str, tokens: int = 0, priority: str = INTERACTIVE) -> float:
+        """
+        Tente de débiter 1 requête et `tokens` tokens. Retourne 0.0 si
+        accordé, sinon le nombre de secondes à attendre (rien n'est débité).
+        """
+        axes = self._axes(tokens)
+        if not axes:
+            return 0.0
+
+        def _reserve(conn: sqlite3.Connection):
+            now = self._clock()
+            levels, wait = {}, 0.0
+            for suffix, capacity, cost in axes:
+                key = f"{bucket}:{suffix}"
+                row = conn.execute('SELECT level, updated_at FROM rate_buckets WHERE bucket = ?',
+                                   (key,)).fetchone()
+                rate = capacity / 60.0
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                floor = capacity * self.reserve if priority == SCHEDULED else 0.0
+                # Un appel plus gros que la part utilisable passe quand le seau est plein
+                cost = min(cost, capacity - floor)
+                if level - cost < floor:
+                    wait = max(wait, (floor + cost - level) / rate)
+                levels[key] = level - cost
+            if wait > 0:
+                return wait, False
+            conn.executemany(
+                'INSERT OR REPLACE INTO rate_buckets (bucket, level, updated_at) VALUES (?, ?, ?)',
+                [(key, level, now) for key, level in levels.items()]
+            )
+            return 0.0, True
+
+        try:
+            return self._transaction(_reserve)
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            print(f"[RATE] seau illisible, appel autorisé : {e}")
+            return 0.0
+
+    def _transaction(self, body: Callable[[sqlite3.Connection], tuple]):
+        """
+        Exécute body(conn) → (résultat, écrire ?) dans une transaction
+        IMMEDIATE. Base verrouillée par un autre process : le verrou local
+        est rendu et l'essai repris après une courte pause (time.sleep,
+        coopératif sous gevent) plutôt qu'une attente SQLite bloquante.
+        """
+        deadline = time.monotonic() + RATE_LOCK_WAIT
+        delay = 0.005
+        while True:
+            with self._lock:
+                conn = self._connection()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    if time.monotonic() + delay > deadline:
+                        raise
+                else:
+                    try:
+                        result, write = body(conn)
+                        conn.execute('COMMIT' if write else 'ROLLBACK')
+                    except BaseException:
+                        conn.execute('ROLLBACK')
+                        raise
+                    return result
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def acquire(self, bucket: str, tokens: int = 0, priority: str = INTERACTIVE,
+                max_wait: float = RATE_MAX_WAIT,
+                sleep: Callable[[float], None] = time.sleep) -> bool:
+        """Attend (coopératif sous gevent) qu'un créneau soit accordé ; False après `max_wait`."""
+        waited = 0.0
+        while True:
+            wait = self.reserve_slot(bucket, tokens, priority)
+            if wait <= 0:
+                self._stats['granted'] += 1
+                return True
+            if waited + wait > max_wait:
+                self._stats['rejected'] += 1
+                return False
+            self._stats['waits'] += 1
+            sleep(wait)
+            waited += wait
+
+    def settle(self, bucket: str, estimated: int, actual: Optional[int]) -> None:
+        """Corrige le seau tokens avec l'usage réel (le niveau peut passer en dette)."""
+        if self.tokens_per_min <= 0 or actual is None or actual == estimated:
+            return
+        self._adjust(f"{bucket}:tok", estimated - actual)
+
+    def drain(self, bucket: str) -> None:
+        """Vide les seaux après un 429 : tous les process ralentissent ensemble."""
+        for suffix, capacity, _ in self._axes(0):
+            self._adjust(f"{bucket}:{suffix}", -capacity)
+
+    def _adjust(self, key: str, delta: float) -> None:
+        capacity = self.tokens_per_min if key.endswith(':tok') else self.requests_per_min
+
+        def _apply(conn: sqlite3.Connection):
+            now = self._clock()
+            row = conn.execute('SELECT level, updated_at FROM rate_buckets WHERE bucket = ?',
+                               (key,)).fetchone()
+            level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60.0)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_buckets (bucket, level, updated_at) VALUES (?, ?, ?)',
+                (key, min(capacity, level + delta), now)
+            )
+            return None, True
+
+        try:
+            self._transaction(_apply)
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            print(f"[RATE] ajustement impossible : {e}")
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['requests_per_min'] = self.requests_per_min
+        stats['tokens_per_min'] = self.tokens_per_min
+        stats['reserve'] = self.reserve
+        return stats
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Limiteur partagé du process, ou None si aucune limite n'est configurée."""
+    global _limiter
+    if RATE_LIMIT_RPM <= 0 and RATE_LIMIT_TPM <= 0:
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,162 @@
+"""
+Résilience des appels LLM — GEO Monitor
+Retries avec backoff exponentiel + jitter (en respectant Retry-After sur
+429/503) et disjoncteur par modèle : quand un modèle tombe, les prompts
+suivants échouent immédiatement au lieu de consommer chacun OLLAMA_TIMEOUT
+secondes avant le fallback démo.
+
+Le disjoncteur suit le schéma classique :
+  fermé     → les appels passent, les échecs consécutifs sont comptés
+  ouvert    → après `failure_threshold` échecs, tout appel est refusé
+              pendant `recovery_timeout` secondes
+  mi-ouvert → un seul appel d'essai ; succès = fermé, échec = ouvert
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+# Tentatives supplémentaires après le premier appel (0 = fail fast historique)
+LLM_RETRIES = int(os.getenv('OLLAMA_RETRIES', '2'))
+LLM_RETRY_BASE_DELAY = float(os.getenv('OLLAMA_RETRY_BASE_DELAY', '0.5'))
+# Attente max entre deux tentatives ; un Retry-After plus long abandonne
+LLM_RETRY_MAX_DELAY = float(os.getenv('OLLAMA_RETRY_MAX_DELAY', '8'))
+
+BREAKER_THRESHOLD = int(os.getenv('OLLAMA_BREAKER_THRESHOLD', '3'))
+BREAKER_COOLDOWN = float(os.getenv('OLLAMA_BREAKER_COOLDOWN', '30'))
+
+# Codes HTTP transitoires : surcharge, passerelle, quota
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Délai en secondes d'un en-tête Retry-After (secondes ou date HTTP).
+    Retourne None si absent ou illisible.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class RetryPolicy:
+    """Backoff exponentiel plafonné avec « full jitter »."""
+
+    def __init__(self, retries: int = LLM_RETRIES, base_delay: float = LLM_RETRY_BASE_DELAY,
+                 max_delay: float = LLM_RETRY_MAX_DELAY,
+                 rng: Callable[[], float] = random.random):
+        self.retries = max(0, retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng
+
+    @property
+    def attempts(self) -> int:
+        return self.retries + 1
+
+    def backoff(self, attempt: int) -> float:
+        """Attente avant la tentative `attempt + 1` (attempt commence à 1)."""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return ceiling * self._rng()
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Attente avant la prochaine tentative, ou None s'il ne faut plus
+        réessayer (tentatives épuisées, Retry-After au-delà du plafond).
+        """
+        if attempt >= self.attempts:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return self.backoff(attempt)
+
+
+class CircuitBreaker:
+    """Disjoncteur thread-safe (coopératif sous gevent)."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_THRESHOLD,
+                 recovery_timeout: float = BREAKER_COOLDOWN,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        """True si l'appel peut partir ; en mi-ouvert, un seul essai à la fois."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def release(self) -> None:
+        """Rend l'essai mi-ouvert accordé par allow() quand l'appel n'est pas parti."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats['opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def retry_in(self) -> float:
+        """Secondes avant le prochain essai (0 si le disjoncteur laisse passer)."""
+        with self._lock:
+            if self._current_state() != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (self._clock() - self._opened_at))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._current_state()
+            stats['failures'] = self._failures
+        return stats
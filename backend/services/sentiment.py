@@ -0,0 +1,111 @@
+"""
+Sentiment par marque — GEO Monitor
+Lexique tokenisé (recherche par dictionnaire, formes normalisées) appliqué
+dans une fenêtre de mots autour de chaque occurrence de marque. Les tokens
+sont produits par le même balayage que l'extraction des marques
+(BrandMatcher.scan), le score par marque ne coûte donc qu'un bisect par
+occurrence.
+
+Échelle : -100 (très négatif) … +100 (très positif), 15 points par mot
+comme l'ancien calculate_sentiment. L'échelle 0–100 des alertes (ALT-005)
+s'obtient avec `alert_scale`.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Formes normalisées (minuscules, sans accents) — voir analyzer.normalize_text
+POSITIVE_WORDS = (
+    'excellent', 'excellente', 'bon', 'bonne', 'bons', 'bonnes', 'meilleur', 'meilleure',
+    'meilleurs', 'rapide', 'rapides', 'efficace', 'efficaces', 'fiable', 'fiables', 'top',
+    'recommande', 'recommandee', 'recommandees', 'super', 'genial', 'economique', 'qualite',
+    'solide', 'reactif', 'reactive', 'apprecie', 'satisfait', 'satisfaits', 'avantageux',
+    'competitif', 'competitive', 'leader', 'reference',
+    'best', 'great', 'good', 'amazing', 'trusted', 'reliable', 'recommended',
+)
+NEGATIVE_WORDS = (
+    'mauvais', 'mauvaise', 'lent', 'lente', 'lents', 'cher', 'chere', 'chers', 'pire',
+    'decu', 'decue', 'decus', 'probleme', 'problemes', 'fuir', 'arnaque', 'complique',
+    'compliquee', 'inutile', 'litige', 'litiges', 'plainte', 'plaintes', 'retard', 'retards',
+    'refus', 'mediocre', 'decevant', 'decevante', 'critique', 'critiques',
+    'bad', 'avoid', 'poor', 'terrible', 'worst', 'slow', 'expensive', 'complaints',
+)
+# Inversent la polarité du mot qui suit (« pas fiable », « sans problème »)
+NEGATORS = ('pas', 'jamais', 'sans', 'aucun', 'aucune', 'guere', 'not', 'never', 'no', 'without')
+
+SENTIMENT_WINDOW = 8      # mots de part et d'autre d'une occurrence de marque
+NEGATION_SPAN    = 3      # un négateur agit sur les 3 mots suivants
+WORD_WEIGHT      = 15
+
+NEGATOR = 0
+
+# Libellés du JSON structuré (`"sentiments": {"Marque": "positif"}`) → score
+LABEL_SCORES = {
+    'tres positif': 90, 'positif': 60, 'positive': 60, 'favorable': 60,
+    'neutre': 0, 'neutral': 0, 'mitige': -20, 'mixed': -20,
+    'negatif': -60, 'negative': -60, 'defavorable': -60, 'tres negatif': -90,
+}
+
+
+def build_lexicon(positive: Sequence[str] = POSITIVE_WORDS,
+                  negative: Sequence[str] = NEGATIVE_WORDS,
+                  negators: Sequence[str] = NEGATORS) -> Dict[str, int]:
+    """Token normalisé → +1 / -1 / NEGATOR, pour BrandMatcher.scan."""
+    lexicon = {word: 1 for word in positive}
+    lexicon.update((word, -1) for word in negative)
+    lexicon.update((word, NEGATOR) for word in negators)
+    return lexicon
+
+
+DEFAULT_LEXICON = build_lexicon()
+
+
+def polarity_hits(tokens: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    """
+    Applique les négations aux tokens du lexique [(index, valeur)] et
+    retourne (indices, polarités) des mots porteurs de sentiment, triés.
+    """
+    indices, polarities = [], []
+    negated_until = -1
+    for idx, value in tokens:
+        if value == NEGATOR:
+            negated_until = idx + NEGATION_SPAN
+            continue
+        if idx <= negated_until:
+            value = -value
+            negated_until = -1
+        indices.append(idx)
+        polarities.append(value)
+    return indices, polarities
+
+
+def window_scores(occurrences: Dict[str, List[int]], tokens: List[Tuple[int, int]],
+                  window: int = SENTIMENT_WINDOW) -> Dict[str, int]:
+    """
+    Score de chaque marque d'après les mots du lexique situés à moins de
+    `window` mots d'une de ses occurrences. Un mot n'est compté qu'une fois
+    par marque même si plusieurs occurrences le couvrent.
+    """
+    indices, polarities = polarity_hits(tokens)
+    scores = {}
+    for brand, positions in occurrences.items():
+        total, covered = 0, -1
+        for pos in positions:
+            lo = max(bisect_left(indices, pos - window), covered + 1)
+            hi = bisect_right(indices, pos + window)
+            if lo < hi:
+                total += sum(polarities[lo:hi])
+                covered = hi - 1
+        scores[brand] = max(min(total * WORD_WEIGHT, 100), -100)
+    return scores
+
+
+def label_score(label, normalize) -> Optional[int]:
+    """Score d'un libellé JSON (« positif », « Négatif »…) ; None si inconnu."""
+    if not isinstance(label, str):
+        return None
+    return LABEL_SCORES.get(' '.join(normalize(label).split()))
+
+
+def alert_scale(score: float) -> float:
+    """Convertit -100…100 vers l'échelle 0–100 du catalogue d'alertes."""
+    return round((score + 100) / 2, 1)
@@ -0,0 +1,114 @@
+"""
+Single-flight — GEO Monitor
+Regroupe les appels concurrents identiques : le premier appelant d'une clé
+exécute la requête, les suivants attendent son résultat au lieu d'envoyer
+un doublon au fournisseur LLM (deux utilisateurs sur le même pack de
+prompts, scheduler qui chevauche un run manuel…).
+
+SingleFlight s'appuie sur threading (Lock/Event), donc coopératif sous
+gevent une fois monkey-patché ; AsyncSingleFlight est l'équivalent asyncio.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalescence d'appels bloquants (threads / greenlets)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'executions': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Exécute `fn` une seule fois par clé en vol.
+        Retourne (résultat, partagé) ; l'exception du meneur est relancée
+        chez tous les appelants.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+class AsyncSingleFlight:
+    """Coalescence d'appels asyncio (une table par boucle d'événements)."""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._stats = {'executions': 0, 'coalesced': 0}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        future = self._calls.get(slot)
+        if future is not None:
+            self._stats['coalesced'] += 1
+            # shield : l'annulation d'un suiveur n'annule pas la requête partagée
+            return await asyncio.shield(future), True
+
+        future = loop.create_future()
+        self._calls[slot] = future
+        self._stats['executions'] += 1
+        try:
+            result = await factory()
+        except BaseException as e:
+            future.set_exception(e)
+            # Marque l'exception comme lue s'il n'y a aucun suiveur
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._calls.pop(slot, None)
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._calls)
+        return stats
@@ -0,0 +1,143 @@
+"""
+Télémétrie LLM — GEO Monitor
+Tampon circulaire en mémoire, par modèle : latence, temps jusqu'au premier
+octet, débit (caractères/s, tokens/s), tokens consommés, timeouts, codes
+HTTP et hits de cache. Sert à
+dimensionner OLLAMA_TIMEOUT et le nombre de workers à partir de mesures
+(/api/status, /api/health) plutôt que des lignes `print`.
+
+Compteurs et fenêtre sont propres au process (chaque worker Gunicorn a
+les siens).
+"""
+import math
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Appels conservés par modèle pour les percentiles
+TELEMETRY_WINDOW = int(os.getenv('OLLAMA_TELEMETRY_WINDOW', '500'))
+# Percentiles avant lesquels on ne suggère pas de timeout
+TELEMETRY_MIN_SAMPLES = 20
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Percentile par rang le plus proche d'une liste déjà triée (None si vide)."""
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class _ModelWindow:
+    __slots__ = ('samples', 'requests', 'successes', 'errors', 'cache_hits', 'cache_misses')
+
+    def __init__(self, size: int):
+        # (latence s, premier octet s ou None, caractères, tokens prompt, tokens générés)
+        self.samples: Deque[Tuple[float, Optional[float], int, Optional[int], Optional[int]]] = \
+            deque(maxlen=size)
+        self.requests = 0
+        self.successes = 0
+        self.errors: Dict[str, int] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class LLMTelemetry:
+    """Mesures par modèle, thread-safe (coopératif sous gevent)."""
+
+    def __init__(self, window: int = TELEMETRY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelWindow] = {}
+
+    def _model(self, model: str) -> _ModelWindow:
+        stats = self._models.get(model)
+        if stats is None:
+            stats = self._models[model] = _ModelWindow(self.window)
+        return stats
+
+    def record_success(self, model: str, latency: float, ttfb: Optional[float] = None,
+                       chars: int = 0, tokens: Optional[Dict[str, int]] = None) -> None:
+        """`tokens` : {'prompt_eval_count', 'eval_count'} renvoyés par Ollama."""
+        tokens = tokens or {}
+        with self._lock:
+            stats = self._model(model)
+            stats.requests += 1
+            stats.successes += 1
+            stats.samples.append((latency, ttfb, chars, tokens.get('prompt_eval_count'),
+                                  tokens.get('eval_count')))
+
+    def record_error(self, model: str, cause: str) -> None:
+        """Échec d'une tentative : timeout, http_<code>, connection, breaker_open…"""
+        with self._lock:
+            stats = self._model(model)
+            stats.requests += 1
+            stats.errors[cause] = stats.errors.get(cause, 0) + 1
+
+    def record_cache(self, model: str, hit: bool) -> None:
+        with self._lock:
+            stats = self._model(model)
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    def summary(self, timeout: Optional[float] = None) -> Dict[str, Dict]:
+        """
+        {modèle: latence p50/p90/p99 (ms), premier octet p50/p90 (ms),
+        caractères/s, tokens moyens et tokens générés/s, taux de timeout,
+        erreurs par cause, taux de hit cache}.
+        Avec `timeout` (OLLAMA_TIMEOUT), ajoute le timeout suggéré (p99 × 1.5).
+        """
+        with self._lock:
+            snapshot = {model: (list(stats.samples), stats.requests, stats.successes,
+                                dict(stats.errors), stats.cache_hits, stats.cache_misses)
+                        for model, stats in self._models.items()}
+
+        report = {}
+        for model, (samples, requests, successes, errors, hits, misses) in snapshot.items():
+            latencies = sorted(sample[0] for sample in samples)
+            ttfbs = sorted(sample[1] for sample in samples if sample[1] is not None)
+            total_time = sum(latencies)
+            total_chars = sum(sample[2] for sample in samples)
+            lookups = hits + misses
+            counted = [sample for sample in samples if sample[4] is not None]
+            counted_time = sum(sample[0] for sample in counted)
+
+            def _ms(values, q):
+                value = percentile(values, q)
+                return round(value * 1000, 1) if value is not None else None
+
+            entry = {
+                'samples': len(samples),
+                'requests': requests,
+                'successes': successes,
+                'latency_ms': {'p50': _ms(latencies, 50), 'p90': _ms(latencies, 90),
+                               'p99': _ms(latencies, 99)},
+                'ttfb_ms': {'p50': _ms(ttfbs, 50), 'p90': _ms(ttfbs, 90)},
+                'chars_per_sec': round(total_chars / total_time, 1) if total_time > 0 else None,
+                'prompt_tokens_avg': (round(sum(s[3] or 0 for s in counted) / len(counted), 1)
+                                      if counted else None),
+                'output_tokens_avg': (round(sum(s[4] for s in counted) / len(counted), 1)
+                                      if counted else None),
+                'output_tokens_per_sec': (round(sum(s[4] for s in counted) / counted_time, 1)
+                                          if counted_time > 0 else None),
+                'timeouts': errors.get('timeout', 0),
+                'timeout_rate': round(errors.get('timeout', 0) / requests * 100, 1) if requests else 0.0,
+                'errors': errors,
+                'cache_hit_rate': round(hits / lookups * 100, 1) if lookups else 0.0,
+            }
+            if timeout is not None:
+                p99 = percentile(latencies, 99)
+                entry['timeout_s'] = timeout
+                entry['suggested_timeout_s'] = (
+                    math.ceil(p99 * 1.5) if p99 is not None and len(latencies) >= TELEMETRY_MIN_SAMPLES
+                    else None
+                )
+            report[model] = entry
+        return report
+
+    def reset(self) -> None:
+        with self._lock:
+            self._models.clear()
@@ -0,0 +1,30 @@
+"""
+Fixtures partagées pour les tests de routes
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import app as app_module
+import models.database as db_module
+
+
+@pytest.fixture
+def auth_app(tmp_path, monkeypatch):
+    """App Flask sur une base et un dossier de résultats temporaires"""
+    data_dir = tmp_path / 'data'
+    db_path = data_dir / 'history.db'
+
+    monkeypatch.setattr(db_module, 'DATA_DIR', str(data_dir))
+    monkeypatch.setattr(db_module, 'DB_PATH', str(db_path))
+    monkeypatch.setattr(app_module, 'DATA_DIR', str(data_dir))
+    monkeypatch.setattr(app_module, 'RESULTS_FILE', str(data_dir / 'results.json'))
+    monkeypatch.setattr(app_module, 'RESULTS_SNAPSHOTS_DIR', str(data_dir / 'results_by_brand'))
+
+    app_module.app.config['TESTING'] = True
+    app_module.app.config['SECRET_KEY'] = 'test-secret'
+    db_module.init_db()
+    return app_module.app
@@ -9,23 +9,6 @@ import app as app_module
 import models.database as db_module
 
 
-@pytest.fixture
-def auth_app(tmp_path, monkeypatch):
-    data_dir = tmp_path / 'data'
-    db_path = data_dir / 'history.db'
-
-    monkeypatch.setattr(db_module, 'DATA_DIR', str(data_dir))
-    monkeypatch.setattr(db_module, 'DB_PATH', str(db_path))
-    monkeypatch.setattr(app_module, 'DATA_DIR', str(data_dir))
-    monkeypatch.setattr(app_module, 'RESULTS_FILE', str(data_dir / 'results.json'))
-    monkeypatch.setattr(app_module, 'RESULTS_SNAPSHOTS_DIR', str(data_dir / 'results_by_brand'))
-
-    app_module.app.config['TESTING'] = True
-    app_module.app.config['SECRET_KEY'] = 'test-secret'
-    db_module.init_db()
-    return app_module.app
-
-
 @pytest.fixture
 def client(auth_app):
     return auth_app.test_client()
@@ -276,6 +259,32 @@ def test_save_analysis_does_not_overwrite_existing_project_fields(client):
     assert project['models'] == ['model-alpha', 'model-beta']
 
 
+def test_generation_settings_are_stored_per_project(client):
+    _signup(client, 'Alice', 'alice-budget@example.com')
+    user_id = client.get('/api/auth/me').get_json()['user']['id']
+    project_id = db_module.upsert_project('Brand Budget', 'Assurance', ['Competitor One'],
+                                          ['prompt 1'], ['demo'], user_id=user_id)
+
+    response = client.put(f'/api/projects/{project_id}/generation-settings',
+                          json={'num_predict': '600', 'keep_alive': '7h',
+                                'models': {'model-alpha': {'num_ctx': 8192}}})
+    assert response.status_code == 200
+    expected = {'num_predict': 600, 'keep_alive': '7h', 'models': {'model-alpha': {'num_ctx': 8192}}}
+    assert db_module.get_project_by_id(project_id, user_id=user_id)['generation_settings'] == expected
+
+    invalid = client.put(f'/api/projects/{project_id}/generation-settings', json={'num_ctx': 10})
+    assert invalid.status_code == 400
+    assert client.put('/api/projects/9999/generation-settings', json={}).status_code == 404
+
+    # Un run sans budget explicite conserve celui du projet
+    client.post('/api/run-analysis', json={'brand': 'Brand Budget', 'competitors': ['Competitor One'],
+                                           'demo': True})
+    assert db_module.get_project_by_id(project_id, user_id=user_id)['generation_settings'] == expected
+    rejected = client.post('/api/run-analysis', json={'brand': 'Brand Budget', 'demo': True,
+                                                      'generation_settings': {'keep_alive': 'soon'}})
+    assert rejected.status_code == 400
+
+
 def test_prompt_compare_exposes_quality_and_model_breakdown(client):
     _signup(client, 'Alice', 'alice@example.com')
     me_payload = client.get('/api/auth/me').get_json()
@@ -50,6 +50,48 @@ class TestHealthRoute:
         assert 'scheduler' in data
         assert set(['role', 'running', 'configured']).issubset(data['scheduler'].keys())
 
+    def test_health_exposes_llm_telemetry(self, client):
+        """Test que health expose la telemetrie LLM par modele"""
+        response = client.get('/api/health')
+        data = json.loads(response.data)
+
+        assert isinstance(data['llm_telemetry'], dict)
+
+
+class TestStatusRoute:
+    """Tests pour /api/status"""
+
+    def test_status_exposes_analysis_cache(self, client, monkeypatch):
+        """Test que status expose les compteurs du cache d'analyses"""
+        from services.llm_client import LLMClient
+        monkeypatch.setattr(LLMClient, 'get_active_models', lambda self: {})
+        response = client.get('/api/status')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert set(['hits', 'reused', 'misses', 'size', 'hit_rate']).issubset(data['analysis_cache'])
+
+    def test_status_exposes_llm_telemetry(self, client, monkeypatch):
+        """Test que status expose les percentiles de latence par modele"""
+        from services.llm_client import LLMClient
+        monkeypatch.setattr(LLMClient, 'get_telemetry',
+                            lambda self: {'m1': {'latency_ms': {'p50': 120.0}}})
+        response = client.get('/api/status')
+        data = json.loads(response.data)
+
+        assert data['llm_telemetry']['m1']['latency_ms']['p50'] == 120.0
+
+    def test_status_hides_provider_urls(self, client, monkeypatch):
+        """Test que status désigne les endpoints LLM par label, sans leur URL"""
+        from services.llm_client import LLMClient
+        monkeypatch.setattr(LLMClient, 'get_active_models', lambda self: {})
+        monkeypatch.setenv('OLLAMA_API_KEY', 'test-key')
+        response = client.get('/api/status')
+        data = json.loads(response.data)
+
+        assert 'default' in data['llm_providers']
+        assert 'http' not in json.dumps(data['llm_providers'])
+
 
 class TestIndexRoute:
     """Tests pour /"""
@@ -155,3 +197,198 @@ class TestPdfSupportRoute:
         assert 'available' in data
         assert 'supported_reports' in data
         assert 'analysis_main' in data['supported_reports']
+
+
+class TestNegativeMentionAlert:
+    """Tests de la sélection des réponses pour l'alerte ALT-005"""
+
+    def test_negative_mentions_below_threshold(self):
+        """Test que seules les réponses sous 30/100 sont retenues, pire d'abord"""
+        from app import _negative_mentions
+        results = {'responses': [
+            {'prompt': 'p1', 'llm_analyses': {
+                'm1': {'analysis': {'sentiments': {'MAIF': -60}}},
+                'm2': {'analysis': {'sentiments': {'MAIF': 15}}},
+            }},
+            {'prompt': 'p2', 'llm_analyses': {
+                'm1': {'analysis': {'sentiments': {'MAIF': -90, 'AXA': -90}}},
+                'demo': {'analysis': {}},
+            }},
+        ]}
+        found = _negative_mentions(results, 'MAIF')
+        assert [(m['prompt'], m['score']) for m in found] == [('p2', 5.0), ('p1', 20.0)]
+
+
+class TestJsonProvider:
+    """Tests de la sérialisation des AnalysisRecord par jsonify"""
+
+    def test_jsonify_serializes_analysis_records(self, app):
+        """Test que jsonify convertit les enregistrements compacts en dict"""
+        from services.analyzer import BrandAnalyzer
+        record = BrandAnalyzer(brands=['MAIF', 'AXA']).analyze_response("AXA puis MAIF.")
+        payload = json.loads(app.json.dumps({'analysis': record}))
+        assert payload['analysis']['brands_mentioned'] == ['AXA', 'MAIF']
+        assert payload['analysis']['brand_position'] == 2
+
+
+class TestRunRealOrDemo:
+    """Tests de l'analyse synchrone prompts × modèles"""
+
+    class _MatrixClient:
+        clients = {'m1': True, 'm2': True}
+        models = ['m1', 'm2']
+
+        def __init__(self, matrix):
+            self.matrix = matrix
+            self.generation = None
+
+        def query_matrix(self, prompts, priority=None, generation=None):
+            self.generation = generation
+            return {prompt: self.matrix[prompt] for prompt in prompts}
+
+    def test_each_model_keeps_its_own_response(self, monkeypatch):
+        """Test qu'aucune réponse n'est recopiée d'un modèle à l'autre"""
+        import app as app_module
+        matrix = {'p1': {'m1': {'response': 'MAIF puis AXA.', 'latency_ms': 12.0, 'error': None},
+                         'm2': {'response': '', 'latency_ms': 40.0, 'error': 'timeout'}}}
+        monkeypatch.setattr(app_module, 'get_llm_client', lambda: self._MatrixClient(matrix))
+        results = app_module._run_real_or_demo('MAIF', ['AXA'], ['p1'], limit=1)
+        analyses = results['responses'][0]['llm_analyses']
+        assert results['is_demo'] is False
+        assert analyses['m1']['analysis']['brands_mentioned'] == ['MAIF', 'AXA']
+        # Le modèle en échec ne compte pas comme une réponse sans mention
+        assert 'm2' not in analyses
+        assert results['responses'][0]['llm_failures'] == {'m2': {'error': 'timeout', 'latency_ms': 40.0}}
+        metrics = app_module.get_analyzer(['MAIF', 'AXA']).calculate_metrics(
+            [data['analysis'] for data in analyses.values()])
+        assert metrics['MAIF']['mention_rate'] == 100
+
+    def test_generation_budget_passed_and_usage_kept(self, monkeypatch):
+        """Test que le budget du projet atteint le client et que l'usage est conservé"""
+        import app as app_module
+        usage = {'prompt_eval_count': 120, 'eval_count': 300}
+        matrix = {'p1': {'m1': {'response': 'MAIF.', 'latency_ms': 5.0, 'error': None, 'usage': usage}}}
+        client = self._MatrixClient(matrix)
+        monkeypatch.setattr(app_module, 'get_llm_client', lambda: client)
+        results = app_module._run_real_or_demo('MAIF', ['AXA'], ['p1'], limit=1,
+                                               generation={'num_predict': 400})
+        assert client.generation == {'num_predict': 400}
+        assert results['responses'][0]['llm_analyses']['m1']['usage'] == usage
+
+    def test_all_cells_failed_falls_back_to_demo(self, monkeypatch):
+        import app as app_module
+        matrix = {'p1': {'m1': {'response': '', 'latency_ms': 1.0, 'error': 'http_503'}}}
+        monkeypatch.setattr(app_module, 'get_llm_client', lambda: self._MatrixClient(matrix))
+        assert app_module._run_real_or_demo('MAIF', ['AXA'], ['p1'], limit=1)['is_demo'] is True
+
+
+def _parse_sse(raw: str):
+    return [
+        json.loads(line[len('data: '):])
+        for line in raw.splitlines()
+        if line.startswith('data: ')
+    ]
+
+
+class TestAnalysisStreamRoute:
+    """Tests pour /api/run-analysis/stream"""
+
+    def test_analysis_stream_emits_live_ranking(self, auth_app, monkeypatch):
+        """Test que le classement live final correspond aux métriques enregistrées"""
+        import app as app_module
+        client = auth_app.test_client()
+        monkeypatch.setattr(app_module.time, 'sleep', lambda _seconds: None)
+        client.post('/api/auth/signup', json={'name': 'Alice', 'email': 'alice-stream@example.com',
+                                              'password': 'password123'})
+
+        response = client.post('/api/run-analysis/stream', json={
+            'brand': 'Brand Live',
+            'competitors': ['Competitor One', 'Competitor Two'],
+            'prompts': ['prompt 1', 'prompt 2'],
+            'demo': True
+        })
+        events = _parse_sse(response.get_data(as_text=True))
+
+        ranking_events = [event for event in events if event['type'] == 'ranking']
+        assert [event['current'] for event in ranking_events] == [1, 2]
+        assert {item['brand'] for item in ranking_events[-1]['ranking']} == {
+            'Brand Live', 'Competitor One', 'Competitor Two'
+        }
+        assert events[-1]['type'] == 'complete'
+
+        metrics = client.get('/api/metrics').get_json()
+        final_scores = {item['brand']: item['global_score'] for item in metrics['ranking']}
+        assert final_scores == {item['brand']: item['global_score'] for item in ranking_events[-1]['ranking']}
+
+    def test_analysis_stream_hedges_slow_first_chunk(self, auth_app, monkeypatch):
+        """Test qu'un flux lent à démarrer est doublé et que le doublon l'emporte"""
+        import threading
+        from datetime import timedelta
+        import app as app_module
+        from services.hedging import HedgePolicy
+        from services.llm_client import LLMClient, get_http_session, reset_http_session
+
+        monkeypatch.setenv('OLLAMA_API_KEY', 'test-key')
+        monkeypatch.setenv('OLLAMA_BASE_URL', 'https://llm.test/api')
+        monkeypatch.setenv('OLLAMA_MODELS', 'm1')
+        reset_http_session()
+        llm = LLMClient()
+        llm.streaming = True
+        llm.hedging = HedgePolicy(budget=1.0, min_samples=20)
+        for _ in range(20):
+            llm.hedging.observe('m1/stream', 0.01)
+
+        release = threading.Event()
+        streams = []
+
+        class _Ping:
+            elapsed = timedelta(milliseconds=5)
+
+            def raise_for_status(self):
+                return None
+
+            def json(self):
+                return {'message': {'content': 'ok'}}
+
+        class _Stream:
+            def __init__(self, slow):
+                self.slow, self.closed = slow, threading.Event()
+
+            def raise_for_status(self):
+                return None
+
+            def iter_lines(self):
+                if self.slow:
+                    release.wait(2)
+                for idx, piece in enumerate(['Brand Live ', 'puis Competitor One']):
+                    yield json.dumps({'message': {'content': piece}, 'done': idx == 1}).encode()
+
+            def close(self):
+                self.closed.set()
+
+        def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+            if not stream:
+                return _Ping()
+            streams.append(_Stream(slow=not streams))
+            return streams[-1]
+
+        monkeypatch.setattr(get_http_session(), 'post', fake_post)
+        monkeypatch.setattr(app_module, 'get_llm_client', lambda: llm)
+        try:
+            response = auth_app.test_client().post('/api/run-analysis/stream', json={
+                'brand': 'Brand Live',
+                'competitors': ['Competitor One'],
+                'prompts': ['prompt hedgé'],
+            })
+            events = _parse_sse(response.get_data(as_text=True))
+        finally:
+            release.set()
+            reset_http_session()
+
+        assert events[0]['is_demo'] is False
+        assert events[-1]['type'] == 'complete'
+        stats = llm.get_hedge_stats()['m1/stream']
+        assert (stats['hedged'], stats['hedge_wins']) == (1, 1)
+        assert len(streams) == 2
+        # Le flux perdant est fermé dès qu'il répond enfin
+        assert streams[0].closed.wait(2)
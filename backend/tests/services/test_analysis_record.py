@@ -0,0 +1,84 @@
+"""
+Tests des enregistrements d'analyse compacts (services/analysis_record.py)
+"""
+import json
+import pickle
+
+from services.analysis_record import AnalysisRecord, compact_results, json_default
+from services.analyzer import BrandAnalyzer
+from services.metrics_engine import MetricsAccumulator, MetricsCube
+
+
+def _legacy(mentioned, main):
+    positions = {b: idx + 1 for idx, b in enumerate(mentioned)}
+    return {
+        'brands_mentioned': mentioned, 'positions': positions,
+        'first_brand': mentioned[0] if mentioned else None,
+        'matmut_mentioned': main in mentioned, 'brand_mentioned': main in mentioned,
+        'brand_position': positions.get(main), 'matmut_position': positions.get(main),
+    }
+
+
+class TestAnalysisRecord:
+    """Tests du format compact et de sa vue dict"""
+
+    def test_round_trip_legacy_dict(self, sample_brands):
+        """Test qu'un dict historique compacté relit exactement les mêmes clés"""
+        brands = tuple(sample_brands)
+        legacy = _legacy(['BMW', sample_brands[0]], sample_brands[0])
+        record = AnalysisRecord.from_dict(legacy, brands)
+        assert isinstance(record, AnalysisRecord)
+        assert record == legacy
+        assert record.to_dict() == legacy
+        assert record.get('brand_position') == 2
+        assert record.get('absent', 'x') == 'x'
+        assert record.has(brands.index('BMW')) and not record.has(brands.index('Audi'))
+
+    def test_analyzer_returns_records(self, sample_brands):
+        """Test que analyze_response produit un enregistrement sérialisable"""
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        record = analyzer.analyze_response("Tesla est excellente, Audi aussi.")
+        assert isinstance(record, AnalysisRecord)
+        payload = json.loads(json.dumps({'analysis': record}, default=json_default))
+        assert payload['analysis'] == record.to_dict()
+        assert payload['analysis']['sentiments']['Tesla'] == 15
+        assert pickle.loads(pickle.dumps(record)) == record
+
+    def test_non_compactable_dicts_are_kept(self, sample_brands):
+        """Test que les formats atypiques restent des dicts"""
+        brands = tuple(sample_brands)
+        benchmark_demo = {'brands_mentioned': ['BMW'], 'positions': {'BMW': 1},
+                          'first_brand': 'BMW', 'main_brand_mentioned': False}
+        gap = {'brands_mentioned': ['BMW', 'Audi'], 'positions': {'BMW': 1, 'Audi': 3},
+               'first_brand': 'BMW'}
+        outsider = {'brands_mentioned': ['Renault'], 'positions': {'Renault': 1},
+                    'first_brand': 'Renault'}
+        for analysis in (benchmark_demo, gap, outsider):
+            assert AnalysisRecord.from_dict(analysis, brands) is analysis
+
+    def test_compact_results_shares_brand_tuple(self, sample_brands):
+        """Test que tout le snapshot partage un seul univers de marques"""
+        main = sample_brands[0]
+        results = {'brand': main, 'competitors': sample_brands[1:], 'responses': [
+            {'prompt': f'p{i}', 'llm_analyses': {
+                'm1': {'response': '', 'analysis': _legacy(sample_brands[i:i + 2], main)},
+                'm2': {'response': '', 'analysis': _legacy([], main)},
+            }} for i in range(3)
+        ]}
+        expected = json.loads(json.dumps(results))
+        compact_results(results)
+        records = [d['analysis'] for r in results['responses'] for d in r['llm_analyses'].values()]
+        assert all(isinstance(r, AnalysisRecord) for r in records)
+        assert len({id(r.brands) for r in records}) == 1
+        assert json.loads(json.dumps(results, default=json_default)) == expected
+
+    def test_metrics_fast_path_matches_dicts(self, sample_brands):
+        """Test que cube et accumulateur donnent le même résultat sur records et dicts"""
+        main = sample_brands[0]
+        dicts = [_legacy(sample_brands[i % 3:], main) for i in range(6)] + [_legacy(['Hors', 'BMW'], main)]
+        records = [AnalysisRecord.from_dict(d, tuple(sample_brands + ['Hors'])) for d in dicts]
+        assert all(isinstance(r, AnalysisRecord) for r in records)
+        assert MetricsCube(sample_brands, records).metrics() == MetricsCube(sample_brands, dicts).metrics()
+        acc = MetricsAccumulator(sample_brands)
+        acc.add_many(records)
+        assert acc.metrics() == MetricsCube(sample_brands, dicts).metrics()
@@ -1,8 +1,10 @@
 """
 Tests pour BrandAnalyzer (services/analyzer.py)
 """
+import unicodedata
+
 import pytest
-from services.analyzer import BrandAnalyzer
+from services.analyzer import BrandAnalyzer, get_analyzer, normalize_text
 
 
 class TestBrandAnalyzer:
@@ -36,6 +38,26 @@ class TestBrandAnalyzer:
         result = analyzer._normalize("")
         assert result == ""
 
+    def test_normalize_matches_nfd_folding(self):
+        """Test équivalence avec l'ancien repli NFD + encode ascii"""
+        text = "Çà et là, l'Œuvre « Crédit Mutuel » — straße, İstanbul, 東京 ñ"
+        legacy = unicodedata.normalize('NFD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+        assert normalize_text(text) == legacy
+
+
+class TestAnalyzerRegistry:
+    """Tests pour le registre process-wide get_analyzer"""
+
+    def test_same_brands_share_instance(self, sample_brands):
+        """Test que le même jeu de marques réutilise l'analyseur"""
+        assert get_analyzer(sample_brands) is get_analyzer(list(sample_brands))
+
+    def test_brand_order_is_part_of_key(self, sample_brands):
+        """Test que l'ordre compte (la première marque est la principale)"""
+        reordered = sample_brands[1:] + sample_brands[:1]
+        assert get_analyzer(sample_brands) is not get_analyzer(reordered)
+        assert get_analyzer(reordered).brands[0] == reordered[0]
+
 
 class TestExtractBrands:
     """Tests pour l'extraction de marques"""
@@ -73,6 +95,34 @@ class TestExtractBrands:
         brands_found = [b[0] for b in result]
         assert "Mercedes" in brands_found
 
+    def test_extract_overlapping_brands(self):
+        """Test marques qui se chevauchent (préfixe commun)"""
+        analyzer = BrandAnalyzer(brands=["Generali", "Generali Vie", "Vie Plus"])
+        result = analyzer.extract_brands("Le contrat Generali Vie Plus est cité.")
+        assert result == [("Generali", 11), ("Generali Vie", 11), ("Vie Plus", 20)]
+
+    def test_extract_respects_word_boundaries(self):
+        """Test qu'une marque incluse dans un mot n'est pas détectée"""
+        analyzer = BrandAnalyzer(brands=["MMA", "AXA"])
+        result = analyzer.extract_brands("Les MMAs et AXA-Assistance.")
+        assert result == [("AXA", 12)]
+
+    def test_extract_matches_legacy_loop(self):
+        """Test équivalence avec l'ancienne boucle une-regex-par-marque"""
+        import re
+        brands = ["Matmut", "MAIF", "Macif", "Crédit Agricole", "Agricole", "AXA"]
+        analyzer = BrandAnalyzer(brands=brands)
+        text = ("Selon nous la MACIF et la Matmut devancent AXA ; le Crédit Agricole "
+                "et Agricole Assurances suivent, la maif ferme la marche. Matmut encore.")
+        normalized = analyzer._normalize(text)
+        expected = []
+        for brand in brands:
+            match = re.search(r'\b' + re.escape(analyzer._normalize(brand)) + r'\b', normalized)
+            if match:
+                expected.append((brand, match.start()))
+        expected.sort(key=lambda x: x[1])
+        assert analyzer.extract_brands(text) == expected
+
 
 class TestCalculateMetrics:
     """Tests pour le calcul des métriques"""
@@ -189,3 +239,134 @@ class TestConfidenceScore:
         result = analyzer.calculate_confidence_score({}, 'Tesla')
         
         assert result['confidence'] is None
+
+
+class TestStructuredJsonAnalysis:
+    """Tests pour l'exploitation du JSON structuré du GEO system prompt"""
+
+    def test_json_ranking_drives_positions(self, sample_brands):
+        """Test que le classement JSON prime sur l'ordre du texte"""
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        text = ("BMW est cité d'abord, puis Tesla.\n```json\n"
+                '{"mentions": ["BMW", "Tesla"], "classement": {"tesla": 1, "BMW": 2}, '
+                '"premier": "Tesla", "sentiments": {"Tesla": "positif", "BMW": "neutre"}}\n```')
+        result = analyzer.analyze_response(text)
+        assert result['source'] == 'json'
+        assert result['brands_mentioned'] == ['Tesla', 'BMW']
+        assert result['positions'] == {'Tesla': 1, 'BMW': 2}
+        assert result['brand_position'] == 1
+        assert result['sentiment_labels'] == {'Tesla': 'positif', 'BMW': 'neutre'}
+
+    def test_json_without_brands_is_trusted(self, sample_brands):
+        """Test qu'un JSON vide valide donne zéro mention"""
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        text = 'Tesla apparaît ici.\n{"mentions": [], "classement": {}, "premier": null}'
+        result = analyzer.analyze_response(text)
+        assert result['source'] == 'json'
+        assert result['brands_mentioned'] == []
+
+    def test_fallback_to_regex(self, sample_brands):
+        """Test du repli regex sans JSON ou avec des noms hors benchmark"""
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        plain = analyzer.analyze_response("Audi puis Tesla.")
+        assert plain['source'] == 'regex'
+        assert plain['brands_mentioned'] == ['Audi', 'Tesla']
+
+        foreign = analyzer.analyze_response('Audi puis Tesla.\n{"mentions": ["Renault"]}')
+        assert foreign['source'] == 'regex'
+        assert foreign['brands_mentioned'] == ['Audi', 'Tesla']
+
+    def test_parse_stats_per_model(self, sample_brands):
+        """Test du taux de parsing JSON par modèle"""
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        responses = [{'llm_analyses': {
+            'm1': {'analysis': {'source': 'json'}},
+            'm2': {'analysis': {'source': 'regex'}},
+        }}, {'llm_analyses': {
+            'm1': {'analysis': {'source': 'regex'}},
+            'demo': {'analysis': {}},
+        }}]
+        stats = analyzer.calculate_parse_stats(responses)
+        assert stats['m1'] == {'json': 1, 'regex': 1, 'total': 2, 'json_rate': 50.0}
+        assert stats['m2']['json_rate'] == 0.0
+        assert 'demo' not in stats
+
+
+class TestAnalysisCache:
+    """Tests de la mémoïsation de analyze_response"""
+
+    def setup_method(self):
+        from services.analyzer import clear_analysis_cache
+        clear_analysis_cache()
+
+    def test_identical_response_is_a_hit(self, sample_brands):
+        """Test qu'une réponse identique n'est analysée qu'une fois"""
+        from services.analyzer import get_analysis_cache_stats
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        first = analyzer.analyze_response("Tesla devance BMW.")
+        first['brands_mentioned'].append('muté')
+        second = BrandAnalyzer(brands=sample_brands).analyze_response("Tesla devance BMW.")
+        assert second['brands_mentioned'] == ['Tesla', 'BMW']
+        stats = get_analysis_cache_stats()
+        assert (stats['hits'], stats['misses']) == (1, 1)
+
+    def test_added_absent_competitor_reuses_analysis(self):
+        """Test qu'un concurrent absent du texte ne force pas une ré-analyse"""
+        from services.analyzer import get_analysis_cache_stats
+        text = "MAIF puis AXA."
+        before = BrandAnalyzer(brands=['MAIF', 'AXA']).analyze_response(text)
+        after = BrandAnalyzer(brands=['MAIF', 'AXA', 'Allianz']).analyze_response(text)
+        assert after == before
+        assert get_analysis_cache_stats()['reused'] == 1
+
+    def test_added_present_competitor_is_reanalyzed(self):
+        """Test qu'un concurrent cité dans le texte déclenche une ré-analyse"""
+        from services.analyzer import get_analysis_cache_stats
+        text = "Allianz, MAIF puis AXA."
+        BrandAnalyzer(brands=['MAIF', 'AXA']).analyze_response(text)
+        after = BrandAnalyzer(brands=['MAIF', 'AXA', 'Allianz']).analyze_response(text)
+        assert after['brands_mentioned'] == ['Allianz', 'MAIF', 'AXA']
+        assert get_analysis_cache_stats()['misses'] == 2
+
+    def test_main_brand_change_is_reanalyzed(self):
+        """Test qu'un changement de marque principale invalide le résultat"""
+        text = "MAIF puis AXA."
+        BrandAnalyzer(brands=['MAIF', 'AXA']).analyze_response(text)
+        after = BrandAnalyzer(brands=['AXA', 'MAIF']).analyze_response(text)
+        assert after['brand_position'] == 2
+
+
+class TestStreamingExtractor:
+    """Tests de l'extraction incrémentale (génération en streaming)"""
+
+    TEXT = ('Pour un jeune conducteur, la MAIF est solide et Generali Vie aussi, AXA moins.\n'
+            '```json\n{"classement": {"Matmut": 1, "MAIF": 2}}\n```\nFin avec Matmut.')
+
+    @pytest.fixture
+    def analyzer(self):
+        return BrandAnalyzer(brands=['Matmut', 'MAIF', 'Generali', 'Generali Vie', 'AXA'])
+
+    @pytest.mark.parametrize('step', [1, 2, 5, 17, 1000])
+    def test_mentions_independent_of_chunk_edges(self, analyzer, step):
+        """Test qu'une marque coupée entre deux morceaux est trouvée une seule fois"""
+        extractor = analyzer.stream_extractor()
+        found = []
+        for start in range(0, len(self.TEXT), step):
+            found += extractor.feed(self.TEXT[start:start + step])
+        found += extractor.feed('', final=True)
+        assert found == ['MAIF', 'Generali', 'Generali Vie', 'AXA']
+
+    def test_json_block_brands_are_not_narrative(self, analyzer):
+        """Test que les marques du JSON (et après) ne sont pas émises"""
+        extractor = analyzer.stream_extractor()
+        found = extractor.feed(self.TEXT) + extractor.feed('', final=True)
+        assert 'Matmut' not in found
+
+    def test_closed_once_ranking_block_received(self, analyzer):
+        """Test que `closed` passe à vrai à la fin du bloc JSON"""
+        extractor = analyzer.stream_extractor()
+        cut = self.TEXT.index('}}') + 2
+        extractor.feed(self.TEXT[:cut - 1])
+        assert not extractor.closed
+        extractor.feed(self.TEXT[cut - 1:cut])
+        assert extractor.closed
@@ -0,0 +1,129 @@
+"""
+Tests pour le client LLM asynchrone (services/async_llm_client.py)
+"""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from services.async_llm_client import AsyncLLMClient
+
+
+class _FakeOllama:
+    """Serveur /chat local : enregistre les requêtes et leurs connexions"""
+
+    def __init__(self, fail_models=()):
+        self.payloads = []
+        self.peers = set()
+        self.fail_models = set(fail_models)
+
+    async def chat(self, request):
+        payload = await request.json()
+        self.payloads.append(payload)
+        self.peers.add(request.transport.get_extra_info('peername'))
+        if payload['model'] in self.fail_models:
+            return web.Response(status=401)
+        await asyncio.sleep(0.005)
+        prompt = payload['messages'][-1]['content']
+        return web.json_response({'message': {'content': f"{payload['model']}:{prompt}"}})
+
+
+async def _serve(fake):
+    app = web.Application()
+    app.router.add_post('/api/chat', fake.chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/api'
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    def _make(base_url):
+        monkeypatch.setenv('OLLAMA_API_KEY', 'test-key')
+        monkeypatch.setenv('OLLAMA_BASE_URL', base_url)
+        monkeypatch.setenv('OLLAMA_MODELS', 'm1,m2')
+        return AsyncLLMClient()
+    return _make
+
+
+class TestAsyncLLMClient:
+    """Tests de la session partagée et de la parité avec le client synchrone"""
+
+    def test_system_prompt_and_chat_options_are_sent(self, make_client):
+        """Test que le system prompt et think=False partent comme en synchrone"""
+        fake = _FakeOllama()
+
+        async def main():
+            runner, base_url = await _serve(fake)
+            try:
+                async with make_client(base_url) as client:
+                    return await client.query_model('prompt', 'm1', use_cache=False,
+                                                    system_prompt='GEO')
+            finally:
+                await runner.cleanup()
+
+        assert asyncio.run(main()) == 'm1:prompt'
+        payload = fake.payloads[0]
+        assert payload['messages'][0] == {'role': 'system', 'content': 'GEO'}
+        assert (payload['think'], payload['stream']) == (False, False)
+
+    def test_matrix_multiplexes_over_few_sockets(self, make_client, monkeypatch):
+        """Test que la matrice passe par une seule session bornée"""
+        import services.async_llm_client as async_module
+        monkeypatch.setattr(async_module, 'ASYNC_CONNECTION_LIMIT_PER_HOST', 4)
+        fake = _FakeOllama(fail_models={'m2'})
+
+        async def main():
+            runner, base_url = await _serve(fake)
+            try:
+                client = make_client(base_url)
+                matrix = await client.query_matrix([f'p{n}' for n in range(20)], use_cache=False)
+                session = client.session()
+                await client.close()
+                return matrix, session
+            finally:
+                await runner.cleanup()
+
+        matrix, session = asyncio.run(main())
+        assert session.closed
+        assert sum(payload['model'] == 'm1' for payload in fake.payloads) == 20
+        assert len(fake.peers) <= 4
+        assert matrix['p7']['m1'] == {'response': 'm1:p7', 'error': None, 'usage': None,
+                                      'latency_ms': matrix['p7']['m1']['latency_ms']}
+        # m2 refusé : quelques 401 puis le disjoncteur coupe les appels restants
+        errors = {matrix[f'p{n}']['m2']['error'] for n in range(20)}
+        assert errors == {'http_401', 'breaker_open'}
+
+    def test_run_matrix_is_blocking_entry_point(self, make_client, monkeypatch):
+        """Test que run_matrix tourne dans sa propre boucle et ferme la session"""
+        client = make_client('http://127.0.0.1:9/api')
+        sessions = []
+
+        async def fake_query(prompt, model, use_cache=True, system_prompt=None, session=None,
+                             priority=None, generation=None):
+            sessions.append(client.session())
+            return f'{model}:{prompt}', None, None
+
+        monkeypatch.setattr(client, '_query', fake_query)
+        matrix = client.run_matrix(['p1', 'p2'])
+        assert matrix['p2']['m2']['response'] == 'm2:p2'
+        assert len({id(session) for session in sessions}) == 1
+        assert sessions[0].closed and client._session is None
+
+    def test_rate_limiter_runs_off_the_event_loop(self, make_client):
+        """Test que la transaction SQLite du limiteur ne bloque pas la boucle"""
+        import threading
+        client = make_client('http://127.0.0.1:9/api')
+        threads = []
+
+        class _Limiter:
+            def reserve_slot(self, bucket, tokens, priority):
+                threads.append(threading.get_ident())
+                return 0.0
+
+        client.rate_limiter = _Limiter()
+        assert asyncio.run(client._acquire_rate('k:m1', 10, 'interactive')) is True
+        assert threads and threads[0] != threading.get_ident()
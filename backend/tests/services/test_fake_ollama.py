@@ -0,0 +1,172 @@
+"""
+Tests du faux serveur Ollama (fake_ollama.py)
+"""
+import json
+import random
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from fake_ollama import create_fake_ollama, geo_answer, parse_latency, parse_latency_map
+from services.analyzer import BrandAnalyzer
+from services.llm_client import LLMClient, reset_http_session
+from utils import build_geo_prompt, extract_json_block, generate_benchmark_prompt
+
+BRANDS = ['Tesla', 'BMW', 'Audi']
+
+
+def _messages(prompt='Quelle voiture electrique choisir ?'):
+    return [{'role': 'system', 'content': build_geo_prompt(BRANDS)},
+            {'role': 'user', 'content': prompt}]
+
+
+class TestLatencyDistributions:
+    """Tests du parsing des distributions de latence"""
+
+    def test_fixed_and_uniform(self):
+        """Test des distributions fixe et uniforme (en secondes)"""
+        rng = random.Random(1)
+        assert parse_latency('fixed:250')(rng) == 0.25
+        assert 0.1 <= parse_latency('uniform:100,300')(rng) <= 0.3
+
+    def test_lognormal_median(self):
+        """Test que la médiane lognormale est respectée"""
+        rng = random.Random(1)
+        sampler = parse_latency('lognormal:400,0.5')
+        draws = sorted(sampler(rng) for _ in range(2001))
+        assert 0.36 < draws[1000] < 0.44
+
+    def test_per_model_map_and_invalid_spec(self):
+        """Test des latences par modèle et du rejet d'une spec invalide"""
+        samplers = parse_latency_map('m1=fixed:800;fixed:100')
+        rng = random.Random(1)
+        assert samplers['m1'](rng) == 0.8
+        assert samplers['*'](rng) == 0.1
+        with pytest.raises(ValueError):
+            parse_latency('gaussian:1')
+
+
+class TestFakeAnswers:
+    """Tests du contenu déterministe"""
+
+    def test_answer_is_deterministic_and_parsable(self):
+        """Test que la réponse cite les marques du benchmark dans un JSON exploitable"""
+        text = geo_answer('m1', _messages())
+        assert text == geo_answer('m1', _messages())
+
+        payload = json.loads(text.split('```json')[1].split('```')[0])
+        record = BrandAnalyzer(BRANDS).analyze_response(text)
+        assert record['source'] == 'json'
+        assert record['brands_mentioned'] == payload['mentions']
+        assert record['first_brand'] == payload['premier']
+
+
+class TestFakeChatRoute:
+    """Tests de /api/chat"""
+
+    def test_non_streaming_chat(self):
+        """Test d'une réponse complète avec compteurs de tokens"""
+        client = create_fake_ollama(latency='fixed:0').test_client()
+        response = client.post('/api/chat', json={'model': 'm1', 'messages': _messages(),
+                                                  'stream': False})
+        data = response.get_json()
+
+        assert response.status_code == 200
+        assert data['done'] is True
+        assert '```json' in data['message']['content']
+        assert data['eval_count'] > 0
+
+    def test_streaming_chat_reassembles(self):
+        """Test que les morceaux NDJSON recomposent la réponse complète"""
+        client = create_fake_ollama(latency='fixed:0').test_client()
+        response = client.post('/api/chat', json={'model': 'm1', 'messages': _messages(),
+                                                  'stream': True})
+        chunks = [json.loads(line) for line in response.data.decode().splitlines() if line]
+
+        assert len(chunks) > 2
+        assert chunks[-1]['done'] is True
+        assert ''.join(c['message']['content'] for c in chunks) == geo_answer('m1', _messages())
+
+    def test_error_and_timeout_injection(self):
+        """Test des erreurs HTTP injectées et des requêtes qui pendent"""
+        slept = []
+        client = create_fake_ollama(error_rate=1.0, error_codes='503',
+                                    sleep=slept.append).test_client()
+        response = client.post('/api/chat', json={'model': 'm1', 'messages': _messages()})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+        client = create_fake_ollama(timeout_rate=1.0, hang=90, sleep=slept.append).test_client()
+        client.post('/api/chat', json={'model': 'm1', 'messages': _messages(), 'stream': False})
+        assert 90 in slept
+        assert client.get('/api/stats').get_json()['timeouts'] == 1
+
+    def test_generate_config_prompt(self):
+        """Test du JSON produits/concurrents de /api/generate-config"""
+        client = create_fake_ollama().test_client()
+        prompt = ('Tu prepares un benchmark GEO neutre pour la marque "Matmut" dans le secteur '
+                  '"Assurance".\nFormat strict attendu:\n{"products":[],"suggested_competitors":[]}')
+        response = client.post('/api/chat', json={'model': 'm1', 'stream': False,
+                                                  'messages': [{'role': 'user', 'content': prompt}]})
+        config = json.loads(response.get_json()['message']['content'])
+
+        assert len(config['products']) >= 3
+        assert 3 <= len(config['suggested_competitors']) <= 5
+
+    def test_benchmark_prompt(self):
+        """Test du JSON produits/prompts SEO de /api/benchmark"""
+        client = create_fake_ollama().test_client()
+        prompt = generate_benchmark_prompt(BRANDS)
+        response = client.post('/api/chat', json={'model': 'm1', 'stream': False,
+                                                  'messages': [{'role': 'user', 'content': prompt}]})
+        _, config = extract_json_block(response.get_json()['message']['content'])
+
+        assert config['brands'] == BRANDS
+        assert 3 <= len(config['products']) <= 5
+        assert 1 <= len(config['seo_prompts']) <= 6
+        assert all(brand in config['seo_prompts'][0] for brand in BRANDS)
+
+    def test_stats_counted_under_concurrency(self):
+        """Test que les compteurs ne perdent aucune requête concurrente"""
+        client = create_fake_ollama().test_client()
+        body = {'model': 'm1', 'messages': _messages(), 'stream': False}
+        threads = [threading.Thread(target=client.post, args=('/api/chat',), kwargs={'json': body})
+                   for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert client.get('/api/stats').get_json()['requests'] == 16
+
+
+class TestLLMClientAgainstFakeServer:
+    """Test de bout en bout : LLMClient → HTTP → faux serveur"""
+
+    @pytest.fixture
+    def base_url(self):
+        server = make_server('127.0.0.1', 0, create_fake_ollama(latency='fixed:0'), threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f'http://127.0.0.1:{server.server_port}/api'
+        server.shutdown()
+
+    def test_query_and_stream(self, base_url, monkeypatch):
+        """Test d'une requête complète et d'une requête en streaming"""
+        monkeypatch.setenv('OLLAMA_BASE_URL', base_url)
+        monkeypatch.setenv('OLLAMA_API_KEY', 'fake')
+        monkeypatch.setenv('OLLAMA_MODELS', 'm1')
+        reset_http_session()
+        try:
+            client = LLMClient()
+            system = build_geo_prompt(BRANDS)
+            prompt = 'Quelle voiture electrique choisir ?'
+            text = client.query_model(prompt, 'm1', use_cache=False, system_prompt=system)
+            streamed = client.query_model_stream(prompt, 'm1', system_prompt=system, use_cache=False)
+        finally:
+            reset_http_session()
+
+        assert text == geo_answer('m1', _messages(prompt))
+        assert streamed.startswith(text.split('```')[0])
+        assert client.get_telemetry()['m1']['successes'] == 2
@@ -0,0 +1,77 @@
+"""
+Tests du budget de génération (services/generation.py)
+"""
+import pytest
+
+from services import generation
+from services.generation import cache_options, normalize_generation_settings, resolve_generation
+
+
+class TestNormalizeGenerationSettings:
+    """Tests de la validation des réglages de projet"""
+
+    def test_values_are_coerced_and_unknown_keys_dropped(self):
+        """Test que les entiers et durées sont normalisés"""
+        settings = normalize_generation_settings({
+            'num_predict': '700', 'num_ctx': 4096, 'keep_alive': '300', 'temperature': 2,
+            'models': {'m1': {'keep_alive': '30m'}, 'm2': {}}})
+        assert settings == {'num_predict': 700, 'num_ctx': 4096, 'keep_alive': 300,
+                            'models': {'m1': {'keep_alive': '30m'}}}
+        assert normalize_generation_settings(None) == {}
+
+    @pytest.mark.parametrize('raw', [
+        {'num_predict': 0},
+        {'num_ctx': 'beaucoup'},
+        {'keep_alive': 'toujours'},
+        {'keep_alive': True},
+        {'models': ['m1']},
+        {'models': {'m1': {'num_ctx': 10}}},
+        ['num_predict'],
+    ])
+    def test_invalid_values_are_rejected(self, raw):
+        """Test qu'une valeur hors limites ou mal typée lève ValueError"""
+        with pytest.raises(ValueError):
+            normalize_generation_settings(raw)
+
+
+def _reload_env(monkeypatch):
+    """Relit le .env comme au démarrage (ENV_DEFAULTS est figé à l'import)"""
+    monkeypatch.setattr(generation, 'ENV_DEFAULTS', generation._env_defaults())
+
+
+class TestResolveGeneration:
+    """Tests de la priorité modèle > projet > .env"""
+
+    def test_model_override_wins_over_project_and_env(self, monkeypatch):
+        """Test de l'ordre de priorité des réglages"""
+        monkeypatch.setenv('OLLAMA_NUM_CTX', '2048')
+        monkeypatch.setenv('OLLAMA_KEEP_ALIVE', '7h')
+        _reload_env(monkeypatch)
+        settings = {'num_predict': 700, 'models': {'m1': {'num_predict': 300}}}
+        assert resolve_generation(settings, 'm1') == {
+            'options': {'num_predict': 300, 'num_ctx': 2048}, 'keep_alive': '7h'}
+        assert resolve_generation(settings, 'm2')['options']['num_predict'] == 700
+
+    def test_nothing_configured_keeps_ollama_defaults(self, monkeypatch):
+        """Test qu'aucun réglage ne produit ni options ni keep_alive"""
+        for env in ('OLLAMA_NUM_PREDICT', 'OLLAMA_NUM_CTX', 'OLLAMA_KEEP_ALIVE'):
+            monkeypatch.delenv(env, raising=False)
+        _reload_env(monkeypatch)
+        assert resolve_generation(None, 'm1') == {}
+        assert cache_options({'stream': False}, {}) == {'stream': False}
+
+    def test_invalid_env_is_ignored(self, monkeypatch):
+        """Test qu'une variable .env invalide n'empêche pas les appels"""
+        monkeypatch.setenv('OLLAMA_NUM_PREDICT', 'illimité')
+        _reload_env(monkeypatch)
+        assert resolve_generation({'keep_alive': -1}, 'm1') == {'keep_alive': -1}
+
+    def test_env_is_parsed_once(self, monkeypatch, capsys):
+        """Test que résoudre ne relit pas le .env et ne répète pas l'avertissement"""
+        monkeypatch.setenv('OLLAMA_NUM_PREDICT', 'illimité')
+        _reload_env(monkeypatch)
+        capsys.readouterr()
+        monkeypatch.setenv('OLLAMA_NUM_CTX', '2048')
+        for _ in range(3):
+            assert resolve_generation(None, 'm1') == {}
+        assert capsys.readouterr().out == ''
@@ -0,0 +1,94 @@
+"""
+Tests des requêtes hedgées (services/hedging.py)
+"""
+import threading
+import time
+
+from services.hedging import HedgePolicy
+
+
+def _warm(policy, model='m1', seconds=0.01, count=20):
+    for _ in range(count):
+        policy.observe(model, seconds)
+
+
+class _SlowThenFast:
+    """Premier appel lent (libéré par l'Event), les suivants immédiats"""
+
+    def __init__(self, first_result=('lent', None), next_result=('rapide', None)):
+        self.calls = 0
+        self.release = threading.Event()
+        self.first_result, self.next_result = first_result, next_result
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            self.release.wait(2)
+            return self.first_result
+        return self.next_result
+
+
+class TestHedgePolicy:
+    """Tests du déclenchement, du budget et des statistiques"""
+
+    def test_no_hedge_before_enough_samples(self):
+        """Test qu'aucun doublon ne part tant que le p90 est inconnu"""
+        policy = HedgePolicy(budget=1.0, min_samples=20)
+        assert policy.hedge_delay('m1') is None
+        assert policy.run('m1', lambda: ('ok', None)) == ('ok', None)
+        assert policy.stats()['m1']['hedged'] == 0
+
+    def test_hedge_wins_over_slow_primary(self):
+        """Test que le doublon l'emporte et que le gain est mesuré"""
+        policy = HedgePolicy(budget=1.0, min_samples=20)
+        _warm(policy)
+        fn = _SlowThenFast()
+        assert policy.run('m1', fn) == ('rapide', None)
+        # Gain mesurable même sur une machine rapide (saved_ms arrondi au dixième)
+        time.sleep(0.01)
+        fn.release.set()
+        deadline = time.time() + 2
+        while policy.stats()['m1']['saved_ms'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        stats = policy.stats()['m1']
+        assert (stats['requests'], stats['hedged'], stats['hedge_wins']) == (1, 1, 1)
+        assert stats['saved_ms'] > 0
+        assert stats['hedge_delay_ms'] == 10.0
+
+    def test_budget_caps_extra_requests(self):
+        """Test qu'un budget nul n'envoie jamais de doublon"""
+        policy = HedgePolicy(budget=0.0, min_samples=20)
+        _warm(policy, seconds=0.001)
+        fn = _SlowThenFast()
+        threading.Timer(0.05, fn.release.set).start()
+        assert policy.run('m1', fn) == ('lent', None)
+        assert fn.calls == 1
+
+    def test_failed_hedge_waits_for_primary(self):
+        """Test qu'un doublon en échec ne remplace pas une réponse valide"""
+        policy = HedgePolicy(budget=1.0, min_samples=20)
+        _warm(policy, seconds=0.001)
+        fn = _SlowThenFast(next_result=('', 'timeout'))
+        threading.Timer(0.05, fn.release.set).start()
+        assert policy.run('m1', fn) == ('lent', None)
+        assert policy.stats()['m1']['hedge_wins'] == 0
+
+    def test_losing_call_handed_to_on_discard(self):
+        """Test que le résultat perdant est rendu à on_discard (flux à fermer)"""
+        policy = HedgePolicy(budget=1.0, min_samples=20)
+        _warm(policy)
+        fn = _SlowThenFast()
+        discarded = threading.Event()
+        seen = []
+
+        def _discard(result):
+            seen.append(result)
+            discarded.set()
+
+        assert policy.run('m1', fn, on_discard=_discard) == ('rapide', None)
+        fn.release.set()
+        assert discarded.wait(2)
+        assert seen == [('lent', None)]
@@ -0,0 +1,107 @@
+"""
+Tests pour l'extraction de bloc JSON (utils/json_blocks.py)
+"""
+import time
+
+import pytest
+from utils.json_blocks import JsonBlockScanner, extract_json_block
+
+
+class TestExtractJsonBlock:
+    """Tests fonctionnels"""
+
+    def test_fenced_json_block(self):
+        text = 'Narration Tesla.\n```json\n{"mentions": ["Tesla"], "premier": "Tesla"}\n```'
+        narrative, data = extract_json_block(text)
+        assert narrative == 'Narration Tesla.'
+        assert data == {'mentions': ['Tesla'], 'premier': 'Tesla'}
+
+    def test_nested_unfenced_json(self):
+        """L'ancien repli rfind('{') ne savait pas lire un JSON imbriqué"""
+        text = 'Texte.\n{"classement": {"Tesla": 1, "BMW": 2}, "mentions": ["Tesla", "BMW"]}'
+        narrative, data = extract_json_block(text)
+        assert narrative == 'Texte.'
+        assert data['classement'] == {'Tesla': 1, 'BMW': 2}
+
+    def test_braces_inside_strings(self):
+        text = '```\n{"resume": "accolade } et \\" guillemet {", "mentions": []}\n```'
+        _, data = extract_json_block(text)
+        assert data['resume'] == 'accolade } et " guillemet {'
+
+    def test_fenced_block_has_priority_over_later_object(self):
+        text = '```json\n{"a": 1}\n```\nPuis {"b": 2}'
+        _, data = extract_json_block(text)
+        assert data == {'a': 1}
+
+    def test_last_valid_unfenced_object(self):
+        text = 'Voir {exemple} puis {"a": 1} et enfin {"b": 2}'
+        narrative, data = extract_json_block(text)
+        assert data == {'b': 2}
+        assert narrative.endswith('et enfin')
+
+    def test_other_language_fence_is_ignored(self):
+        """Un bloc ```python précédant le bloc ```json ne coupe pas la narration"""
+        text = ('Tesla est citée.\n```python\nconfig = {"a": 1}\n```\n'
+                'Puis BMW et Audi.\n```json\n{"mentions": ["Tesla", "BMW", "Audi"]}\n```')
+        narrative, data = extract_json_block(text)
+        assert data == {'mentions': ['Tesla', 'BMW', 'Audi']}
+        assert narrative.endswith('Puis BMW et Audi.')
+
+    def test_json_fence_has_priority_over_plain_fence(self):
+        text = 'Intro.\n```\n{"a": 1}\n```\nSuite.\n```json\n{"b": 2}\n```'
+        assert extract_json_block(text)[1] == {'b': 2}
+        assert extract_json_block('Intro.\n```\n{"a": 1}\n```\nPuis {"b": 2}')[1] == {'a': 1}
+
+    def test_unmatched_brace_in_narrative(self):
+        """Un `{` jamais refermé dans la narration n'empêche pas de trouver le JSON"""
+        text = 'Prix {environ 300 euros selon Tesla.\n{"mentions": ["Tesla"]}'
+        narrative, data = extract_json_block(text)
+        assert data == {'mentions': ['Tesla']}
+        assert narrative == 'Prix {environ 300 euros selon Tesla.'
+
+    def test_unbalanced_object_dropped_for_new_candidate(self):
+        """Un objet tronqué est abandonné au candidat suivant en début de ligne"""
+        text = 'Exemple {"prix": {"min": 300\nAu final :\n{"mentions": ["BMW"]}'
+        assert extract_json_block(text)[1] == {'mentions': ['BMW']}
+
+    def test_no_json(self):
+        text = 'Aucune donnée structurée ici.'
+        assert extract_json_block(text) == (text, None)
+        assert extract_json_block('') == ('', None)
+
+    def test_incremental_feed_matches_one_shot(self):
+        text = 'Intro.\n``' + '`json\n{"mentions": ["A"], "x": "\\\\"}\n``' + '`\nFin'
+        scanner = JsonBlockScanner()
+        for idx in range(0, len(text), 3):
+            scanner.feed(text[idx:idx + 3])
+        scanner.feed('', final=True)
+        assert scanner.closed
+        assert scanner.result() == extract_json_block(text)
+
+    def test_incremental_feed_with_brace_at_chunk_edge(self):
+        """Un `{` en fin de morceau attend la suite pour savoir s'il ouvre un objet"""
+        text = 'Voir {environ} puis {"a": {"b": 1}} fin'
+        for step in (1, 2, 7):
+            scanner = JsonBlockScanner()
+            for idx in range(0, len(text), step):
+                scanner.feed(text[idx:idx + step])
+            scanner.feed('', final=True)
+            assert scanner.result() == extract_json_block(text)
+            assert scanner.result()[1] == {'a': {'b': 1}}
+
+
+class TestAdversarialInputs:
+    """Le scanner doit rester linéaire sur des entrées pathologiques"""
+
+    @pytest.mark.parametrize('text', [
+        '```json {' * 20000,
+        '```' * 50000,
+        '{' * 200000,
+        '{"a": "' + '\\\\' * 100000,
+        '{x}' * 60000,
+        '```\n{"a": [' + '1,' * 100000 + '\n```',
+    ])
+    def test_pathological_input_is_fast(self, text):
+        start = time.perf_counter()
+        extract_json_block(text)
+        assert time.perf_counter() - start < 1.0
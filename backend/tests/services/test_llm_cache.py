@@ -0,0 +1,97 @@
+"""
+Tests du cache de réponses LLM (services/llm_cache.py)
+"""
+from services.llm_cache import DiskResponseCache, ResponseCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache:
+    """Tests LRU + TTL + statistiques"""
+
+    def test_key_covers_all_inputs(self):
+        """Test que chaque composante change la clé"""
+        base = ResponseCache.make_key('m1', 'prompt', 'system', {'think': False})
+        assert base == ResponseCache.make_key('m1', 'prompt', 'system', {'think': False})
+        assert base != ResponseCache.make_key('m2', 'prompt', 'system', {'think': False})
+        assert base != ResponseCache.make_key('m1', 'prompt!', 'system', {'think': False})
+        assert base != ResponseCache.make_key('m1', 'prompt', 'autre', {'think': False})
+        assert base != ResponseCache.make_key('m1', 'prompt', 'system', {'think': True})
+
+    def test_lru_eviction(self):
+        """Test que l'entrée la moins récemment lue est évincée"""
+        cache = ResponseCache(max_entries=2, ttl=60)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        assert cache.get('a') == '1'
+        cache.set('c', '3')
+        assert cache.get('b') is None
+        assert cache.get('a') == '1' and cache.get('c') == '3'
+        assert cache.stats()['evictions'] == 1
+
+    def test_ttl_expiration(self):
+        """Test que les entrées expirent après le TTL"""
+        clock = _Clock()
+        cache = ResponseCache(max_entries=10, ttl=30, clock=clock)
+        cache.set('a', '1')
+        clock.now = 29
+        assert cache.get('a') == '1'
+        clock.now = 31
+        assert cache.get('a') is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['expirations'], stats['size']) == (1, 1, 1, 0)
+        assert stats['hit_rate'] == 50.0
+
+
+class TestDiskResponseCache:
+    """Tests du niveau disque partagé entre process"""
+
+    def test_second_process_reads_from_disk(self, tmp_path):
+        """Test qu'un autre process (autre cache mémoire) lit l'entrée sur disque"""
+        path = str(tmp_path / 'llm_cache.db')
+        worker_a = ResponseCache(ttl=60, disk=DiskResponseCache(path))
+        worker_b = ResponseCache(ttl=60, disk=DiskResponseCache(path))
+        worker_a.set('k', 'réponse')
+        assert worker_b.get('k') == 'réponse'
+        assert worker_b.stats()['disk']['hits'] == 1
+        # Promu en mémoire : la lecture suivante ne touche plus le disque
+        assert worker_b.get('k') == 'réponse'
+        assert worker_b.stats()['hits'] == 1
+
+    def test_disk_ttl_and_lru_cap(self, tmp_path):
+        """Test de l'expiration et de la taille maximale sur disque"""
+        clock = _Clock()
+        disk = DiskResponseCache(str(tmp_path / 'c.db'), max_entries=2, clock=clock)
+        disk.set('a', '1', ttl=10)
+        clock.now = 1
+        disk.set('b', '2', ttl=10)
+        clock.now = 2
+        disk.set('c', '3', ttl=10)
+        disk.prune()
+        assert disk.get('a') is None and len(disk) == 2
+        clock.now = 20
+        assert disk.get('b') is None
+
+    def test_clear_purges_both_tiers(self, tmp_path):
+        """Test que clear vide la mémoire et le disque"""
+        disk = DiskResponseCache(str(tmp_path / 'c.db'))
+        cache = ResponseCache(ttl=60, disk=disk)
+        cache.set('k', 'v')
+        cache.clear()
+        assert len(cache) == 0 and len(disk) == 0
+        assert cache.get('k') is None
+
+    def test_sqlite_errors_count_as_misses(self, tmp_path):
+        """Test qu'un disque inutilisable ne casse pas le cache"""
+        disk = DiskResponseCache(str(tmp_path))  # un répertoire : SQLite échoue
+        cache = ResponseCache(ttl=60, disk=disk)
+        cache.set('k', 'v')
+        assert cache.get('k') == 'v'
+        assert ResponseCache(ttl=60, disk=disk).get('k') is None
+        assert disk.stats()['errors'] >= 2
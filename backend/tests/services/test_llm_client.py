@@ -0,0 +1,421 @@
+"""
+Tests pour le client LLM (services/llm_client.py)
+"""
+from datetime import timedelta
+
+import pytest
+import requests
+
+from services import llm_client as llm_module
+from services.llm_cache import ResponseCache
+from services.llm_client import (CHAT_OPTIONS, LLMClient, get_http_session, get_llm_client,
+                                 reset_http_session, reset_llm_clients)
+
+
+class _FakeResponse:
+    def __init__(self, content, counts=None):
+        self._content = content
+        self._counts = counts or {}
+        self.elapsed = timedelta(milliseconds=5)
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return {'message': {'content': self._content}, **self._counts}
+
+
+class _FakeErrorResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        raise requests.exceptions.HTTPError(f'{self.status_code}', response=self)
+
+
+class _FakeStreamResponse:
+    """Réponse NDJSON d'Ollama en streaming"""
+
+    def __init__(self, pieces):
+        self._pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    def raise_for_status(self):
+        return None
+
+    def iter_lines(self):
+        import json as _json
+        for idx, piece in enumerate(self._pieces):
+            self.read += 1
+            done = idx == len(self._pieces) - 1
+            yield _json.dumps({'message': {'content': piece}, 'done': done}).encode()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def cloud_client(monkeypatch):
+    monkeypatch.setenv('OLLAMA_API_KEY', 'test-key')
+    monkeypatch.setenv('OLLAMA_BASE_URL', 'https://llm.test/api')
+    monkeypatch.setenv('OLLAMA_MODELS', 'm1,m2')
+    reset_http_session()
+    yield LLMClient()
+    reset_http_session()
+
+
+class TestSharedHttpSession:
+    """Tests de la session HTTP partagée"""
+
+    def test_session_is_shared_and_pooled(self, cloud_client):
+        """Test qu'une seule session est réutilisée avec un pool dimensionné"""
+        session = get_http_session()
+        assert get_http_session() is session
+        adapter = session.get_adapter('https://llm.test/api/chat')
+        assert adapter._pool_maxsize == llm_module.HTTP_POOL_SIZE
+
+    def test_session_recreated_after_fork(self, cloud_client, monkeypatch):
+        """Test qu'un autre pid (worker forké) obtient sa propre session"""
+        session = get_http_session()
+        monkeypatch.setattr(llm_module.os, 'getpid', lambda: -1)
+        assert get_http_session() is not session
+
+    def test_query_model_goes_through_session(self, cloud_client, monkeypatch):
+        """Test que query_model passe par post_chat et la session partagée"""
+        calls = []
+
+        def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+            calls.append((url, headers['Authorization'], json['model'], timeout))
+            return _FakeResponse('réponse')
+
+        monkeypatch.setattr(get_http_session(), 'post', fake_post)
+        assert cloud_client.query_model('prompt', 'm2', use_cache=False) == 'réponse'
+        assert calls == [('https://llm.test/api/chat', 'Bearer test-key', 'm2', cloud_client.timeout)]
+
+        cloud_client.post_chat([{'role': 'user', 'content': 'x'}], timeout=25)
+        assert calls[-1][2:] == ('m1', 25)
+
+
+class TestLLMClientRegistry:
+    """Tests du registre de clients partagés"""
+
+    def setup_method(self):
+        reset_llm_clients()
+
+    def teardown_method(self):
+        reset_llm_clients()
+
+    def test_same_config_shares_client_and_cache(self, cloud_client):
+        """Test que le cache survit entre deux requêtes"""
+        first = get_llm_client()
+        first.cache.set(ResponseCache.make_key('m1', 'prompt', None, CHAT_OPTIONS), 'réponse')
+        second = get_llm_client()
+        assert second is first
+        assert second.query_model('prompt', 'm1') == 'réponse'
+
+    def test_config_change_gives_new_client(self, cloud_client, monkeypatch):
+        """Test qu'une autre configuration donne un autre client"""
+        first = get_llm_client()
+        monkeypatch.setenv('OLLAMA_MODELS', 'm3')
+        second = get_llm_client()
+        assert second is not first
+        assert second.models == ['m3']
+
+    def test_concurrent_access_builds_one_client(self, cloud_client):
+        """Test qu'un accès concurrent ne construit qu'un seul client"""
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(lambda _: get_llm_client(), range(32)))
+        assert len({id(c) for c in clients}) == 1
+
+
+class TestResponseCacheKeys:
+    """Tests des clés de cache du client"""
+
+    def test_prompts_sharing_a_prefix_do_not_collide(self, cloud_client, monkeypatch):
+        """Test que deux prompts au même préfixe de 120 caractères restent distincts"""
+        answers = iter(['première', 'seconde'])
+        monkeypatch.setattr(get_http_session(), 'post',
+                            lambda *args, **kwargs: _FakeResponse(next(answers)))
+        prefix = 'x' * 120
+        assert cloud_client.query_model(prefix + ' A', 'm1') == 'première'
+        assert cloud_client.query_model(prefix + ' B', 'm1') == 'seconde'
+        assert cloud_client.query_model(prefix + ' A', 'm1') == 'première'
+        assert cloud_client.get_cache_stats()['hits'] == 1
+
+    def test_system_prompt_is_part_of_the_key(self, cloud_client, monkeypatch):
+        """Test qu'une autre liste de marques (system prompt) ne sert pas le cache"""
+        answers = iter(['benchmark 1', 'benchmark 2'])
+        monkeypatch.setattr(get_http_session(), 'post',
+                            lambda *args, **kwargs: _FakeResponse(next(answers)))
+        assert cloud_client.query_model('p', 'm1', system_prompt='Marques: A, B') == 'benchmark 1'
+        assert cloud_client.query_model('p', 'm1', system_prompt='Marques: C, D') == 'benchmark 2'
+
+    def test_identical_in_flight_queries_are_coalesced(self, cloud_client, monkeypatch):
+        """Test que deux requêtes identiques simultanées n'appellent le fournisseur qu'une fois"""
+        import threading
+        import time
+        calls = []
+
+        def slow_post(*args, **kwargs):
+            calls.append(1)
+            time.sleep(0.05)
+            return _FakeResponse('partagée')
+
+        monkeypatch.setattr(get_http_session(), 'post', slow_post)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            cloud_client.query_model('p', 'm1', use_cache=False))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ['partagée'] * 4
+        assert len(calls) == 1
+        assert cloud_client.get_coalesce_stats()['coalesced'] == 3
+
+
+class TestRetriesAndBreaker:
+    """Tests des retries et du disjoncteur dans query_model"""
+
+    @pytest.fixture
+    def sleeps(self, monkeypatch):
+        waited = []
+        monkeypatch.setattr(llm_module.time, 'sleep', waited.append)
+        return waited
+
+    def test_transient_errors_are_retried(self, cloud_client, monkeypatch, sleeps):
+        """Test qu'un 503 puis une erreur de connexion sont réessayés"""
+        outcomes = [_FakeErrorResponse(503, {'Retry-After': '2'}),
+                    requests.exceptions.ConnectionError('reset'),
+                    _FakeResponse('enfin')]
+
+        def flaky_post(*args, **kwargs):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        monkeypatch.setattr(get_http_session(), 'post', flaky_post)
+        assert cloud_client.query_model('p', 'm1', use_cache=False) == 'enfin'
+        assert sleeps[0] == 2.0
+        assert len(sleeps) == 2
+        assert cloud_client.breaker('m1').state == 'closed'
+        telemetry = cloud_client.get_telemetry()['m1']
+        assert telemetry['errors'] == {'http_503': 1, 'connection': 1}
+        assert telemetry['successes'] == 1
+        assert telemetry['ttfb_ms']['p50'] == 5.0
+
+    def test_client_errors_are_not_retried(self, cloud_client, monkeypatch, sleeps):
+        """Test qu'un 401 échoue sans nouvel essai"""
+        calls = []
+
+        def unauthorized(*args, **kwargs):
+            calls.append(1)
+            return _FakeErrorResponse(401)
+
+        monkeypatch.setattr(get_http_session(), 'post', unauthorized)
+        assert cloud_client.query_model('p', 'm1', use_cache=False) == ''
+        assert len(calls) == 1
+        assert sleeps == []
+
+    def test_open_breaker_fails_fast(self, cloud_client, monkeypatch, sleeps):
+        """Test qu'après 3 timeouts le modèle n'est plus appelé"""
+        calls = []
+
+        def timeout(*args, **kwargs):
+            calls.append(1)
+            raise requests.exceptions.Timeout()
+
+        monkeypatch.setattr(get_http_session(), 'post', timeout)
+        for n in range(5):
+            assert cloud_client.query_model(f'p{n}', 'm1', use_cache=False) == ''
+        assert len(calls) == 3
+        assert cloud_client.get_telemetry()['m1']['errors'] == {'timeout': 3, 'breaker_open': 2}
+        stats = cloud_client.get_breaker_stats()['m1']
+        assert stats['state'] == 'open'
+        assert stats['rejected'] == 2
+        # Les autres modèles ne sont pas affectés
+        assert cloud_client.breaker('m2').allow()
+
+
+class TestProviderRouting:
+    """Tests du routage de LLMClient à travers le pool d'endpoints"""
+
+    def test_failed_attempt_is_retried_on_another_endpoint(self, cloud_client, monkeypatch):
+        """Test qu'une erreur de connexion sur un nœud est réessayée sur l'autre"""
+        import json as _json
+        monkeypatch.setenv('OLLAMA_PROVIDERS', _json.dumps(
+            {'m1': [{'url': 'http://down/api', 'weight': 5},
+                    {'url': 'http://up/api', 'model': 'qwen-local'}]}))
+        monkeypatch.setattr(llm_module.time, 'sleep', lambda s: None)
+        client = LLMClient()
+        calls = []
+
+        def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+            calls.append((url, json['model'], 'Authorization' in headers))
+            if url.startswith('http://down'):
+                raise requests.exceptions.ConnectionError('refused')
+            return _FakeResponse('ok')
+
+        monkeypatch.setattr(get_http_session(), 'post', fake_post)
+        assert client.query_model('p', 'm1', use_cache=False) == 'ok'
+        assert calls == [('http://down/api/chat', 'm1', False),
+                         ('http://up/api/chat', 'qwen-local', False)]
+        stats = client.get_provider_stats()
+        assert stats['node-1']['errors'] == 1
+        assert stats['node-2']['outstanding'] == 0
+        assert not any('http' in label for label in stats)
+
+
+class TestStreamingGeneration:
+    """Tests de la génération en streaming (NDJSON)"""
+
+    PIECES = ['La MA', 'IF devance A', 'XA.\n```json\n{"classement": ',
+              '{"MAIF": 1, "AXA": 2}}\n```', '\nSuite jamais lue', ' par personne.']
+
+    def test_stream_sends_stream_option_and_joins_chunks(self, cloud_client, monkeypatch):
+        """Test que les morceaux sont transmis au fil de l'eau puis concaténés"""
+        sent, seen = [], []
+        fake = _FakeStreamResponse(['Bon', 'jour'])
+
+        def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+            sent.append((json['stream'], stream))
+            return fake
+
+        monkeypatch.setattr(get_http_session(), 'post', fake_post)
+        text = cloud_client.query_model_stream('p', 'm1', on_chunk=seen.append, use_cache=False)
+        assert text == 'Bonjour'
+        assert seen == ['Bon', 'jour']
+        assert sent == [(True, True)]
+        assert fake.closed
+
+    def test_stops_once_json_block_closed(self, cloud_client, monkeypatch):
+        """Test que la génération est coupée après le bloc JSON et les mentions émises"""
+        from services.analyzer import BrandAnalyzer
+        fake = _FakeStreamResponse(self.PIECES)
+        monkeypatch.setattr(get_http_session(), 'post', lambda *a, **k: fake)
+        monkeypatch.setattr(cloud_client, 'models', ['m1'])
+        mentions = []
+        results = cloud_client.query_all_models_for_prompt_stream(
+            'p', make_extractor=BrandAnalyzer(brands=['MAIF', 'AXA']).stream_extractor,
+            on_mention=lambda model, brand: mentions.append((model, brand)))
+        assert mentions == [('m1', 'MAIF'), ('m1', 'AXA')]
+        assert fake.read == 4
+        assert results['m1'].endswith('```')
+
+
+class TestStreamCoalescing:
+    """Tests du single-flight sur le chemin streaming"""
+
+    def test_identical_streams_are_coalesced_and_replayed(self, cloud_client, monkeypatch):
+        """Test que deux flux identiques simultanés ne font qu'un appel et que le suiveur reçoit le texte"""
+        import threading
+        import time
+        calls = []
+
+        def slow_post(*args, **kwargs):
+            calls.append(1)
+            time.sleep(0.05)
+            return _FakeStreamResponse(['Bon', 'jour'])
+
+        monkeypatch.setattr(get_http_session(), 'post', slow_post)
+        chunks = {0: [], 1: []}
+        results = {}
+
+        def _run(idx):
+            results[idx] = cloud_client.query_model_stream('p', 'm1', use_cache=False,
+                                                           on_chunk=chunks[idx].append)
+
+        threads = [threading.Thread(target=_run, args=(idx,)) for idx in (0, 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == {0: 'Bonjour', 1: 'Bonjour'}
+        assert sorted(''.join(parts) for parts in chunks.values()) == ['Bonjour', 'Bonjour']
+        assert len(calls) == 1
+        assert cloud_client.get_coalesce_stats()['coalesced'] == 1
+
+
+class TestGenerationBudget:
+    """Tests du budget de génération par projet"""
+
+    def test_budget_in_payload_and_usage_in_matrix(self, cloud_client, monkeypatch):
+        """Test que num_predict/num_ctx/keep_alive partent à Ollama et que l'usage revient"""
+        payloads = []
+
+        def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+            payloads.append(json)
+            return _FakeResponse('ok', {'prompt_eval_count': 40, 'eval_count': 90})
+
+        monkeypatch.setattr(get_http_session(), 'post', fake_post)
+        generation = {'num_predict': 500, 'keep_alive': '7h', 'models': {'m2': {'num_ctx': 8192}}}
+        matrix = cloud_client.query_matrix(['p1'], use_cache=False, generation=generation)
+
+        by_model = {payload['model']: payload for payload in payloads}
+        assert by_model['m1']['options'] == {'num_predict': 500}
+        assert by_model['m2']['options'] == {'num_predict': 500, 'num_ctx': 8192}
+        assert by_model['m1']['keep_alive'] == '7h'
+        assert matrix['p1']['m1']['usage'] == {'prompt_eval_count': 40, 'eval_count': 90}
+        assert cloud_client.get_telemetry()['m1']['output_tokens_avg'] == 90
+
+    def test_budget_is_part_of_the_cache_key(self, cloud_client, monkeypatch):
+        """Test qu'une réponse tronquée à 50 tokens ne sert pas un budget plus large"""
+        answers = iter(['courte', 'longue'])
+        monkeypatch.setattr(get_http_session(), 'post',
+                            lambda *args, **kwargs: _FakeResponse(next(answers)))
+        assert cloud_client.query_model('p', 'm1', generation={'num_predict': 50}) == 'courte'
+        assert cloud_client.query_model('p', 'm1', generation={'num_predict': 900}) == 'longue'
+        assert cloud_client.query_model('p', 'm1', generation={'num_predict': 50,
+                                                                'keep_alive': '1h'}) == 'courte'
+
+
+class TestQueryMatrix:
+    """Tests de la matrice prompts × modèles"""
+
+    def test_real_response_per_cell_with_latency_and_error(self, cloud_client, monkeypatch):
+        """Test que chaque modèle a sa propre réponse et sa cause d'échec"""
+        def fake_post(url, headers=None, json=None, timeout=None, stream=False):
+            if json['model'] == 'm2':
+                raise requests.exceptions.Timeout()
+            return _FakeResponse(f"{json['model']}:{json['messages'][-1]['content']}")
+
+        monkeypatch.setattr(get_http_session(), 'post', fake_post)
+        matrix = cloud_client.query_matrix(['p1', 'p2'], use_cache=False)
+        assert list(matrix) == ['p1', 'p2']
+        assert matrix['p2']['m1']['response'] == 'm1:p2'
+        assert matrix['p2']['m1']['error'] is None
+        assert matrix['p1']['m2'] == {'response': '', 'error': 'timeout', 'usage': None,
+                                      'latency_ms': matrix['p1']['m2']['latency_ms']}
+        assert matrix['p1']['m2']['latency_ms'] >= 0
+
+    def test_global_and_per_model_limits(self, cloud_client, monkeypatch):
+        """Test que les plafonds global et par modèle sont respectés"""
+        import threading
+        import time
+        lock = threading.Lock()
+        in_flight = {'total': 0, 'm1': 0, 'm2': 0}
+        peaks = {'total': 0, 'm1': 0, 'm2': 0}
+
+        def slow_post(url, headers=None, json=None, timeout=None, stream=False):
+            model = json['model']
+            with lock:
+                for key in ('total', model):
+                    in_flight[key] += 1
+                    peaks[key] = max(peaks[key], in_flight[key])
+            time.sleep(0.02)
+            with lock:
+                for key in ('total', model):
+                    in_flight[key] -= 1
+            return _FakeResponse('ok')
+
+        monkeypatch.setattr(get_http_session(), 'post', slow_post)
+        prompts = [f'p{n}' for n in range(6)]
+        matrix = cloud_client.query_matrix(prompts, use_cache=False,
+                                           max_concurrency=3, per_model_limit=2)
+        assert all(cell['response'] == 'ok' for row in matrix.values() for cell in row.values())
+        assert peaks['total'] <= 3
+        assert peaks['m1'] <= 2 and peaks['m2'] <= 2
@@ -0,0 +1,218 @@
+"""
+Tests pour le moteur de métriques vectorisé (services/metrics_engine.py)
+"""
+import random
+
+import numpy as np
+import pytest
+from services.analyzer import BrandAnalyzer
+from services.metrics_engine import MetricsCube, _percentile_bounds
+
+
+def _legacy_metrics(brands, all_results):
+    """Implémentation de référence (boucle marque × analyse historique)."""
+    metrics = {}
+    total_prompts = len(all_results)
+    for brand in brands:
+        mentions_count = positions_sum = first_position_count = 0
+        for result in all_results:
+            if brand in result.get('brands_mentioned', []):
+                mentions_count += 1
+                positions_sum += result['positions'].get(brand, 0)
+                if result.get('first_brand') == brand:
+                    first_position_count += 1
+        mention_rate = (mentions_count / total_prompts * 100) if total_prompts > 0 else 0
+        avg_position = (positions_sum / mentions_count) if mentions_count > 0 else 0
+        top_of_mind = (first_position_count / total_prompts * 100) if total_prompts > 0 else 0
+        avg_sentiment = max(100 - (avg_position * 20), -20) if mentions_count > 0 else 0
+        metrics[brand] = {
+            'mention_count': mentions_count,
+            'mention_rate': round(mention_rate, 2),
+            'avg_position': round(avg_position, 2),
+            'top_of_mind': round(top_of_mind, 2),
+            'first_position_count': first_position_count,
+            'sentiment_score': round(avg_sentiment, 1)
+        }
+    total_mentions = sum(m['mention_count'] for m in metrics.values())
+    for brand in metrics:
+        sov = (metrics[brand]['mention_count'] / total_mentions * 100) if total_mentions > 0 else 0
+        metrics[brand]['share_of_voice'] = round(sov, 2)
+    for brand in metrics:
+        m = metrics[brand]
+        score = (m['mention_rate'] * 0.4 +
+                 (100 / m['avg_position'] if m['avg_position'] > 0 else 0) * 0.3 +
+                 m['share_of_voice'] * 0.2 + m['top_of_mind'] * 0.1 +
+                 max(m['sentiment_score'], 0) * 0.1)
+        m['global_score'] = round(score, 2)
+    return metrics
+
+
+def _random_responses(brands, models, prompts=12, seed=7):
+    rng = random.Random(seed)
+    responses = []
+    for i in range(prompts):
+        llm_analyses = {}
+        for model in models:
+            mentioned = [b for b in brands + ['Hors benchmark'] if rng.random() < 0.5]
+            rng.shuffle(mentioned)
+            llm_analyses[model] = {'response': '', 'analysis': {
+                'brands_mentioned': mentioned,
+                'positions': {b: idx + 1 for idx, b in enumerate(mentioned)},
+                'first_brand': mentioned[0] if mentioned else None,
+            }}
+        responses.append({'category': f'cat-{i % 3}', 'prompt': f'p{i}', 'llm_analyses': llm_analyses})
+    return responses
+
+
+class TestMetricsCube:
+    """Tests d'équivalence avec l'ancienne boucle"""
+
+    def test_global_metrics_match_legacy(self, sample_brands):
+        responses = _random_responses(sample_brands, ['m1', 'm2'])
+        analyses = [d['analysis'] for r in responses for d in r['llm_analyses'].values()]
+        cube = MetricsCube.from_responses(responses, sample_brands)
+        assert cube.metrics() == _legacy_metrics(sample_brands, analyses)
+
+    def test_metrics_by_slice_match_legacy(self, sample_brands):
+        responses = _random_responses(sample_brands, ['m1', 'm2', 'm3'])
+        cube = MetricsCube.from_responses(responses, sample_brands)
+
+        by_model = cube.metrics_by('model')
+        assert list(by_model) == ['m1', 'm2', 'm3']
+        for model, metrics in by_model.items():
+            analyses = [r['llm_analyses'][model]['analysis'] for r in responses]
+            assert metrics == _legacy_metrics(sample_brands, analyses)
+
+        by_category = cube.metrics_by('category')
+        for category, metrics in by_category.items():
+            analyses = [d['analysis'] for r in responses if r['category'] == category
+                        for d in r['llm_analyses'].values()]
+            assert metrics == _legacy_metrics(sample_brands, analyses)
+
+    def test_analyzer_by_model_uses_cube(self, sample_brands):
+        responses = _random_responses(sample_brands, ['m1', 'm2'])
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        by_model = analyzer.calculate_metrics_by_model(responses)
+        assert set(by_model) == {'m1', 'm2'}
+        assert all(set(m) == set(sample_brands) for m in by_model.values())
+
+    def test_empty_cube(self, sample_brands):
+        cube = MetricsCube.from_responses([], sample_brands)
+        assert cube.metrics_by('model') == {}
+        assert all(m['mention_count'] == 0 for m in cube.metrics().values())
+
+
+class TestMetricsAccumulator:
+    """Tests pour l'accumulateur incrémental"""
+
+    def test_accumulator_matches_full_recompute(self, sample_brands):
+        responses = _random_responses(sample_brands, ['m1', 'm2'])
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        accumulator = analyzer.accumulator()
+        for response in responses:
+            accumulator.add_many(d['analysis'] for d in response['llm_analyses'].values())
+        analyses = [d['analysis'] for r in responses for d in r['llm_analyses'].values()]
+        assert accumulator.metrics() == analyzer.calculate_metrics(analyses)
+
+    def test_accumulators_are_independent(self, sample_brands):
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        first, second = analyzer.accumulator(), analyzer.accumulator()
+        first.add({'brands_mentioned': ['Tesla'], 'positions': {'Tesla': 1}, 'first_brand': 'Tesla'})
+        assert second.total == 0
+
+
+class TestBootstrapIntervals:
+    """Tests des intervalles de confiance bootstrap"""
+
+    def test_single_resample_matches_explicit_resample(self, sample_brands):
+        """Test qu'un tirage pondéré équivaut au recalcul sur les prompts tirés"""
+        responses = _random_responses(sample_brands, ['m1', 'm2'], prompts=10)
+        cube = MetricsCube.from_responses(responses, sample_brands)
+        report = cube.bootstrap_intervals(n_resamples=1, seed=3)
+
+        draws = np.random.default_rng(3).integers(0, 10, size=(1, 10))[0]
+        weights = np.bincount(draws, minlength=10)
+        drawn = [r for idx, r in enumerate(responses) for _ in range(weights[idx])]
+        m1 = [r['llm_analyses']['m1']['analysis'] for r in drawn]
+        expected = _legacy_metrics(sample_brands, m1)
+        for brand in sample_brands:
+            low, high = report['by_model']['m1'][brand]['mention_rate']
+            assert low == high == pytest.approx(expected[brand]['mention_rate'], abs=0.01)
+            assert report['by_model']['m1'][brand]['avg_position'][0] == pytest.approx(
+                expected[brand]['avg_position'], abs=0.01)
+            # build_metrics arrondit les composantes avant le score global
+            assert report['by_model']['m1'][brand]['global_score'][0] == pytest.approx(
+                expected[brand]['global_score'], abs=0.1)
+
+    def test_intervals_bracket_point_estimate(self, sample_brands):
+        """Test que l'intervalle contient la valeur observée et est reproductible"""
+        responses = _random_responses(sample_brands, ['m1', 'm2', 'm3'], prompts=30)
+        cube = MetricsCube.from_responses(responses, sample_brands)
+        report = cube.bootstrap_intervals()
+        assert report['prompts'] == 30 and report['resamples'] == 1000
+        assert set(report['by_model']) == {'m1', 'm2', 'm3'}
+        overall = cube.metrics()
+        for brand in sample_brands:
+            low, high = report['overall'][brand]['mention_rate']
+            assert low <= overall[brand]['mention_rate'] <= high
+        assert cube.bootstrap_intervals() == report
+
+    def test_bootstrap_speed(self, sample_brands):
+        """Test : 1000 tirages sur 50 prompts × 4 modèles en quelques ms"""
+        import time
+        responses = _random_responses(sample_brands, ['m1', 'm2', 'm3', 'm4'], prompts=50)
+        cube = MetricsCube.from_responses(responses, sample_brands)
+        cube.bootstrap_intervals()
+        start = time.perf_counter()
+        cube.bootstrap_intervals()
+        assert time.perf_counter() - start < 0.05
+
+    def test_full_report_exposes_intervals(self, sample_brands):
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        responses = _random_responses(sample_brands, ['m1', 'm2'])
+        report = analyzer.get_full_confidence_report(responses, main_brand=sample_brands[0])
+        assert set(report['intervals']['by_model']) == {'m1', 'm2'}
+        assert set(report['intervals']['overall']) == set(sample_brands)
+
+    def test_resamples_without_model_rows_are_dropped(self, sample_brands):
+        """Test qu'un tirage sans réponse du modèle ne compte pas comme 0 %"""
+        # m2 n'a répondu qu'à 4 prompts sur 20, toujours en citant la marque
+        responses = _random_responses(sample_brands, ['m1'], prompts=20)
+        for response in responses[:4]:
+            response['llm_analyses']['m2'] = {'analysis': {
+                'brands_mentioned': [sample_brands[0]], 'positions': {sample_brands[0]: 1},
+                'first_brand': sample_brands[0]}}
+        cube = MetricsCube.from_responses(responses, sample_brands)
+
+        report = cube.bootstrap_intervals(n_resamples=200)
+        assert report['by_model']['m2'][sample_brands[0]]['mention_rate'] == [100.0, 100.0]
+        assert report['valid_resamples']['m2'] < 200
+
+        for response in responses[1:4]:
+            response['llm_analyses'].pop('m2')
+        sparse = MetricsCube.from_responses(responses, sample_brands).bootstrap_intervals(n_resamples=200)
+        assert sparse['by_model']['m2'][sample_brands[0]]['mention_rate'] is None
+
+    def test_full_report_resamples_parameter(self, sample_brands):
+        """Test que le nombre de tirages du rapport est réglable (0 = sans intervalles)"""
+        analyzer = BrandAnalyzer(brands=sample_brands)
+        responses = _random_responses(sample_brands, ['m1', 'm2'])
+        assert analyzer.get_full_confidence_report(responses, sample_brands[0],
+                                                   n_resamples=50)['intervals']['resamples'] == 50
+        assert analyzer.get_full_confidence_report(responses, sample_brands[0],
+                                                   n_resamples=0)['intervals'] is None
+
+    def test_percentile_bounds_ignore_nan(self):
+        values = np.random.default_rng(2).random((500, 3))
+        values[::3, 1] = np.nan
+        expected = np.nanpercentile(values, [5, 95], axis=0)
+        assert np.allclose(_percentile_bounds(values, 0.05), expected)
+
+    def test_empty_cube_intervals(self, sample_brands):
+        report = MetricsCube.from_responses([], sample_brands).bootstrap_intervals()
+        assert report['by_model'] == {} and report['overall'] == {}
+
+    def test_percentile_bounds_match_numpy(self):
+        values = np.random.default_rng(1).random((999, 3, 4))
+        expected = np.percentile(values, [2.5, 97.5], axis=0)
+        assert np.allclose(_percentile_bounds(values, 0.025), expected)
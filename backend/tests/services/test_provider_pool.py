@@ -0,0 +1,163 @@
+"""
+Tests du pool de fournisseurs LLM (services/provider_pool.py)
+"""
+import json
+import random
+
+import pytest
+
+from services.provider_pool import OPENAI, Endpoint, ProviderPool
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _pool(config, clock=None, **kwargs):
+    return ProviderPool.from_config(config, 'https://cloud.test/api', 'cloud-key',
+                                    clock=clock or _Clock(), rng=random.Random(0), **kwargs)
+
+
+class TestEndpointDialects:
+    """Tests des formats Ollama et OpenAI"""
+
+    def test_ollama_payload_and_parsing(self):
+        """Test du format Ollama (/chat, message.content, NDJSON)"""
+        endpoint = Endpoint('http://node:11434/api/')
+        assert endpoint.chat_url == 'http://node:11434/api/chat'
+        assert 'Authorization' not in endpoint.headers()
+        assert endpoint.payload('m1', [], {'think': False, 'stream': False})['think'] is False
+        payload = endpoint.payload('m1', [], {'stream': False},
+                                   {'options': {'num_predict': 64}, 'keep_alive': '7h'})
+        assert (payload['options'], payload['keep_alive']) == ({'num_predict': 64}, '7h')
+        assert endpoint.parse_content({'message': {'content': 'ok'}}) == 'ok'
+        assert endpoint.parse_usage({'prompt_eval_count': 3, 'eval_count': 4}) == 7
+        assert endpoint.parse_stream_line(b'{"message": {"content": "a"}, "done": true, '
+                                          b'"prompt_eval_count": 5, "eval_count": 9}') == \
+            ('a', True, {'prompt_eval_count': 5, 'eval_count': 9})
+        with pytest.raises(ValueError):
+            endpoint.parse_stream_line(b'{"error": "model not found"}')
+
+    def test_openai_payload_and_parsing(self):
+        """Test du format compatible OpenAI (/chat/completions, choices, SSE)"""
+        endpoint = Endpoint('http://vllm:8000/v1', OPENAI, 'k')
+        assert endpoint.chat_url == 'http://vllm:8000/v1/chat/completions'
+        assert endpoint.headers()['Authorization'] == 'Bearer k'
+        assert endpoint.payload('m1', [], {'think': False, 'stream': True}) == \
+            {'model': 'm1', 'messages': [], 'stream': True}
+        assert endpoint.parse_content({'choices': [{'message': {'content': 'ok'}}]}) == 'ok'
+        assert endpoint.parse_usage({'usage': {'prompt_tokens': 5, 'completion_tokens': 7}}) == 12
+        assert endpoint.payload('m1', [], {'stream': False}, {'options': {'num_predict': 64}})['max_tokens'] == 64
+        line = 'data: ' + json.dumps({'choices': [{'delta': {'content': 'a'}, 'finish_reason': None}]})
+        assert endpoint.parse_stream_line(line.encode()) == ('a', False, None)
+        assert endpoint.parse_stream_line(b'data: [DONE]') == ('', True, None)
+        assert endpoint.parse_stream_line(b': keep-alive') == ('', False, None)
+
+
+class TestProviderPoolRouting:
+    """Tests du routage par requêtes en vol et poids"""
+
+    def test_default_endpoint_without_config(self):
+        """Test que sans configuration tout part vers OLLAMA_BASE_URL avec la clé"""
+        pool = _pool({})
+        endpoint, model = pool.acquire('m1')
+        assert endpoint is pool.default
+        assert endpoint.api_key == 'cloud-key'
+        assert model == 'm1'
+
+    def test_least_outstanding_weighted(self):
+        """Test que la charge se répartit au prorata des poids"""
+        pool = _pool({'m1': [{'url': 'http://a/api', 'weight': 1},
+                             {'url': 'http://b/api', 'weight': 3}]})
+        picked = [pool.acquire('m1')[0].url for _ in range(8)]
+        assert picked.count('http://b/api') == 6
+        assert picked.count('http://a/api') == 2
+
+    def test_model_alias_and_wildcard(self):
+        """Test du nom de modèle propre au nœud et de l'entrée '*'"""
+        pool = _pool({'m1': [{'url': 'http://gpu/api', 'model': 'qwen2.5:14b'}],
+                      '*': [{'url': 'http://other/api'}]})
+        assert pool.acquire('m1')[1] == 'qwen2.5:14b'
+        endpoint, model = pool.acquire('m2')
+        assert (endpoint.url, model) == ('http://other/api', 'm2')
+        # La clé cloud n'est pas envoyée aux autres nœuds
+        assert endpoint.api_key is None
+
+    def test_shared_endpoint_counts_load_across_models(self):
+        """Test qu'un même nœud partage ses requêtes en vol entre modèles"""
+        pool = _pool({'m1': [{'url': 'http://a/api'}, {'url': 'http://b/api'}],
+                      'm2': [{'url': 'http://a/api'}]})
+        pool.acquire('m2')
+        assert pool.acquire('m1')[0].url == 'http://b/api'
+
+
+class TestProviderPoolEjection:
+    """Tests de l'éjection et de la réadmission"""
+
+    def test_failing_endpoint_is_ejected_then_readmitted(self):
+        """Test qu'un nœud en échec est écarté puis réadmis après le délai"""
+        clock = _Clock()
+        pool = _pool({'m1': [{'url': 'http://a/api'}, {'url': 'http://b/api'}]}, clock=clock,
+                     eject_failures=2, eject_cooldown=10)
+        bad = next(e for e in (pool.acquire('m1')[0], pool.acquire('m1')[0]) if e.url == 'http://a/api')
+        pool.release(bad, ok=False)
+        pool.release(bad, ok=False)
+        assert pool.stats()['node-1']['state'] == 'ejected'
+        assert {pool.acquire('m1')[0].url for _ in range(5)} == {'http://b/api'}
+
+        clock.now = 10
+        assert pool.stats()['node-1']['state'] == 'healthy'
+        assert 'http://a/api' in {pool.acquire('m1')[0].url for _ in range(5)}
+
+    def test_readmitted_endpoint_backs_off_then_recovers(self):
+        """Test que le délai double après une ré-éjection et qu'un succès le remet à zéro"""
+        clock = _Clock()
+        pool = _pool({'m1': [{'url': 'http://a/api'}]}, clock=clock,
+                     eject_failures=1, eject_cooldown=10)
+        endpoint, _ = pool.acquire('m1')
+        pool.release(endpoint, ok=False)
+        assert pool.stats()['node-1']['readmit_in'] == 10
+
+        clock.now = 10
+        pool.acquire('m1')
+        pool.release(endpoint, ok=False)
+        assert pool.stats()['node-1']['readmit_in'] == 20
+
+        clock.now = 30
+        pool.acquire('m1')
+        pool.release(endpoint, ok=True)
+        assert endpoint.ejections == 0
+
+    def test_panic_mode_when_all_ejected(self):
+        """Test que le nœud qui revient le plus tôt sert quand tous sont écartés"""
+        clock = _Clock()
+        pool = _pool({'m1': [{'url': 'http://a/api'}, {'url': 'http://b/api'}]}, clock=clock,
+                     eject_failures=1, eject_cooldown=10)
+        a, _ = pool.acquire('m1')
+        pool.release(a, ok=False)
+        clock.now = 5
+        b, _ = pool.acquire('m1')
+        pool.release(b, ok=False)
+        assert pool.acquire('m1')[0] is a
+
+    def test_from_env_reads_file(self, tmp_path, monkeypatch):
+        """Test de OLLAMA_PROVIDERS=@fichier.json"""
+        path = tmp_path / 'providers.json'
+        path.write_text(json.dumps({'m1': [{'url': 'http://a/api', 'weight': 2}]}))
+        monkeypatch.setenv('OLLAMA_PROVIDERS', f'@{path}')
+        pool = ProviderPool.from_env('https://cloud.test/api', 'k')
+        assert pool.acquire('m1')[0].url == 'http://a/api'
+
+    def test_stats_keyed_by_label_not_url(self):
+        """Test que les statistiques désignent les nœuds par label, jamais par URL"""
+        pool = _pool({'m1': [{'url': 'http://a/api', 'label': 'gpu-1'}, {'url': 'http://b/api'},
+                             {'url': 'https://cloud.test/api'}]})
+        for _ in range(6):
+            pool.acquire('m1')
+        assert set(pool.stats()) == {'default', 'gpu-1', 'node-2'}
+        with pytest.raises(ValueError):
+            _pool({'m1': [{'url': 'http://a/api', 'label': 'x'}, {'url': 'http://b/api', 'label': 'x'}]})
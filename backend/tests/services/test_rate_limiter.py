@@ -0,0 +1,173 @@
+"""
+Tests du limiteur de débit partagé (services/rate_limiter.py)
+"""
+import pytest
+
+from services.rate_limiter import (INTERACTIVE, SCHEDULED, RateLimiter, estimate_tokens)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def make_limiter(tmp_path, clock):
+    def _make(**kwargs):
+        kwargs.setdefault('reserve', 0.25)
+        return RateLimiter(path=str(tmp_path / 'rate.db'), clock=clock, **kwargs)
+    return _make
+
+
+class TestRateLimiter:
+    """Tests des seaux à jetons requêtes/min et tokens/min"""
+
+    def test_requests_per_minute(self, make_limiter, clock):
+        """Test qu'au-delà du quota il faut attendre la recharge"""
+        limiter = make_limiter(requests_per_min=6, tokens_per_min=0)
+        bucket = RateLimiter.bucket_key('key', 'm1')
+        assert all(limiter.reserve_slot(bucket) == 0 for _ in range(6))
+        assert limiter.reserve_slot(bucket) == pytest.approx(10.0)
+        clock.now += 10
+        assert limiter.reserve_slot(bucket) == 0
+
+    def test_scheduled_runs_leave_the_reserve(self, make_limiter):
+        """Test que la réserve reste disponible pour les runs interactifs"""
+        limiter = make_limiter(requests_per_min=4, tokens_per_min=0)
+        bucket = RateLimiter.bucket_key('key', 'm1')
+        granted = [limiter.reserve_slot(bucket, priority=SCHEDULED) == 0 for _ in range(4)]
+        assert granted == [True, True, True, False]
+        assert limiter.reserve_slot(bucket, priority=INTERACTIVE) == 0
+
+    def test_state_is_shared_between_instances(self, make_limiter):
+        """Test que deux process (deux instances, même fichier) partagent le quota"""
+        web, scheduler = make_limiter(requests_per_min=2), make_limiter(requests_per_min=2)
+        bucket = RateLimiter.bucket_key('key', 'm1')
+        assert web.reserve_slot(bucket) == 0
+        assert scheduler.reserve_slot(bucket) == 0
+        assert web.reserve_slot(bucket) > 0
+
+    def test_buckets_are_per_model_and_key(self, make_limiter):
+        limiter = make_limiter(requests_per_min=1)
+        assert limiter.reserve_slot(RateLimiter.bucket_key('key', 'm1')) == 0
+        assert limiter.reserve_slot(RateLimiter.bucket_key('key', 'm2')) == 0
+        assert limiter.reserve_slot(RateLimiter.bucket_key('other', 'm1')) == 0
+        assert 'key' not in RateLimiter.bucket_key('key', 'm1')
+
+    def test_tokens_settled_with_real_usage(self, make_limiter):
+        """Test que l'usage réel corrige l'estimation (dette comprise)"""
+        limiter = make_limiter(tokens_per_min=1000)
+        bucket = RateLimiter.bucket_key('key', 'm1')
+        assert limiter.reserve_slot(bucket, tokens=400) == 0
+        limiter.settle(bucket, estimated=400, actual=900)
+        assert limiter.reserve_slot(bucket, tokens=200) == pytest.approx(6.0)
+
+    def test_drain_after_provider_429(self, make_limiter):
+        limiter = make_limiter(requests_per_min=60)
+        bucket = RateLimiter.bucket_key('key', 'm1')
+        limiter.drain(bucket)
+        assert limiter.reserve_slot(bucket) > 0
+
+    def test_acquire_gives_up_after_max_wait(self, make_limiter, clock):
+        """Test qu'acquire attend la recharge puis abandonne au-delà du plafond"""
+        limiter = make_limiter(requests_per_min=60)
+        bucket = RateLimiter.bucket_key('key', 'm1')
+        limiter.drain(bucket)
+        waits = []
+
+        def fake_sleep(seconds):
+            waits.append(seconds)
+            clock.now += seconds
+
+        assert limiter.acquire(bucket, max_wait=120, sleep=fake_sleep)
+        assert not limiter.acquire(bucket, max_wait=0.1, sleep=fake_sleep)
+        assert limiter.stats()['rejected'] == 1
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens('a' * 40, None, expected_output=10) == 20
+
+
+    def test_locked_database_is_retried_cooperatively(self, make_limiter, monkeypatch, tmp_path):
+        """Test qu'une base verrouillée par un autre process est réessayée par de courtes pauses"""
+        import sqlite3
+        import services.rate_limiter as rate_module
+        limiter = make_limiter(requests_per_min=60)
+        assert limiter.reserve_slot('k:m1') == 0.0
+        other = sqlite3.connect(str(tmp_path / 'rate.db'), isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        pauses = []
+
+        def _sleep(seconds):
+            pauses.append(seconds)
+            other.execute('COMMIT')
+
+        monkeypatch.setattr(rate_module.time, 'sleep', _sleep)
+        assert limiter.reserve_slot('k:m1') == 0.0
+        assert len(pauses) == 1 and pauses[0] < 0.1
+        assert limiter.stats()['errors'] == 0
+
+
+class TestClientRateLimit:
+    """Tests de l'intégration dans LLMClient"""
+
+    def test_rate_limited_call_is_not_sent(self, make_limiter, monkeypatch):
+        """Test qu'un appel sans créneau n'est pas envoyé ni compté comme panne"""
+        from services.llm_client import LLMClient, get_http_session
+        monkeypatch.setenv('OLLAMA_API_KEY', 'test-key')
+        monkeypatch.setenv('OLLAMA_MODELS', 'm1')
+        client = LLMClient()
+        client.rate_limiter = make_limiter(requests_per_min=60)
+        client.rate_limiter.drain(client._rate_bucket('m1'))
+        monkeypatch.setattr(client.rate_limiter, 'acquire',
+                            lambda *args, **kwargs: RateLimiter.acquire(
+                                client.rate_limiter, *args, max_wait=0.0))
+        sent = []
+        monkeypatch.setattr(get_http_session(), 'post', lambda *a, **k: sent.append(1))
+
+        assert client._query('p', 'm1', use_cache=False) == ('', 'rate_limited', None)
+        assert sent == []
+        assert client.breaker('m1').stats()['failures'] == 0
+
+    def test_streamed_usage_is_settled(self, make_limiter, monkeypatch):
+        """Test que l'usage du flux corrige le seau tokens, estimé si le flux est coupé"""
+        import json
+        from services.llm_client import LLMClient, get_http_session
+
+        class _Stream:
+            def __init__(self, chunks):
+                self.chunks = chunks
+
+            def raise_for_status(self):
+                return None
+
+            def iter_lines(self):
+                return (json.dumps(chunk).encode() for chunk in self.chunks)
+
+            def close(self):
+                return None
+
+        monkeypatch.setenv('OLLAMA_API_KEY', 'test-key')
+        monkeypatch.setenv('OLLAMA_MODELS', 'm1')
+        client = LLMClient()
+        client.rate_limiter = make_limiter(tokens_per_min=100_000)
+        settled = []
+        monkeypatch.setattr(client.rate_limiter, 'settle',
+                            lambda bucket, estimated, actual: settled.append(actual))
+        streams = iter([
+            _Stream([{'message': {'content': 'ok'}, 'done': True,
+                      'prompt_eval_count': 30, 'eval_count': 70}]),
+            _Stream([{'message': {'content': 'x' * 400}, 'done': False}]),
+        ])
+        monkeypatch.setattr(get_http_session(), 'post', lambda *a, **k: next(streams))
+
+        client.query_model_stream('p', 'm1', use_cache=False)
+        client.query_model_stream('p', 'm1', use_cache=False, stop_when=lambda: True)
+        assert settled == [100, estimate_tokens('p', 'x' * 400, expected_output=0)]
@@ -0,0 +1,88 @@
+"""
+Tests des retries et du disjoncteur (services/resilience.py)
+"""
+from services.resilience import CircuitBreaker, RetryPolicy, parse_retry_after
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetryPolicy:
+    """Tests du backoff exponentiel avec jitter"""
+
+    def test_backoff_is_exponential_and_capped(self):
+        """Test que le plafond double à chaque tentative jusqu'au max"""
+        policy = RetryPolicy(retries=5, base_delay=0.5, max_delay=3, rng=lambda: 1.0)
+        assert [policy.backoff(n) for n in range(1, 5)] == [0.5, 1.0, 2.0, 3]
+
+    def test_jitter_scales_the_delay(self):
+        policy = RetryPolicy(retries=2, base_delay=1, max_delay=10, rng=lambda: 0.25)
+        assert policy.delay(2) == 0.5
+
+    def test_attempts_exhausted(self):
+        """Test qu'aucune attente n'est proposée après la dernière tentative"""
+        policy = RetryPolicy(retries=1)
+        assert policy.attempts == 2
+        assert policy.delay(2) is None
+
+    def test_retry_after_is_honored_within_cap(self):
+        """Test que Retry-After remplace le backoff, sauf s'il dépasse le plafond"""
+        policy = RetryPolicy(retries=3, max_delay=8, rng=lambda: 0.0)
+        assert policy.delay(1, retry_after=5) == 5
+        assert policy.delay(1, retry_after=60) is None
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after('7') == 7.0
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT',
+                                 now=1445412480.0) == 10.0
+        assert parse_retry_after('bientôt') is None
+        assert parse_retry_after(None) is None
+
+
+class TestCircuitBreaker:
+    """Tests des transitions fermé / ouvert / mi-ouvert"""
+
+    def test_opens_after_threshold(self):
+        """Test que le disjoncteur s'ouvre après N échecs consécutifs"""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30, clock=_Clock())
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.stats()['rejected'] == 1
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, clock=_Clock())
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_allows_a_single_probe(self):
+        """Test qu'après la pause un seul appel d'essai passe"""
+        clock = _Clock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30, clock=clock)
+        breaker.record_failure()
+        clock.now = 31
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_probe_reopens(self):
+        clock = _Clock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30, clock=clock)
+        breaker.record_failure()
+        clock.now = 31
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.retry_in() == 30
@@ -0,0 +1,58 @@
+"""
+Tests du sentiment par marque (lexique fenêtré)
+"""
+from services.analyzer import BrandAnalyzer, normalize_text
+from services.brand_matcher import BrandMatcher
+from services.sentiment import (DEFAULT_LEXICON, alert_scale, label_score,
+                                polarity_hits, window_scores)
+
+
+class TestWindowedSentiment:
+    """Tests du score par fenêtre autour des occurrences"""
+
+    def test_scan_matches_find(self):
+        """Test que le balayage unique donne le même ordre que find()"""
+        matcher = BrandMatcher(['Generali', 'Generali Vie', 'MAIF'], normalize_text)
+        text = normalize_text("La MAIF est fiable. Generali Vie est lente, Generali aussi.")
+        mentions, occurrences, tokens = matcher.scan(text, DEFAULT_LEXICON)
+        assert mentions == matcher.find(text)
+        assert occurrences['MAIF'] == [1]
+        assert occurrences['Generali'] == [4, 8]
+        assert occurrences['Generali Vie'] == [4]
+        assert (3, 1) in tokens and (7, -1) in tokens
+
+    def test_window_isolates_brands(self):
+        """Test que chaque marque ne voit que les mots proches"""
+        analyzer = BrandAnalyzer(brands=['MAIF', 'AXA'])
+        filler = ' '.join(['texte'] * 20)
+        text = f"MAIF est excellente et fiable. {filler} AXA est lent et cher."
+        result = analyzer.analyze_response(text)
+        assert result['sentiments'] == {'MAIF': 30, 'AXA': -30}
+
+    def test_negation_flips_polarity(self):
+        """Test que « pas fiable » est négatif et « sans problème » positif"""
+        analyzer = BrandAnalyzer(brands=['MAIF', 'AXA'])
+        assert analyzer.calculate_sentiment("MAIF n'est pas fiable", 'MAIF') == -15
+        assert analyzer.calculate_sentiment("AXA rembourse sans problème", 'AXA') == 15
+
+    def test_word_counted_once_per_brand(self):
+        """Test qu'un mot couvert par deux occurrences n'est compté qu'une fois"""
+        occurrences = {'MAIF': [0, 2]}
+        tokens = [(1, 1)]
+        assert window_scores(occurrences, tokens) == {'MAIF': 15}
+        assert polarity_hits([(0, 0), (2, 1)]) == ([2], [-1])
+
+    def test_json_label_overrides_lexicon(self):
+        """Test que le libellé JSON prime sur le lexique"""
+        analyzer = BrandAnalyzer(brands=['MAIF', 'AXA'])
+        text = ('MAIF est excellente. AXA aussi.\n'
+                '{"mentions": ["MAIF", "AXA"], "sentiments": {"MAIF": "Négatif"}}')
+        result = analyzer.analyze_response(text)
+        assert result['sentiments'] == {'MAIF': -60, 'AXA': 15}
+
+    def test_scales(self):
+        """Test des conversions de libellés et d'échelle"""
+        assert label_score('très positif', normalize_text) == 90
+        assert label_score('inconnu', normalize_text) is None
+        assert alert_scale(-100) == 0
+        assert alert_scale(-40) == 30
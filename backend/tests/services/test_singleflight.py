@@ -0,0 +1,89 @@
+"""
+Tests de la coalescence de requêtes (services/singleflight.py)
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight:
+    """Tests de la version bloquante (threads / greenlets)"""
+
+    def test_concurrent_callers_share_one_execution(self):
+        """Test que 8 appels concurrents n'exécutent la fonction qu'une fois"""
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return 'réponse'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do('k', slow)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(flights.do('k', slow)))
+                     for _ in range(7)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in results) == [False] + [True] * 7
+        assert {value for value, _ in results} == {'réponse'}
+        assert flights.stats() == {'executions': 1, 'coalesced': 7, 'in_flight': 0}
+
+    def test_errors_propagate_and_key_is_released(self):
+        """Test que l'erreur du meneur est relancée puis la clé libérée"""
+        flights = SingleFlight()
+
+        def boom():
+            raise ValueError('fournisseur indisponible')
+
+        with pytest.raises(ValueError):
+            flights.do('k', boom)
+        assert flights.do('k', lambda: 'ok') == ('ok', False)
+
+
+class TestAsyncSingleFlight:
+    """Tests de la version asyncio"""
+
+    def test_concurrent_coroutines_share_one_execution(self):
+        """Test que des coroutines concurrentes partagent la même requête"""
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'réponse'
+
+        async def main():
+            return await asyncio.gather(*(flights.do('k', fetch) for _ in range(5)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert [shared for _, shared in results].count(False) == 1
+        assert flights.stats()['coalesced'] == 4
+
+    def test_async_errors_propagate(self):
+        flights = AsyncSingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0)
+            raise RuntimeError('x')
+
+        async def main():
+            return await asyncio.gather(*(flights.do('k', boom) for _ in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(main())
+        assert all(isinstance(r, RuntimeError) for r in results)
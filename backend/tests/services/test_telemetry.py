@@ -0,0 +1,94 @@
+"""
+Tests de la télémétrie LLM (services/telemetry.py)
+"""
+from services.telemetry import LLMTelemetry, percentile
+
+
+class TestPercentile:
+    """Tests du percentile par rang le plus proche"""
+
+    def test_empty_list_returns_none(self):
+        """Test qu'une liste vide n'a pas de percentile"""
+        assert percentile([], 50) is None
+
+    def test_nearest_rank(self):
+        """Test des rangs sur 1..100"""
+        values = [float(n) for n in range(1, 101)]
+        assert percentile(values, 50) == 50.0
+        assert percentile(values, 90) == 90.0
+        assert percentile(values, 99) == 99.0
+        assert percentile(values, 100) == 100.0
+
+
+class TestLLMTelemetry:
+    """Tests des compteurs et du résumé par modèle"""
+
+    def test_summary_percentiles_and_throughput(self):
+        """Test des latences, du premier octet et du débit"""
+        telemetry = LLMTelemetry()
+        for n in range(1, 11):
+            telemetry.record_success('m1', n / 10, ttfb=n / 100, chars=100)
+        entry = telemetry.summary()['m1']
+
+        assert entry['samples'] == 10
+        assert entry['latency_ms'] == {'p50': 500.0, 'p90': 900.0, 'p99': 1000.0}
+        assert entry['ttfb_ms']['p50'] == 50.0
+        # 1000 caractères en 5.5 s
+        assert entry['chars_per_sec'] == 181.8
+        assert 'suggested_timeout_s' not in entry
+
+    def test_errors_and_timeout_rate(self):
+        """Test du taux de timeout et du détail des erreurs"""
+        telemetry = LLMTelemetry()
+        telemetry.record_success('m1', 1.0)
+        telemetry.record_error('m1', 'timeout')
+        telemetry.record_error('m1', 'http_503')
+        telemetry.record_error('m1', 'timeout')
+        entry = telemetry.summary()['m1']
+
+        assert entry['requests'] == 4
+        assert entry['successes'] == 1
+        assert entry['timeouts'] == 2
+        assert entry['timeout_rate'] == 50.0
+        assert entry['errors'] == {'timeout': 2, 'http_503': 1}
+
+    def test_cache_hit_rate(self):
+        """Test du taux de hit cache"""
+        telemetry = LLMTelemetry()
+        for hit in (True, True, True, False):
+            telemetry.record_cache('m1', hit)
+        assert telemetry.summary()['m1']['cache_hit_rate'] == 75.0
+
+    def test_window_keeps_latest_samples(self):
+        """Test que la fenêtre circulaire oublie les anciens appels"""
+        telemetry = LLMTelemetry(window=5)
+        for n in range(10):
+            telemetry.record_success('m1', float(n))
+        entry = telemetry.summary()['m1']
+        assert entry['samples'] == 5
+        assert entry['requests'] == 10
+        assert entry['latency_ms']['p50'] == 7000.0
+
+    def test_suggested_timeout_needs_enough_samples(self):
+        """Test du timeout suggéré (p99 × 1.5) à partir de 20 appels"""
+        telemetry = LLMTelemetry()
+        for _ in range(19):
+            telemetry.record_success('m1', 10.0)
+        assert telemetry.summary(timeout=40)['m1']['suggested_timeout_s'] is None
+
+        telemetry.record_success('m1', 12.0)
+        entry = telemetry.summary(timeout=40)['m1']
+        assert entry['timeout_s'] == 40
+        assert entry['suggested_timeout_s'] == 18
+
+    def test_models_are_independent(self):
+        """Test que chaque modèle a ses propres compteurs"""
+        telemetry = LLMTelemetry()
+        telemetry.record_success('m1', 1.0)
+        telemetry.record_error('m2', 'connection')
+        summary = telemetry.summary()
+        assert summary['m1']['errors'] == {}
+        assert summary['m2']['successes'] == 0
+
+        telemetry.reset()
+        assert telemetry.summary() == {}
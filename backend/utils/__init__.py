@@ -1,4 +1,5 @@
 # utils - Re-exports
 from utils.prompts import build_geo_prompt, GEO_SYSTEM_PROMPT, generate_benchmark_prompt
+from utils.json_blocks import extract_json_block
 
-__all__ = ['build_geo_prompt', 'GEO_SYSTEM_PROMPT', 'generate_benchmark_prompt']
+__all__ = ['build_geo_prompt', 'GEO_SYSTEM_PROMPT', 'generate_benchmark_prompt', 'extract_json_block']
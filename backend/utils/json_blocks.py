@@ -0,0 +1,176 @@
+"""
+Détection du bloc JSON dans une réponse LLM — une seule passe linéaire.
+
+Remplace les regex paresseuses `[\\s\\S]*?` (backtracking quadratique sur les
+réponses à nombreux blocs ```) et le repli `rfind('{')` qui ne savait pas
+lire un JSON imbriqué. Le scanner équilibre les accolades en tenant compte
+des chaînes JSON et des blocs ``` ; il peut être alimenté morceau par
+morceau (génération en streaming).
+"""
+import json
+import re
+from typing import Dict, Optional, Tuple
+
+# Seuls ces caractères changent l'état du scanner : le reste est sauté en C.
+_TOKEN_RE = re.compile(r'`{3,}|[{}"\\]')
+# Un objet JSON commence forcément par `{"` ou `{}` : filtre avant json.loads
+_OBJECT_START_RE = re.compile(r'\{\s*["}]')
+
+# Candidats, par priorité décroissante
+JSON_FENCE, PLAIN_FENCE, BARE = 'json', 'fence', 'bare'
+
+
+class JsonBlockScanner:
+    """
+    Scanner incrémental de blocs JSON.
+
+    Priorité identique à l'ancien extracteur :
+      1. le premier bloc ```json dont le contenu est un objet `{…}` valide ;
+      2. sinon le premier bloc ``` sans langage qui en contient un ;
+      3. sinon le dernier objet `{…}` valide hors bloc.
+    Les blocs d'un autre langage (```python…) ne sont jamais retenus. La
+    narration est le texte qui précède le bloc retenu (la clôture ```
+    d'ouverture comprise le cas échéant).
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._in_fence = False
+        self._fence_start = -1
+        self._fence_end = -1
+        self._depth = 0
+        self._obj_start = -1
+        self._obj_kind: Optional[str] = None
+        self._in_string = False
+        self._escaped_pos = -1
+        self._found: Dict[str, Tuple[int, dict]] = {}
+
+    @property
+    def closed(self) -> bool:
+        """
+        Vrai dès qu'un bloc ```json valide a été entièrement reçu : rien
+        de ce qui suit ne peut plus le remplacer.
+        """
+        return JSON_FENCE in self._found
+
+    @property
+    def in_block(self) -> bool:
+        """Vrai pendant un bloc ``` ou un objet `{…}` en cours de lecture."""
+        return self._in_fence or self._depth > 0
+
+    @property
+    def block_start(self) -> int:
+        """Offset du bloc en cours ou retenu (clôture ``` comprise), -1 sinon."""
+        if self._in_fence:
+            return self._fence_start
+        if self._depth:
+            return self._obj_start
+        found = self._best()
+        return found[0] if found else -1
+
+    def feed(self, chunk: str, final: bool = False) -> 'JsonBlockScanner':
+        self.text += chunk or ''
+        end = len(self.text)
+        if not final:
+            # Une suite de ` en fin de morceau peut encore devenir une clôture
+            # ```, et un `{` final ne dit pas encore s'il ouvre un objet JSON
+            end = len(self.text.rstrip('`'))
+            tail = self.text[:end].rstrip()
+            if tail.endswith('{'):
+                end = len(tail) - 1
+        self._scan(end)
+        return self
+
+    def _scan(self, end: int) -> None:
+        text = self.text
+        for match in _TOKEN_RE.finditer(text, self._pos, end):
+            pos = match.start()
+            token = match.group()
+
+            if self._in_string:
+                if pos == self._escaped_pos:
+                    continue
+                if token == '\\':
+                    self._escaped_pos = pos + 1
+                elif token == '"':
+                    self._in_string = False
+                continue
+
+            if token[0] == '`':
+                # Objet jamais refermé avant la clôture : on l'abandonne
+                self._depth = 0
+                self._in_fence = not self._in_fence
+                self._fence_start = pos if self._in_fence else -1
+                self._fence_end = match.end() if self._in_fence else -1
+            elif token == '{':
+                is_start = _OBJECT_START_RE.match(text, pos) is not None
+                if not self._depth and not is_start:
+                    # `{environ …}` dans la narration : jamais du JSON
+                    continue
+                if not self._depth or (is_start and self._restarts_object(pos)):
+                    self._obj_start = pos
+                    self._obj_kind = self._object_kind(pos)
+                    self._depth = 0
+                self._depth += 1
+            elif token == '}':
+                if self._depth:
+                    self._depth -= 1
+                    if not self._depth:
+                        self._close_object(pos + 1)
+            elif token == '"' and self._depth:
+                self._in_string = True
+        self._pos = max(self._pos, end)
+
+    def _restarts_object(self, pos: int) -> bool:
+        """
+        Hors bloc ```, un `{"` en début de ligne ouvre un nouveau candidat :
+        l'objet précédent, resté déséquilibré, est abandonné.
+        """
+        return not self._in_fence and pos > 0 and self.text[pos - 1] == '\n'
+
+    def _object_kind(self, pos: int) -> Optional[str]:
+        """Type de candidat d'un objet qui commence en `pos`, None s'il est exclu."""
+        if not self._in_fence:
+            return BARE
+        # L'objet doit ouvrir le bloc : seul le langage peut le précéder
+        info = self.text[self._fence_end:pos].strip().lower()
+        if not info:
+            return PLAIN_FENCE
+        return JSON_FENCE if info == 'json' else None
+
+    def _close_object(self, end: int) -> None:
+        kind = self._obj_kind
+        if kind is None or (kind != BARE and kind in self._found):
+            return
+        try:
+            data = json.loads(self.text[self._obj_start:end])
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        self._found[kind] = (self._fence_start if kind != BARE else self._obj_start, data)
+
+    def _best(self) -> Optional[Tuple[int, dict]]:
+        for kind in (JSON_FENCE, PLAIN_FENCE, BARE):
+            if kind in self._found:
+                return self._found[kind]
+        return None
+
+    def result(self) -> Tuple[str, Optional[dict]]:
+        """Retourne (narrative, json_data) ; json_data vaut None si aucun bloc."""
+        found = self._best()
+        if found is None:
+            return self.text, None
+        start, data = found
+        return self.text[:start].strip(), data
+
+
+def extract_json_block(text: str) -> Tuple[str, Optional[dict]]:
+    """
+    Extrait le bloc JSON d'une réponse LLM en une passe.
+    Retourne (narrative, json_data) — (text, None) si aucun JSON valide.
+    """
+    if not text:
+        return text, None
+    return JsonBlockScanner().feed(text, final=True).result()